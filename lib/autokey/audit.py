@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Offline audit of a phrase and script library for conflicting triggers.
+
+Loads the given folders, or those of the user's configuration, without starting
+AutoKey and reports duplicate abbreviations and hotkeys as well as abbreviations
+shadowed by others. Exits with status 1 if any conflict is found, so it can be run
+on a shared library in CI.
+
+Usage: python -m autokey.audit [options] [FOLDER...]
+"""
+
+import glob, json, optparse, sys
+
+from . import conflicts
+from .configmanager import *
+
+
+def load_folders(paths=None):
+    """
+    Load the given folders, by default those of the user's configuration.
+
+    @return: tuple of the top level folders and the enabled global hotkeys
+    """
+    globalHotkeys = []
+    if not paths:
+        paths = [path for path in sorted(glob.glob(CONFIG_DEFAULT_FOLDER + "/*")) if os.path.isdir(path)]
+        if os.path.exists(CONFIG_FILE):
+            with open(CONFIG_FILE, 'r') as pFile:
+                data = json.load(pFile)
+            paths += data["folders"]
+            for name in ("configHotkey", "toggleServiceHotkey"):
+                hotkey = GlobalHotkey()
+                hotkey.load_from_serialized(data[name])
+                if hotkey.enabled:
+                    globalHotkeys.append(hotkey)
+
+    # Contents are never needed, only the settings
+    return FolderLoader(lazy=True).load(paths), globalHotkeys
+
+
+def audit(folders, globalHotkeys=(), duplicatesOnly=False):
+    """
+    @return: list of the L{conflicts.Conflict}s among the given folders and their contents
+    """
+    found = TriggerSnapshot(folders, globalHotkeys).conflictDetector.audit()
+    if duplicatesOnly:
+        found = [conflict for conflict in found if conflict.kind == conflicts.DUPLICATE]
+    return found
+
+
+def main():
+    p = optparse.OptionParser(usage="python -m autokey.audit [options] [FOLDER...]")
+    p.add_option("--duplicates-only", action="store_true", default=False,
+                 help="Only report exact duplicates, not shadowed abbreviations")
+    p.add_option("--json", action="store_true", default=False, help="Print the conflicts as JSON")
+    options, args = p.parse_args()
+
+    folders, globalHotkeys = load_folders(args)
+    found = audit(folders, globalHotkeys, options.duplicates_only)
+    if options.json:
+        print(json.dumps([conflict.get_serializable() for conflict in found], indent=4))
+    else:
+        for conflict in found:
+            print(conflict)
+        print("%d conflicts" % len(found))
+
+    sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Offline benchmark of the keystroke matching in L{service.Service}.
+
+Keystrokes are replayed straight into C{Service.handle_keypress}, without an X
+server: output is recorded by a mock mediator instead of being sent, and the
+configuration is either generated or loaded as usual but never persisted.
+
+A trace is a file with one JSON array per line, holding the arguments of
+C{handle_keypress}: C{[rawKey, modifiers, key, windowTitle, windowClass]}.
+
+Usage: python -m autokey.benchmark [options]
+"""
+
+import gettext, json, logging, optparse, random, string, threading
+
+# Normally done by the GTK and Qt launchers; the service pulls in the macros, whose
+# titles are translated, and the X interface, which picks the toolkit of the clipboard
+gettext.install("autokey")
+from . import common
+common.USING_QT = common.USING_QT5 = False
+
+# configmanager first: model and configmanager import each other
+from .configmanager import *
+from . import latency, model
+from .service import Service
+
+_logger = logging.getLogger("benchmark")
+
+MODIFIER_CHOICES = [["<ctrl>"], ["<alt>"], ["<super>"], ["<alt>", "<ctrl>"], ["<ctrl>", "<shift>"]]
+HOTKEY_CHOICES = list(string.ascii_lowercase + string.digits) + ["<f%d>" % i for i in range(1, 13)]
+WINDOW_TITLES = ["Terminal", "Mozilla Firefox", "notes.txt - gedit", "Inbox - Thunderbird"]
+WINDOW_CLASSES = ["gnome-terminal-server.Gnome-terminal", "Navigator.Firefox", "gedit.Gedit",
+                  "Mail.Thunderbird"]
+
+
+class RecordingInterface:
+    """
+    Stands in for the X interface, recording what would have been sent.
+    """
+
+    def __init__(self, output):
+        self.output = output
+
+    def begin_send(self):
+        pass
+
+    def finish_send(self, *stamps):
+        pass
+
+    def send_string(self, string):
+        self.output.append(("string", string))
+
+    def send_key(self, keyName):
+        self.output.append(("key", keyName))
+
+    def send_modified_key(self, keyName, modifiers):
+        self.output.append(("key", keyName, modifiers))
+
+    def send_string_clipboard(self, string, pasteCommand):
+        self.output.append(("paste", string, pasteCommand))
+
+
+class RecordingMediator:
+    """
+    Stands in for the L{iomediator.IoMediator}, recording what would have been sent.
+    """
+
+    def __init__(self):
+        self.output = []
+        self.interface = RecordingInterface(self.output)
+
+    def send_string(self, string):
+        if len(string) > 0:
+            self.output.append(("string", string))
+
+    def paste_string(self, string, pasteCommand):
+        if len(string) > 0:
+            self.output.append(("paste", string, pasteCommand))
+
+    def send_backspace(self, count):
+        if count > 0:
+            self.output.append(("backspace", count))
+
+    def remove_string(self, string):
+        self.output.append(("remove", string))
+
+    def send_key(self, keyName):
+        self.output.append(("key", keyName))
+
+
+class RecordingPhraseRunner:
+    """
+    Expands phrases into the mediator synchronously, so their cost is counted
+    with the keystroke that triggered them. Macros are not processed.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.expansions = 0
+
+    def execute(self, phrase, buffer='', keystroke=None):
+        mediator = self.service.mediator
+        expansion = phrase.build_phrase(buffer)
+        mediator.send_backspace(expansion.backspaces)
+        if phrase.sendMode == model.SendMode.KEYBOARD:
+            mediator.send_string(expansion.string)
+        else:
+            mediator.paste_string(expansion.string, phrase.sendMode)
+        self.expansions += 1
+
+    def can_undo(self):
+        return False
+
+    def clear_last(self):
+        pass
+
+    def undo_expansion(self):
+        pass
+
+
+class RecordingScriptRunner:
+    """
+    Records triggered scripts without running their code.
+    """
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, script, buffer=''):
+        self.executed.append((script, buffer))
+
+
+class BenchmarkMonitor:
+
+    def has_watch(self, path):
+        return True
+
+    def add_watch(self, path, rec=False):
+        pass
+
+    def remove_watch(self, path):
+        pass
+
+
+class BenchmarkApp:
+    """
+    Stands in for the GTK/Qt application object.
+    """
+
+    def __init__(self):
+        self.monitor = BenchmarkMonitor()
+        self.configManager = None
+        self.menus = 0
+
+    def show_popup_menu(self, folders=[], items=[], onDesktop=True, title=None):
+        self.menus += 1
+
+    def hide_menu(self):
+        pass
+
+    def notify_error(self, message):
+        _logger.error(message)
+
+
+class BenchmarkConfigManager(ConfigManager):
+    """
+    Configuration manager holding the given folders, without reading or writing
+    any files.
+    """
+
+    def __init__(self, app, folders):
+        self.VERSION = self.__class__.CLASS_VERSION
+        self.lock = threading.Lock()
+        self.triggers = TriggerSnapshot()
+        self.savedConfig = None
+        self.app = app
+        self.folders = folders
+        self.userCodeDir = None
+
+        self.configHotkey = GlobalHotkey()
+        self.configHotkey.set_hotkey(["<super>"], "k")
+        self.configHotkey.enabled = True
+        self.configHotkey.set_closure(lambda: None)
+
+        self.toggleServiceHotkey = GlobalHotkey()
+        self.toggleServiceHotkey.set_hotkey(["<shift>", "<super>"], "k")
+        self.toggleServiceHotkey.enabled = True
+        self.toggleServiceHotkey.set_closure(lambda: None)
+
+        self.config_altered(False)
+
+
+def generate_config(folders=10, phrases=1000, scripts=100, hotkeys=100, filters=50, seed=0):
+    """
+    Build a random folder tree. Phrases and scripts get unique abbreviations, and
+    the given number of them additionally get a hotkey or a window filter.
+
+    @return: tuple of the top level folders and the list of all abbreviations
+    """
+    rand = random.Random(seed)
+    topFolders = []
+    allFolders = []
+    for i in range(max(folders, 1)):
+        folder = model.Folder("Folder %d" % i)
+        if allFolders and rand.random() < 0.5:
+            rand.choice(allFolders).add_folder(folder)
+        else:
+            topFolders.append(folder)
+        allFolders.append(folder)
+
+    abbreviations = set()
+    while len(abbreviations) < phrases + scripts:
+        abbreviations.add(''.join(rand.choice(string.ascii_lowercase) for i in range(rand.randint(2, 6))))
+    abbreviations = sorted(abbreviations)
+    rand.shuffle(abbreviations)
+
+    items = []
+    for i, abbr in enumerate(abbreviations):
+        if i < phrases:
+            item = model.Phrase("Phrase %d" % i, "Expansion of %s" % abbr)
+        else:
+            item = model.Script("Script %d" % i, "pass")
+        item.add_abbreviation(abbr)
+        item.set_modes([model.TriggerMode.ABBREVIATION])
+        rand.choice(allFolders).add_item(item)
+        items.append(item)
+
+    for item in rand.sample(items, min(hotkeys, len(items))):
+        item.set_hotkey(list(rand.choice(MODIFIER_CHOICES)), rand.choice(HOTKEY_CHOICES))
+        item.set_modes([model.TriggerMode.ABBREVIATION, model.TriggerMode.HOTKEY])
+
+    for target in rand.sample(items + allFolders, min(filters, len(items) + len(allFolders))):
+        target.set_window_titles(".*%s.*" % rand.choice(WINDOW_CLASSES).split('.')[1])
+
+    return (topFolders, [item.abbreviations[0] for item in items])
+
+
+def generate_trace(abbreviations, keys=100000, abbreviationRate=0.1, hotkeyRate=0.01, seed=0):
+    """
+    Build a trace of prose-like typing with the given abbreviations mixed in.
+
+    @param abbreviationRate: share of typed words that are abbreviations
+    @param hotkeyRate: share of keystrokes that are hotkey chords
+    """
+    rand = random.Random(seed)
+    trace = []
+    windows = list(zip(WINDOW_TITLES, WINDOW_CLASSES))
+    title, klass = rand.choice(windows)
+
+    while len(trace) < keys:
+        if rand.random() < 0.02:
+            title, klass = rand.choice(windows)
+
+        if rand.random() < hotkeyRate:
+            trace.append([rand.choice(HOTKEY_CHOICES), list(rand.choice(MODIFIER_CHOICES)),
+                          rand.choice(HOTKEY_CHOICES), title, klass])
+            continue
+
+        if abbreviations and rand.random() < abbreviationRate:
+            word = rand.choice(abbreviations)
+        else:
+            word = ''.join(rand.choice(string.ascii_lowercase) for i in range(rand.randint(1, 9)))
+
+        for char in word + rand.choice("     ,."):
+            trace.append([char, [], char, title, klass])
+
+    return trace[:keys]
+
+
+def load_trace(path):
+    """
+    Load a recorded trace, one JSON array of C{handle_keypress} arguments per line.
+    """
+    trace = []
+    with open(path, 'r') as inFile:
+        for line in inFile:
+            line = line.strip()
+            if line:
+                rawKey, modifiers, key, windowTitle, windowClass = json.loads(line)
+                trace.append([rawKey, modifiers, key, windowTitle, windowClass])
+
+    return trace
+
+
+def save_trace(path, trace):
+    with open(path, 'w') as outFile:
+        for keypress in trace:
+            outFile.write(json.dumps(keypress) + '\n')
+
+
+class Benchmark:
+    """
+    Replays traces into a L{Service} running on the given folders.
+    """
+
+    def __init__(self, folders):
+        self.app = BenchmarkApp()
+        self.app.configManager = BenchmarkConfigManager(self.app, folders)
+        self.service = Service(self.app)
+        self.service.mediator = RecordingMediator()
+        self.service.phraseRunner = RecordingPhraseRunner(self.service)
+        self.service.scriptRunner = RecordingScriptRunner()
+        ConfigManager.SETTINGS[SERVICE_RUNNING] = True
+
+    def run(self, trace):
+        """
+        Replay the given trace.
+
+        @return: dictionary of results, latencies in milliseconds
+        """
+        histogram = latency.Histogram()
+        handle_keypress = self.service.handle_keypress
+        now = latency.now
+
+        started = now()
+        for keypress in trace:
+            keyStarted = now()
+            handle_keypress(*keypress)
+            histogram.add(now() - keyStarted)
+        elapsed = now() - started
+
+        results = histogram.get_serializable()
+        results["keysPerSecond"] = len(trace) / elapsed if elapsed > 0 else 0.0
+        results["expansions"] = self.service.phraseRunner.expansions
+        results["scripts"] = len(self.service.scriptRunner.executed)
+        results["menus"] = self.app.menus
+        return results
+
+
+def main():
+    p = optparse.OptionParser(usage="python -m autokey.benchmark [options]")
+    p.add_option("-t", "--trace", help="Replay the trace in FILE instead of a generated one", metavar="FILE")
+    p.add_option("--save-trace", help="Save the replayed trace to FILE", metavar="FILE")
+    p.add_option("--folders", type="int", default=10, help="Number of generated folders")
+    p.add_option("--phrases", type="int", default=1000, help="Number of generated phrases")
+    p.add_option("--scripts", type="int", default=100, help="Number of generated scripts")
+    p.add_option("--hotkeys", type="int", default=100, help="Number of phrases/scripts with a hotkey")
+    p.add_option("--filters", type="int", default=50, help="Number of folders/items with a window filter")
+    p.add_option("--keys", type="int", default=100000, help="Number of generated keystrokes")
+    p.add_option("--seed", type="int", default=0, help="Random seed for the generated data")
+    options, args = p.parse_args()
+
+    folders, abbreviations = generate_config(options.folders, options.phrases, options.scripts,
+                                             options.hotkeys, options.filters, options.seed)
+    if options.trace:
+        trace = load_trace(options.trace)
+    else:
+        trace = generate_trace(abbreviations, options.keys, seed=options.seed)
+    if options.save_trace:
+        save_trace(options.save_trace, trace)
+
+    results = Benchmark(folders).run(trace)
+    print("%d keystrokes, %.0f keys/s" % (len(trace), results["keysPerSecond"]))
+    print("per-key latency (ms): mean %.4f, p50 %.4f, p95 %.4f, p99 %.4f, max %.4f" % (
+        results["mean"], results["p50"], results["p95"], results["p99"], results["max"]))
+    print("%d expansions, %d scripts, %d menus" % (results["expansions"], results["scripts"], results["menus"]))
+
+
+if __name__ == "__main__":
+    main()
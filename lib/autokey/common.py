@@ -21,6 +21,9 @@ import os, dbus.service
 CONFIG_DIR = os.path.join(os.environ.get('XDG_CONFIG_HOME', os.path.expanduser('~/.config')), "autokey")
 LOCK_FILE = CONFIG_DIR + "/autokey.pid"
 LOG_FILE = CONFIG_DIR + "/autokey.log"
+LATENCY_FILE = CONFIG_DIR + "/latency.json"
+USAGE_FILE = CONFIG_DIR + "/usage.log"
+STORE_FILE = CONFIG_DIR + "/store.db"
 MAX_LOG_SIZE = 5 * 1024 * 1024 # 5 megabytes
 MAX_LOG_COUNT = 3
 LOG_FORMAT = "%(asctime)s %(levelname)s - %(name)s - %(message)s"
@@ -46,6 +49,7 @@ ICON_FILE_NOTIFICATION_DARK = "autokey-status-dark"
 ICON_FILE_NOTIFICATION_ERROR = "autokey-status-error"
 
 USING_QT = False
+USING_QT5 = False
 
 class AppService(dbus.service.Object):
 
@@ -69,3 +73,11 @@ class AppService(dbus.service.Object):
     @dbus.service.method(dbus_interface='org.autokey.Service', in_signature='s', out_signature='')
     def run_folder(self, name):
         self.app.service.run_folder(name)
+
+    @dbus.service.method(dbus_interface='org.autokey.Service', in_signature='', out_signature='s')
+    def get_latency_stats(self):
+        return self.app.service.get_latency_stats()
+
+    @dbus.service.method(dbus_interface='org.autokey.Service', in_signature='', out_signature='s')
+    def dump_latency_stats(self):
+        return self.app.service.dump_latency_stats()
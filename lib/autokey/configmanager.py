@@ -15,10 +15,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import os, os.path, shutil, logging, pickle, glob, threading, subprocess
+import os, os.path, shutil, logging, pickle, glob, threading, subprocess, collections, copy
 # from . import iomediator, interface, common, monitor
 from . import common, monitor
 from .iomediator_constants import X_RECORD_INTERFACE
+from .triggerindex import AbbreviationIndex, HotkeyTable, PathIndex
+from .conflicts import ConflictDetector
+from .fsevents import WRITE_TRACKER, COALESCE_DELAY
+from .persistence import WRITE_BEHIND, atomic_write, backup_file
+from .usagestats import USAGE_STATS
 
 try:
     import json
@@ -33,6 +38,7 @@ from .common import CONFIG_DIR
 CONFIG_FILE = os.path.join(CONFIG_DIR, "autokey.json")
 CONFIG_DEFAULT_FOLDER = os.path.join(CONFIG_DIR, "data")
 CONFIG_FILE_BACKUP = CONFIG_FILE + '~'
+CONFIG_CACHE_FILE = os.path.join(CONFIG_DIR, "startup.cache")
 
 DEFAULT_ABBR_FOLDER = "Imported Abbreviations"
 RECENT_ENTRIES_FOLDER = "Recently Typed"
@@ -58,6 +64,11 @@ NOTIFICATION_ICON = "notificationIcon"
 WORKAROUND_APP_REGEX = "workAroundApps"
 # Added by Trey Blancher (ectospasm) 2015-09-16
 TRIGGER_BY_INITIAL = "triggerItemByInitial"
+TRACK_LATENCY = "trackLatency"
+LAZY_CONTENT = "lazyContent"
+CONTENT_CACHE_SIZE = "contentCacheSize"
+MONITOR_DELAY = "monitorDelay"
+STORE_DATABASE = "storeDatabase"
 
 SCRIPT_GLOBALS = "scriptGlobals"
 
@@ -87,24 +98,31 @@ def get_config_manager(autoKeyApp, hadError=False):
     return configManager
 
 def save_config(configManager):
+    """
+    Write the global configuration, unless it is unchanged since it was last written.
+
+    The file is replaced atomically, so a crash while saving leaves the previous
+    configuration in place, and the backup is a hard link to the previous file
+    rather than a copy of it.
+    """
     _logger.info("Persisting configuration")
-    configManager.app.monitor.suspend() 
-    # Back up configuration if it exists
-    if os.path.exists(CONFIG_FILE):
-        _logger.info("Backing up existing config file")
-        shutil.copy2(CONFIG_FILE, CONFIG_FILE_BACKUP)
+    text = json.dumps(configManager.get_serializable(), indent=4)
+    # Compared by contents rather than with a dirty flag, as SETTINGS is a plain dict
+    # written to from all over the UIs. Serializing takes well under a millisecond, and
+    # is only done on the write-behind thread.
+    if configManager.savedConfig == hash(text) and os.path.exists(CONFIG_FILE):
+        _logger.info("Configuration unchanged - not saved")
+        return
+
     try:
-        outFile = open(CONFIG_FILE, "w")
-        json.dump(configManager.get_serializable(), outFile, indent=4)
+        # Back up configuration if it exists
+        backup_file(CONFIG_FILE, CONFIG_FILE_BACKUP)
+        atomic_write(CONFIG_FILE, text)
+        configManager.savedConfig = hash(text)
         _logger.info("Finished persisting configuration - no errors")
     except Exception as e:
-        if os.path.exists(CONFIG_FILE_BACKUP):
-            shutil.copy2(CONFIG_FILE_BACKUP, CONFIG_FILE)
-        _logger.exception("Error while saving configuration. Backup has been restored (if found).")
-        raise Exception("Error while saving configuration. Backup has been restored (if found).")
-    finally:
-        outFile.close()
-        configManager.app.monitor.unsuspend() 
+        _logger.exception("Error while saving configuration. The previous configuration was kept.")
+        raise Exception("Error while saving configuration. The previous configuration was kept.")
         
 def apply_settings(settings):
     """
@@ -172,6 +190,7 @@ class ConfigManager:
                 MENU_TAKES_FOCUS : False,
                 SHOW_TRAY_ICON : True,
                 SORT_BY_USAGE_COUNT : True,
+                INPUT_SAVINGS : True,
                 #DETECT_UNWANTED_ABBR : False,
                 PROMPT_TO_SAVE: False,
                 #PREDICTIVE_LENGTH : 5,
@@ -185,6 +204,11 @@ class ConfigManager:
                 NOTIFICATION_ICON : common.ICON_FILE_NOTIFICATION,
                 WORKAROUND_APP_REGEX : ".*VirtualBox.*|krdc.Krdc",
                 TRIGGER_BY_INITIAL : False,
+                TRACK_LATENCY : False,
+                LAZY_CONTENT : False,
+                CONTENT_CACHE_SIZE : 8 * 1024 * 1024,
+                MONITOR_DELAY : COALESCE_DELAY,
+                STORE_DATABASE : True,
                 # TODO - Future functionality
                 #TRACK_RECENT_ENTRY : True,
                 #RECENT_ENTRY_COUNT : 5,
@@ -199,6 +223,8 @@ class ConfigManager:
         """ 
         self.VERSION = self.__class__.CLASS_VERSION
         self.lock = threading.Lock()
+        self.triggers = TriggerSnapshot()
+        self.savedConfig = None
         
         self.app = app
         self.folders = []
@@ -215,6 +241,7 @@ class ConfigManager:
         app.init_global_hotkeys(self)        
         
         self.load_global_config()
+        USAGE_STATS.open(common.USAGE_FILE)
                 
         self.app.monitor.add_watch(CONFIG_DEFAULT_FOLDER)
         self.app.monitor.add_watch(CONFIG_DIR)
@@ -356,18 +383,21 @@ dialog.info_dialog("Window information",
             apply_settings(data["settings"])
             
             self.workAroundApps = re.compile(self.SETTINGS[WORKAROUND_APP_REGEX])
+            CONTENT_CACHE.budget = self.SETTINGS[CONTENT_CACHE_SIZE]
+            self.app.monitor.delay = self.SETTINGS[MONITOR_DELAY]
             
+            folderPaths = []
             for entryPath in glob.glob(CONFIG_DEFAULT_FOLDER + "/*"):
                 if os.path.isdir(entryPath):
                     _logger.debug("Loading folder at '%s'", entryPath)
-                    f = Folder("", path=entryPath)
-                    f.load(None)
-                    self.folders.append(f)
+                    folderPaths.append(entryPath)
 
-            for folderPath in data["folders"]:
-                f = Folder("", path=folderPath)
-                f.load()
-                self.folders.append(f)
+            folderPaths += data["folders"]
+            # Only folders that changed since the last start are read from disk
+            lazy = self.SETTINGS[LAZY_CONTENT]
+            cache = StartupCache(CONFIG_CACHE_FILE, lazy)
+            cache.load()
+            self.folders += FolderLoader(cache=cache, lazy=lazy).load(folderPaths)
 
             self.toggleServiceHotkey.load_from_serialized(data["toggleServiceHotkey"])
             self.configHotkey.load_from_serialized(data["configHotkey"])
@@ -378,50 +408,89 @@ dialog.info_dialog("Window information",
             self.config_altered(False)
             _logger.info("Successfully loaded configuration")
             
-    def __checkExisting(self, path):
+    def __checkExisting(self, path, changes):
         # Check if we already know about the path, and return object if found
-        for item in self.allItems:
-            if item.path == path:
-                return item
-        
-        return None
+        return changes.paths.item(path)
     
-    def __checkExistingFolder(self, path):
-        for folder in self.allFolders:
-            if folder.path == path:
-                return folder
-        
-        return None
+    def __checkExistingFolder(self, path, changes):
+        return changes.paths.folder(path)
             
+    def paths_changed(self, events):
+        """
+        Called by the file monitor with a batch of coalesced file system events.
+        Every file is reloaded once, and the indexes are updated once for the
+        whole batch.
+
+        @param events: list of (path, removed) tuples
+        @return: whether anything in the configuration changed
+        """
+        # Other files in the top folder, like the store database, are ignored by the
+        # handlers anyway, so events for them alone do not cost a new snapshot
+        events = [(path, removed) for path, removed in events
+                  if path == CONFIG_FILE or os.path.dirname(path) != CONFIG_DIR]
+        if not events:
+            return False
+
+        changed = False
+        reloadGlobal = False
+        self.lock.acquire()
+        try:
+            changes = self.__newChanges()
+            for path, removed in events:
+                if path == CONFIG_FILE:
+                    # Rebuilds everything, so done once the batch was applied
+                    reloadGlobal = not removed
+                elif removed:
+                    changed |= bool(self.__pathRemoved(path, changes))
+                else:
+                    changed |= bool(self.__pathCreatedOrModified(path, changes))
+
+            self.__applyChanges(changes)
+        finally:
+            self.lock.release()
+
+        if reloadGlobal:
+            self.reload_global_config()
+        return changed
+
     def path_created_or_modified(self, path):
+        return self.paths_changed([(path, False)])
+
+    def path_removed(self, path):
+        return self.paths_changed([(path, True)])
+
+    def __pathCreatedOrModified(self, path, changes):
         directory, baseName = os.path.split(path)
         loaded = False
         
-        if path == CONFIG_FILE:
-            self.reload_global_config()
-            
-        elif directory != CONFIG_DIR:  # ignore all other changes in top dir
+        if directory != CONFIG_DIR:  # ignore all other changes in top dir
             
             # --- handle directories added
             
             if os.path.isdir(path):
+                if self.__checkExistingFolder(path, changes) is not None:
+                    # Replaced while the events were coalesced
+                    self.__pathRemoved(path, changes)
+
                 f = Folder("", path=path)
                 
                 if directory == CONFIG_DEFAULT_FOLDER:
                     self.folders.append(f)
                     f.load()
+                    changes.added(f)
                     loaded = True
                 else:
-                    folder = self.__checkExistingFolder(directory)
+                    folder = self.__checkExistingFolder(directory, changes)
                     if folder is not None:
                         f.load(folder)
                         folder.add_folder(f)
+                        changes.added(f)
                         loaded = True
             
             # -- handle txt or py files added or modified
             
             elif os.path.isfile(path):
-                i = self.__checkExisting(path)
+                i = self.__checkExisting(path, changes)
                 isNew = False
                 
                 if i is None:
@@ -432,60 +501,64 @@ dialog.info_dialog("Window information",
                         i = Script("", "", path=path)       
                                  
                 if i is not None:
-                    folder = self.__checkExistingFolder(directory)
+                    folder = self.__checkExistingFolder(directory, changes)
                     if folder is not None:
                         i.load(folder)
-                        if isNew: folder.add_item(i)
+                        if isNew:
+                            folder.add_item(i)
+                            changes.added(i)
+                        else:
+                            changes.changed(i)
                         loaded = True
                         
                 # --- handle changes to folder settings
                             
                 if baseName == ".folder.json":
-                    folder = self.__checkExistingFolder(directory)
+                    folder = self.__checkExistingFolder(directory, changes)
                     if folder is not None:
                         folder.load_from_serialized()
+                        changes.changed(folder)
                         loaded = True
                         
                 # --- handle changes to item settings
                 
                 if baseName.endswith(".json"):
-                    for item in self.allItems:
-                        if item.get_json_path() == path:
-                            item.load_from_serialized()
-                            loaded = True
+                    item = changes.paths.json_owner(path)
+                    if item is not None:
+                        item.load_from_serialized()
+                        changes.changed(item)
+                        loaded = True
                             
             if not loaded:
                 _logger.warn("No action taken for create/update event at %s", path)
-            else:
-                self.config_altered(False)
             return loaded
         
-    def path_removed(self, path):
+    def __pathRemoved(self, path, changes):
         directory, baseName = os.path.split(path)
         deleted = False
         
         if directory == CONFIG_DIR: # ignore all deletions in top dir
             return 
         
-        folder = self.__checkExistingFolder(path)
-        item = self.__checkExisting(path)
+        folder = self.__checkExistingFolder(path, changes)
+        item = self.__checkExisting(path, changes)
         
         if folder is not None:
             if folder.parent is None:
                 self.folders.remove(folder)
             else:
                 folder.parent.remove_folder(folder)
+            changes.removed(folder)
             deleted = True
                 
         elif item is not None:
             item.parent.remove_item(item)
             #item.remove_data()
+            changes.removed(item)
             deleted = True
             
         if not deleted:
             _logger.warn("No action taken for delete event at %s", path)
-        else:
-            self.config_altered(False)
         return deleted
             
     def reload_global_config(self):
@@ -496,17 +569,16 @@ dialog.info_dialog("Window information",
         self.userCodeDir = data["userCodeDir"]
         apply_settings(data["settings"])
         self.workAroundApps = re.compile(self.SETTINGS[WORKAROUND_APP_REGEX])
+        CONTENT_CACHE.budget = self.SETTINGS[CONTENT_CACHE_SIZE]
+        self.app.monitor.delay = self.SETTINGS[MONITOR_DELAY]
         
         existingPaths = []
         for folder in self.folders:
             if folder.parent is None and not folder.path.startswith(CONFIG_DEFAULT_FOLDER):
                 existingPaths.append(folder.path)
 
-        for folderPath in data["folders"]:
-            if folderPath not in existingPaths:             
-                f = Folder("", path=folderPath)
-                f.load()
-                self.folders.append(f)
+        newPaths = [folderPath for folderPath in data["folders"] if folderPath not in existingPaths]
+        self.folders += FolderLoader(lazy=self.SETTINGS[LAZY_CONTENT]).load(newPaths)
 
         self.toggleServiceHotkey.load_from_serialized(data["toggleServiceHotkey"])
         self.configHotkey.load_from_serialized(data["configHotkey"])
@@ -540,71 +612,190 @@ dialog.info_dialog("Window information",
         Called when some element of configuration has been altered, to update
         the lists of phrases/folders. 
         
-        @param persist: save the global configuration at the end of the process
+        The new lists are built into a fresh L{TriggerSnapshot} which is then published
+        with a single assignment, so the keypress handler never waits for a rebuild
+        or for the configuration to be saved.
+
+        This rebuilds everything; when the changed folders or items are known,
+        L{item_added}, L{item_removed} and L{item_changed} are much cheaper.
+        
+        @param persist: save the global configuration, in the background shortly after
         """
         _logger.info("Configuration changed - rebuilding in-memory structures")
         
         self.lock.acquire()
-        # Rebuild root folder list
-        #rootFolders = self.folders
-        #self.folders = []
-        #for folder in rootFolders:
-        #    self.folders.append(folder)
-        
-        self.hotKeyFolders = []
-        self.hotKeys = []
-        
-        self.abbreviations = []
-        
-        self.allFolders = []
-        self.allItems = []
-        
-        for folder in self.folders:
-            if TriggerMode.HOTKEY in folder.modes:
-                self.hotKeyFolders.append(folder)
-            self.allFolders.append(folder)
-            
-            if not self.app.monitor.has_watch(folder.path):
-                self.app.monitor.add_watch(folder.path)
-            
-            self.__processFolder(folder)
-        
-        self.globalHotkeys = []
-        self.globalHotkeys.append(self.configHotkey)
-        self.globalHotkeys.append(self.toggleServiceHotkey)
-        #_logger.debug("Global hotkeys: %s", self.globalHotkeys)
-        
-        #_logger.debug("Hotkey folders: %s", self.hotKeyFolders)
-        #_logger.debug("Hotkey phrases: %s", self.hotKeys)
-        #_logger.debug("Abbreviation phrases: %s", self.abbreviations)
-        #_logger.debug("All folders: %s", self.allFolders)
-        #_logger.debug("All phrases: %s", self.allItems)
-        
-        if persistGlobal:
+        try:
+            WINDOW_FILTER_CACHE.invalidate()
+
+            globalHotkeys = [self.configHotkey, self.toggleServiceHotkey]
+            triggers = TriggerSnapshot(self.folders, globalHotkeys)
+
+            for folder in triggers.allFolders:
+                if not self.app.monitor.has_watch(folder.path):
+                    self.app.monitor.add_watch(folder.path)
+
+            self.triggers = triggers
+
+            if persistGlobal:
+                WRITE_BEHIND.schedule(self)
+        finally:
+            self.lock.release()
+
+    def persist(self):
+        """
+        Save the global configuration. Called by C{WRITE_BEHIND}, once for any number
+        of changes scheduled in quick succession.
+        """
+        self.lock.acquire()
+        try:
             save_config(self)
+        finally:
+            self.lock.release()
 
-        self.lock.release()
-                    
-    def __processFolder(self, parentFolder):        
-        if not self.app.monitor.has_watch(parentFolder.path):
-            self.app.monitor.add_watch(parentFolder.path)
-        
-        for folder in parentFolder.folders:
-            if TriggerMode.HOTKEY in folder.modes:
-                self.hotKeyFolders.append(folder)
-            self.allFolders.append(folder)
-            
-            if not self.app.monitor.has_watch(folder.path):
-                self.app.monitor.add_watch(folder.path)
-            
-            self.__processFolder(folder)
-            
-        for item in parentFolder.items:
-            if TriggerMode.HOTKEY in item.modes:
-                self.hotKeys.append(item)
-            if TriggerMode.ABBREVIATION in item.modes:
-                self.abbreviations.append(item)
-            self.allItems.append(item)
+    def item_added(self, target, persistGlobal=False):
+        """
+        Called after a folder, phrase or script was added to the configuration.
+        Unlike L{config_altered}, only the index entries of the new folder and its
+        contents are added, and only the new folders get a watch.
+
+        @param persistGlobal: save the global configuration, e.g. for a new top level folder
+        """
+        self.lock.acquire()
+        try:
+            changes = self.__newChanges()
+            changes.added(target)
+            self.__applyChanges(changes, persistGlobal)
+        finally:
+            self.lock.release()
+
+    def items_added(self, targets, persistGlobal=False):
+        """
+        Like L{item_added}, for any number of folders, phrases and scripts at once.
+        """
+        self.lock.acquire()
+        try:
+            changes = self.__newChanges()
+            for target in targets:
+                changes.added(target)
+            self.__applyChanges(changes, persistGlobal)
+        finally:
+            self.lock.release()
+
+    def item_removed(self, target, persistGlobal=False):
+        """
+        Called after a folder, phrase or script was removed from the configuration.
+        Only the index entries of the target and its contents are removed, along
+        with the watches of removed folders.
+        """
+        self.lock.acquire()
+        try:
+            changes = self.__newChanges()
+            changes.removed(target)
+            self.__applyChanges(changes, persistGlobal)
+        finally:
+            self.lock.release()
+
+    def items_removed(self, targets, persistGlobal=False):
+        """
+        Like L{item_removed}, for any number of folders, phrases and scripts at once.
+        """
+        self.lock.acquire()
+        try:
+            changes = self.__newChanges()
+            for target in targets:
+                changes.removed(target)
+            self.__applyChanges(changes, persistGlobal)
+        finally:
+            self.lock.release()
+
+    def item_changed(self, target, persistGlobal=False):
+        """
+        Called after the triggers, window filter or path of a single folder, phrase
+        or script were changed. Only the index entries of that target are replaced;
+        the contents of a folder are only visited when the folder was renamed.
+        """
+        self.lock.acquire()
+        try:
+            changes = self.__newChanges()
+            changes.changed(target)
+            self.__applyChanges(changes, persistGlobal)
+        finally:
+            self.lock.release()
+
+    def __newChanges(self):
+        # The published snapshot is never modified, so the change set gets its own copy
+        # of the path index, which the new snapshot takes over. Called with the lock held.
+        return ChangeSet(self.triggers.paths.copy())
+
+    def __applyChanges(self, changes, persistGlobal=False):
+        # Called with the lock held, which covers the whole change from the copy of
+        # the path index to publishing the new snapshot
+        if not changes and not persistGlobal:
+            return
+
+        _logger.debug("Configuration changed - updating %d in-memory entries", len(changes))
+
+        # Filters are inherited, so any change may affect the whole cache
+        WINDOW_FILTER_CACHE.invalidate()
+
+        triggers = self.triggers.updated(changes.addedTargets, changes.removedTargets,
+                                         changes.changedTargets, self.folders, changes.paths)
+
+        monitor = self.app.monitor
+        for folder in changes.removedFolders:
+            if folder.path is not None and monitor.has_watch(folder.path):
+                monitor.remove_watch(folder.path)
+
+        for folder in changes.addedFolders:
+            if folder.path is not None and not monitor.has_watch(folder.path):
+                monitor.add_watch(folder.path, rec=True)
+
+        self.triggers = triggers
+
+        if persistGlobal:
+            WRITE_BEHIND.schedule(self)
+
+    # Read-only views of the current trigger snapshot
+
+    @property
+    def globalHotkeys(self):
+        return self.triggers.globalHotkeys
+
+    @property
+    def hotKeys(self):
+        return self.triggers.hotKeys
+
+    @property
+    def hotKeyFolders(self):
+        return self.triggers.hotKeyFolders
+
+    @property
+    def abbreviations(self):
+        return self.triggers.abbreviations
+
+    @property
+    def allFolders(self):
+        return self.triggers.allFolders
+
+    @property
+    def allItems(self):
+        return self.triggers.allItems
+
+    def find_folder(self, title):
+        """
+        Return the folder with the given title, None if there is none. The title may
+        be qualified with those of the enclosing folders, as in C{"Top/Sub/Title"}.
+        """
+        return self.triggers.paths.folder_named(title)
+
+    def find_item(self, description, itemType=None):
+        """
+        Return the phrase or script with the given description, None if there is none.
+        The description may be qualified with the titles of the enclosing folders.
+
+        @param itemType: C{Phrase} or C{Script} to only return items of that class
+        """
+        return self.triggers.paths.item_named(description, itemType)
             
     # TODO Future functionality
     def add_recent_entry(self, entry):
@@ -646,50 +837,43 @@ dialog.info_dialog("Window information",
         
         @param abbreviation: the abbreviation to check
         @param targetItem: the phrase for which the abbreviation to be used 
+        @return: tuple of (unique, conflicting folder or item)
         """
-        for item in self.allFolders:
-            if TriggerMode.ABBREVIATION in item.modes:
-                if abbreviation in item.abbreviations and item.filter_matches(newFilterPattern):
-                    return item is targetItem, item
-            
-        for item in self.allItems:
-            if TriggerMode.ABBREVIATION in item.modes:
-                if abbreviation in item.abbreviations and item.filter_matches(newFilterPattern):
-                    return item is targetItem, item
+        triggers = self.triggers
+        for index in (triggers.folderAbbreviationIndex, triggers.abbreviationIndex):
+            for item in index.lookup(abbreviation):
+                if item is not targetItem and abbreviation in item.abbreviations and \
+                        item.filter_matches(newFilterPattern):
+                    return False, item
 
         return True, None
 
-    """def check_abbreviation_substring(self, abbreviation, targetItem):
-        for item in self.allFolders:
-            if TriggerMode.ABBREVIATION in item.modes:
-                if abbreviation in item.abbreviation or item.abbreviation in abbreviation:
-                    return item is targetItem, item.title       
+    def check_conflicts(self, target, apply=None):
+        """
+        Checks the abbreviations and hotkey of a folder or item, as currently set,
+        against all others. Besides exact duplicates, this finds abbreviations that
+        shadow or are shadowed by a longer one containing them, depending on the
+        immediate and trigger inside options of both.
 
-        for item in self.allItems:
-            if TriggerMode.ABBREVIATION in item.modes:
-                if abbreviation in item.abbreviation or item.abbreviation in abbreviation:
-                    return item is targetItem, item.description
+        @param target: the folder or item, which does not need to be saved yet
+        @param apply: callable applying settings that were not saved yet, like the
+        C{save} method of a settings dialog. Only the triggers it sets are checked,
+        on a copy of the target, leaving out conflicts with the target itself.
+        @return: list of L{Conflict}s, empty if there are none
+        """
+        original = None
+        if apply is not None:
+            original = target
+            target = copy.copy(original)
+            target.modes = []
+            apply(target)
 
-        return True, ""
+        conflicts = self.triggers.conflictDetector.conflicts(target,
+                                                             TriggerMode.ABBREVIATION in target.modes,
+                                                             TriggerMode.HOTKEY in target.modes)
+        return [conflict for conflict in conflicts
+                if conflict.target is not original and conflict.other is not original]
 
-    def __checkSubstringAbbr(self, item1, item2, abbr):
-        # Check if the given abbreviation is a substring match for the given item
-        # If it is, check a few other rules to see if it matters
-        print "substring check %s against %s" % (item.abbreviation, abbr)
-        try:
-            index = item.abbreviation.index(abbr)
-            print index
-            if index == 0 and len(abbr) < len(item.abbreviation):
-                return item.immediate
-            elif (index + len(abbr)) == len(item.abbreviation):
-                return item.triggerInside
-            elif len(abbr) != len(item.abbreviation):
-                return item.triggerInside and item.immediate
-            else:
-                return False
-        except ValueError:
-            return False"""
-            
     def check_hotkey_unique(self, modifiers, hotKey, newFilterPattern, targetItem):
         """
         Checks that the given hotkey is not already in use. Also checks the 
@@ -698,26 +882,287 @@ dialog.info_dialog("Window information",
         @param modifiers: modifiers for the hotkey
         @param hotKey: the hotkey to check
         @param targetItem: the phrase for which the hotKey to be used        
+        @return: tuple of (unique, conflicting folder, item or global hotkey)
         """
-        for item in self.allFolders:
-            if TriggerMode.HOTKEY in item.modes:
-                if item.modifiers == modifiers and item.hotKey == hotKey and item.filter_matches(newFilterPattern):
-                    return item is targetItem, item
-            
-        for item in self.allItems:
-            if TriggerMode.HOTKEY in item.modes:
-                if item.modifiers == modifiers and item.hotKey == hotKey and item.filter_matches(newFilterPattern):
-                    return item is targetItem, item
+        triggers = self.triggers
+        for table in (triggers.folderHotkeyTable, triggers.hotkeyTable):
+            for item in table.lookup(modifiers, hotKey):
+                if item is not targetItem and item.modifiers == modifiers and item.hotKey == hotKey and \
+                        item.filter_matches(newFilterPattern):
+                    return False, item
 
         for item in self.globalHotkeys:
-            if item.enabled:
+            if item.enabled and item is not targetItem:
                 if item.modifiers == modifiers and item.hotKey == hotKey and item.filter_matches(newFilterPattern):
-                    return item is targetItem, item
+                    return False, item
 
         return True, None
     
 # This import placed here to prevent circular import conflicts
 from .model import *
+from .folderloader import FolderLoader, StartupCache
+
+class ChangeSet:
+    """
+    Folders and items added, removed or changed since the current L{TriggerSnapshot},
+    to be applied to it in one go.
+
+    Added and removed folders stand for their whole contents. A target can appear in
+    one list only: a target added and then changed is simply added, and a target
+    added and then removed is dropped. The path index is updated straight away, so
+    later events of the same batch already find the new folders and items.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.__added = collections.OrderedDict()
+        self.__removed = collections.OrderedDict()
+        self.__changed = collections.OrderedDict()
+        # Folders given to added() and removed(), without their subfolders
+        self.addedFolders = []
+        self.removedFolders = []
+
+    def __len__(self):
+        return len(self.__added) + len(self.__removed) + len(self.__changed)
+
+    def added(self, target):
+        if isinstance(target, Folder):
+            self.addedFolders.append(target)
+
+        for t in self.__getSubtree(target):
+            self.__addPath(t)
+
+            if self.__removed.pop(t, None) is not None:
+                self.__changed[t] = True
+            else:
+                self.__added[t] = True
+
+    def removed(self, target):
+        if isinstance(target, Folder):
+            self.removedFolders.append(target)
+
+        for t in self.__getSubtree(target):
+            self.paths.remove(t)
+            self.__changed.pop(t, None)
+            if self.__added.pop(t, None) is None:
+                self.__removed[t] = True
+
+    def changed(self, target):
+        if isinstance(target, Folder) and self.paths.folder(target.path) is not target:
+            # A renamed folder moves its contents along with it
+            targets = self.__getSubtree(target)
+        else:
+            targets = [target]
+
+        for t in targets:
+            self.paths.remove(t)
+            self.__addPath(t)
+            if t not in self.__added:
+                self.__changed[t] = True
+
+    def __addPath(self, target):
+        if isinstance(target, Folder):
+            self.paths.add_folder(target)
+        else:
+            self.paths.add_item(target)
+
+    @property
+    def addedTargets(self):
+        return list(self.__added)
+
+    @property
+    def removedTargets(self):
+        return list(self.__removed)
+
+    @property
+    def changedTargets(self):
+        return list(self.__changed)
+
+    def __getSubtree(self, target):
+        targets = []
+        pending = [target]
+        while pending:
+            t = pending.pop()
+            targets.append(t)
+            if isinstance(t, Folder):
+                pending.extend(t.folders)
+                targets.extend(t.items)
+
+        return targets
+
+
+class TriggerSnapshot:
+    """
+    Immutable collection of the folders and items that can be triggered, together with
+    the indexes used to match them, as built by L{ConfigManager.config_altered}.
+
+    The keypress path reads C{ConfigManager.triggers} once per event and uses that
+    snapshot throughout without locking. Configuration changes never modify a
+    published snapshot; a new one is built and swapped in instead, either from
+    scratch or with L{updated}.
+    """
+
+    def __init__(self, folders=(), globalHotkeys=()):
+        self.folders = tuple(folders)
+        self.globalHotkeys = tuple(globalHotkeys)
+        self.__sequences = None
+        self.__conflictDetector = None
+
+        self.abbreviationIndex = AbbreviationIndex()
+        self.folderAbbreviationIndex = AbbreviationIndex()
+        self.hotkeyTable = HotkeyTable()
+        self.folderHotkeyTable = HotkeyTable()
+        self.globalHotkeyTable = HotkeyTable()
+        self.paths = PathIndex()
+
+        for folder in self.folders:
+            self.__addTree(folder)
+
+        for hotkey in self.globalHotkeys:
+            self.globalHotkeyTable.add(hotkey)
+
+    def updated(self, added=(), removed=(), changed=(), folders=None, paths=None):
+        """
+        Return a new snapshot with the given folders and items added, removed or
+        re-indexed, sharing everything else with this one. Copies of the indexes
+        share their structure, and each change only copies the few parts of them it
+        touches, so the cost depends on the number of targets given and not on the
+        size of the configuration. This snapshot is left unchanged.
+
+        Subfolders and items of the given folders are not included.
+
+        @param changed: targets whose triggers, filter or path changed
+        @param folders: the new list of top level folders, if it changed
+        @param paths: a copy of the path index of this snapshot to take over, e.g.
+        one already updated by a L{ChangeSet}
+        """
+        triggers = TriggerSnapshot()
+        if folders is None:
+            triggers.folders = self.folders
+        else:
+            triggers.folders = tuple(folders)
+        triggers.globalHotkeys = self.globalHotkeys
+        triggers.__sequences = None
+        triggers.__conflictDetector = None
+        triggers.abbreviationIndex = self.abbreviationIndex.copy()
+        triggers.folderAbbreviationIndex = self.folderAbbreviationIndex.copy()
+        triggers.hotkeyTable = self.hotkeyTable.copy()
+        triggers.folderHotkeyTable = self.folderHotkeyTable.copy()
+        triggers.globalHotkeyTable = self.globalHotkeyTable.copy()
+        triggers.paths = paths if paths is not None else self.paths.copy()
+
+        for target in removed:
+            triggers.__remove(target)
+
+        for target in changed:
+            triggers.__change(target)
+
+        for target in added:
+            triggers.__add(target)
+
+        return triggers
+
+    def __tables(self, target):
+        if isinstance(target, Folder):
+            return (self.folderAbbreviationIndex, self.folderHotkeyTable)
+
+        return (self.abbreviationIndex, self.hotkeyTable)
+
+    def __addTree(self, folder):
+        self.__add(folder)
+        for subFolder in folder.folders:
+            self.__addTree(subFolder)
+
+        for item in folder.items:
+            self.__add(item)
+
+    def __add(self, target):
+        abbreviationIndex, hotkeyTable = self.__tables(target)
+        if TriggerMode.ABBREVIATION in target.modes:
+            abbreviationIndex.add(target)
+        if TriggerMode.HOTKEY in target.modes:
+            hotkeyTable.add(target)
+        self.__addPath(target)
+
+    def __addPath(self, target):
+        if isinstance(target, Folder):
+            self.paths.add_folder(target)
+        else:
+            self.paths.add_item(target)
+
+    def __remove(self, target):
+        abbreviationIndex, hotkeyTable = self.__tables(target)
+        abbreviationIndex.remove(target)
+        hotkeyTable.remove(target)
+        self.paths.remove(target)
+
+    def __change(self, target):
+        abbreviationIndex, hotkeyTable = self.__tables(target)
+        if TriggerMode.ABBREVIATION not in target.modes:
+            abbreviationIndex.remove(target)
+        elif target in abbreviationIndex:
+            # Keeps its place among targets sharing an abbreviation
+            abbreviationIndex.update(target)
+        else:
+            abbreviationIndex.add(target)
+
+        hotkeyTable.remove(target)
+        if TriggerMode.HOTKEY in target.modes:
+            hotkeyTable.add(target)
+
+        # Also picks up the path of a target saved for the first time
+        self.paths.remove(target)
+        self.__addPath(target)
+
+    # The lists are only needed when browsing the configuration, so snapshots made by
+    # updated() build them on first use instead of on every change. They are read from
+    # the indexes of this snapshot rather than the folder tree, which other threads
+    # change before publishing the next snapshot, and are in no particular order.
+
+    def __getSequences(self):
+        if self.__sequences is None:
+            allFolders, allItems = self.paths.targets()
+            hotKeyFolders = [folder for folder in allFolders if folder in self.folderHotkeyTable]
+            hotKeys = [item for item in allItems if item in self.hotkeyTable]
+            abbreviations = [item for item in allItems if item in self.abbreviationIndex]
+            self.__sequences = tuple(tuple(sequence) for sequence in
+                                     (hotKeyFolders, hotKeys, abbreviations, allFolders, allItems))
+
+        return self.__sequences
+
+    @property
+    def hotKeyFolders(self):
+        return self.__getSequences()[0]
+
+    @property
+    def hotKeys(self):
+        return self.__getSequences()[1]
+
+    @property
+    def abbreviations(self):
+        return self.__getSequences()[2]
+
+    @property
+    def allFolders(self):
+        return self.__getSequences()[3]
+
+    @property
+    def allItems(self):
+        return self.__getSequences()[4]
+
+    @property
+    def conflictDetector(self):
+        """
+        L{ConflictDetector} over the indexes of this snapshot, built on first use.
+        Like the indexes it reads, it is only accurate for the current snapshot.
+        """
+        if self.__conflictDetector is None:
+            self.__conflictDetector = ConflictDetector(
+                (self.folderAbbreviationIndex, self.abbreviationIndex),
+                (self.folderHotkeyTable, self.hotkeyTable, self.globalHotkeyTable))
+
+        return self.__conflictDetector
+
 
 class GlobalHotkey(AbstractHotkey):
     """
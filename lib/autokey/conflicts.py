@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Detection of abbreviations and hotkeys that get in each other's way.
+
+This module must not import the rest of AutoKey; it works on the indexes of
+L{triggerindex} and the attributes of the folders and items in them.
+"""
+
+import bisect, collections
+
+DUPLICATE = "duplicate"
+SHADOWED = "shadowed"
+AMBIGUOUS = "ambiguous"
+
+
+class Conflict:
+    """
+    Two folders or items whose triggers clash in windows matched by both.
+
+    The kind is one of:
+        - C{DUPLICATE}: both use the same abbreviation or hotkey
+        - C{SHADOWED}: C{other} always fires before the abbreviation of C{target}
+        has been typed completely
+        - C{AMBIGUOUS}: both fire on the same keystroke, so only one of them is used
+    """
+
+    def __init__(self, kind, target, trigger, other, otherTrigger):
+        self.kind = kind
+        self.target = target
+        self.trigger = trigger
+        self.other = other
+        self.otherTrigger = otherTrigger
+
+    def __eq__(self, other):
+        return isinstance(other, Conflict) and self.__key() == other.__key()
+
+    def __hash__(self):
+        return hash(self.__key())
+
+    def __key(self):
+        return (self.kind, id(self.target), self.trigger, id(self.other), self.otherTrigger)
+
+    def get_serializable(self):
+        return {
+            "kind": self.kind,
+            "target": str(self.target),
+            "path": getattr(self.target, "path", None),
+            "trigger": self.trigger,
+            "other": str(self.other),
+            "otherPath": getattr(self.other, "path", None),
+            "otherTrigger": self.otherTrigger
+            }
+
+    def __str__(self):
+        if self.kind == SHADOWED:
+            return "%s: abbreviation '%s' is shadowed by '%s' of %s" % (
+                self.target, self.trigger, self.otherTrigger, self.other)
+        elif self.kind == AMBIGUOUS:
+            return "%s: abbreviation '%s' fires together with '%s' of %s" % (
+                self.target, self.trigger, self.otherTrigger, self.other)
+
+        return "%s: '%s' is also used by %s" % (self.target, self.trigger, self.other)
+
+    def __repr__(self):
+        return "<Conflict %s>" % self
+
+
+def _regex(target):
+    # Global hotkeys have no window filter
+    getRegex = getattr(target, "get_applicable_regex", None)
+    return getRegex() if getRegex is not None else None
+
+
+def _enabled(target):
+    # Global hotkeys can be switched off
+    return getattr(target, "enabled", True)
+
+
+def _filters_overlap(target, other):
+    # Mirrors filter_matches(): unfiltered targets clash with everything
+    regex = _regex(target)
+    otherRegex = _regex(other)
+    return regex is None or otherRegex is None or regex.pattern == otherRegex.pattern
+
+
+def _fires_within(firing, abbr, typed, typedTarget, offset):
+    """
+    Decide whether C{firing} fires, with its abbreviation abbr found at the given
+    offset, while the abbreviation C{typed} of C{typedTarget} is being typed.
+
+    @return: C{SHADOWED}, C{AMBIGUOUS} or None
+    """
+    end = offset + len(abbr)
+    if offset > 0 and not firing.triggerInside and firing.wordChars.match(typed[offset - 1]):
+        # Needs a word boundary in front
+        return None
+
+    if end < len(typed):
+        if firing.immediate or not firing.wordChars.match(typed[end]):
+            return SHADOWED
+        return None
+
+    # A suffix of the typed abbreviation
+    if firing.immediate:
+        return AMBIGUOUS if typedTarget.immediate else SHADOWED
+    # Both wait for the same trigger character, unless the typed one fired already
+    return None if typedTarget.immediate else AMBIGUOUS
+
+
+class ConflictDetector:
+    """
+    Finds duplicate abbreviations and hotkeys, and abbreviations that shadow each
+    other, among the targets of a set of indexes.
+
+    Abbreviations contained in a given one are found by looking up each of its
+    substrings in the tries of the abbreviation indexes. Abbreviations containing a
+    given one are found in a sorted list of all suffixes of all abbreviations, built
+    on first use. Neither depends on the number of abbreviations, apart from the
+    conflicts found.
+
+    Window filters are taken into account: targets whose filters cannot both match
+    the same window never conflict.
+    """
+
+    def __init__(self, abbreviationIndexes=(), hotkeyTables=()):
+        self.abbreviationIndexes = tuple(abbreviationIndexes)
+        self.hotkeyTables = tuple(hotkeyTables)
+        self.__suffixes = {}
+
+    def abbreviation_conflicts(self, target, abbr):
+        """
+        Return the conflicts of the given abbreviation of the target with all other
+        indexed targets, in both directions. The target does not need to be indexed,
+        so new abbreviations can be checked before they are applied.
+        """
+        return self.__contained(target, abbr) + self.__containing(target, abbr)
+
+    def hotkey_conflicts(self, target, modifiers, key):
+        """
+        Return the indexed targets, other than the given one, bound to the same hotkey.
+        """
+        conflicts = []
+        for table in self.hotkeyTables:
+            for other in table.lookup(modifiers, key):
+                if other is not target and _enabled(other) and _filters_overlap(target, other):
+                    chord = self.__chord(modifiers, key)
+                    conflicts.append(Conflict(DUPLICATE, target, chord, other, chord))
+        return conflicts
+
+    def conflicts(self, target, abbreviations=True, hotkey=True):
+        """
+        Return all conflicts of the current abbreviations and hotkey of the target.
+        """
+        conflicts = []
+        if abbreviations:
+            for abbr in target.abbreviations:
+                if abbr:
+                    conflicts.extend(self.abbreviation_conflicts(target, abbr))
+        if hotkey and target.hotKey is not None:
+            conflicts.extend(self.hotkey_conflicts(target, target.modifiers, target.hotKey))
+        return conflicts
+
+    def audit(self):
+        """
+        Return the conflicts among all indexed targets, each pair reported once.
+        """
+        conflicts = []
+        pairs = set()
+        for index in self.abbreviationIndexes:
+            for target, abbreviations in index.items():
+                for abbr in abbreviations:
+                    for conflict in self.__contained(target, abbr):
+                        # Every shadowing is found from the side of the shadowed target
+                        # only, duplicates and ambiguities from both sides
+                        if conflict.kind != SHADOWED:
+                            pair = frozenset([(id(target), abbr), (id(conflict.other), conflict.otherTrigger)])
+                            if pair in pairs:
+                                continue
+                            pairs.add(pair)
+                        conflicts.append(conflict)
+
+        # Folders, items and global hotkeys share the same chords
+        chords = collections.OrderedDict()
+        for table in self.hotkeyTables:
+            for modifiers, key, targets in table.chords():
+                chords.setdefault((modifiers, key), []).extend(t for t in targets if _enabled(t))
+
+        for (modifiers, key), targets in chords.items():
+            chord = self.__chord(modifiers, key)
+            for i, target in enumerate(targets):
+                for other in targets[i + 1:]:
+                    if _filters_overlap(target, other):
+                        conflicts.append(Conflict(DUPLICATE, target, chord, other, chord))
+
+        return conflicts
+
+    def __contained(self, target, abbr):
+        # Other abbreviations found within abbr, which fire while it is typed
+        conflicts = []
+        lowered = abbr.lower()
+        for start in range(len(abbr)):
+            for end in range(start + 1, len(abbr) + 1):
+                candidates = set()
+                for index in self.abbreviationIndexes:
+                    candidates.update(index.lookup(abbr[start:end]))
+                    if lowered != abbr:
+                        candidates.update(index.lookup(lowered[start:end]))
+
+                for other in candidates:
+                    if other is target or not _filters_overlap(target, other):
+                        continue
+                    typed = lowered if other.ignoreCase else abbr
+                    otherAbbr = typed[start:end]
+                    if otherAbbr not in other.abbreviations:
+                        continue
+
+                    if start == 0 and end == len(abbr):
+                        kind = DUPLICATE
+                    else:
+                        kind = _fires_within(other, otherAbbr, typed, target, start)
+                    if kind is not None:
+                        conflicts.append(Conflict(kind, target, abbr, other, otherAbbr))
+
+        return conflicts
+
+    def __containing(self, target, abbr):
+        # Longer abbreviations containing abbr, which is fired while they are typed
+        suffixes = self.__getSuffixes(target.ignoreCase)
+        conflicts = []
+        position = bisect.bisect_left(suffixes, (abbr,))
+        while position < len(suffixes) and suffixes[position][0].startswith(abbr):
+            suffix, offset, otherAbbr, other, sequence = suffixes[position]
+            position += 1
+            if other is target or len(otherAbbr) == len(abbr) or not _filters_overlap(target, other):
+                continue
+
+            typed = otherAbbr.lower() if target.ignoreCase else otherAbbr
+            kind = _fires_within(target, abbr, typed, other, offset)
+            if kind is not None:
+                conflicts.append(Conflict(kind, other, otherAbbr, target, abbr))
+
+        return conflicts
+
+    def __getSuffixes(self, lowered):
+        # Sorted (suffix, offset, abbreviation, target, sequence) tuples; the sequence
+        # keeps tuples from ever comparing the targets themselves
+        suffixes = self.__suffixes.get(lowered)
+        if suffixes is None:
+            suffixes = []
+            for index in self.abbreviationIndexes:
+                for target, abbreviations in index.items():
+                    for abbr in abbreviations:
+                        text = abbr.lower() if lowered else abbr
+                        for offset in range(len(text)):
+                            suffixes.append((text[offset:], offset, abbr, target, len(suffixes)))
+            suffixes.sort(key=lambda entry: (entry[0], entry[4]))
+            self.__suffixes[lowered] = suffixes
+
+        return suffixes
+
+    def __chord(self, modifiers, key):
+        return "+".join(list(modifiers) + [key])
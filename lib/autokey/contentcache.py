@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+On-demand loading of phrase bodies and script sources.
+
+This module must not import the rest of AutoKey.
+"""
+
+import collections, threading
+
+
+class ContentCache:
+    """
+    Keeps the most recently used phrase bodies and script sources in memory, within a
+    budget in characters.
+
+    Entries are keyed on the owning phrase or script and remember the path they were
+    read from, so a renamed item never gets stale content. A file larger than the
+    whole budget is read on every access instead of pushing out everything else.
+
+    Owners must call L{invalidate} whenever their file is written or changed on disk.
+    """
+
+    def __init__(self, budget=8 * 1024 * 1024):
+        self.budget = budget
+        self.size = 0
+        self.__lock = threading.Lock()
+        self.__entries = collections.OrderedDict()
+
+    def read(self, owner, path, encoding=None):
+        """
+        Return the contents of the given file, as open() in text mode would.
+
+        @param owner: the phrase or script the file belongs to
+        @param path: path of the file
+        @param encoding: encoding of the file, None for the locale default
+        """
+        with self.__lock:
+            entry = self.__entries.get(owner)
+            if entry is not None and entry[0] == path:
+                self.__entries.move_to_end(owner)
+                return entry[1]
+
+        with open(path, 'r', encoding=encoding) as inFile:
+            text = inFile.read()
+
+        with self.__lock:
+            self.__remove(owner)
+            if len(text) <= self.budget:
+                self.__entries[owner] = (path, text)
+                self.size += len(text)
+                while self.size > self.budget:
+                    self.__remove(next(iter(self.__entries)))
+
+        return text
+
+    def invalidate(self, owner):
+        """
+        Forget the contents cached for the given phrase or script.
+        """
+        with self.__lock:
+            self.__remove(owner)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+    def __remove(self, owner):
+        entry = self.__entries.pop(owner, None)
+        if entry is not None:
+            self.size -= len(entry[1])
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Parallel loading of folder trees from disk.
+
+Loading a large library one file at a time is bound by the latency of each file
+access, which is high on network file systems. The L{FolderLoader} instead lists
+directories and reads and decodes files on a thread pool, then assembles the
+L{Folder} hierarchy on the calling thread, in the same order and with the same
+error handling as C{Folder.load}.
+"""
+
+import os, logging, json, pickle, concurrent.futures
+
+from . import common
+from .model import Folder, Phrase, Script
+
+_logger = logging.getLogger("model")
+
+FOLDER_JSON = ".folder.json"
+
+# Number of files read concurrently; I/O bound, so not related to the number of CPUs
+MAX_WORKERS = 16
+
+
+def _signature(stat):
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _read_json(path):
+    """
+    Read and decode the given JSON file if it exists.
+
+    @return: tuple of (exists, decoded data, exception raised while reading or decoding)
+    """
+    if not os.path.exists(path):
+        return (False, None, None)
+
+    try:
+        with open(path, 'r') as inFile:
+            return (True, json.load(inFile), None)
+    except Exception as e:
+        return (True, None, e)
+
+
+def _scan_folder(path):
+    """
+    List a folder like C{glob.glob(path + "/*")} does, and read its settings.
+
+    Everything is stat'ed before being read, so a file changed while loading never
+    ends up in the startup cache with its new signature but old contents.
+
+    @return: tuple of (folder signature, dict of file name to signature, settings as
+    returned by L{_read_json}, list of (path, isDir, isFile))
+    """
+    signature = None
+    files = {}
+    entries = []
+    try:
+        signature = _signature(os.stat(path))
+        with os.scandir(path) as it:
+            for entry in it:
+                isDir = entry.is_dir()
+                if not isDir:
+                    try:
+                        files[entry.name] = _signature(entry.stat())
+                    except OSError:
+                        pass
+
+                if not entry.name.startswith('.'):
+                    entries.append((entry.path, isDir, entry.is_file()))
+    except OSError:
+        # glob ignores folders that cannot be listed
+        signature = None
+
+    return (signature, files, _read_json(os.path.join(path, FOLDER_JSON)), entries)
+
+
+def _read_item(path, jsonPath, encoding, lazy):
+    body = None
+    if not lazy:
+        with open(path, 'r', encoding=encoding) as inFile:
+            body = inFile.read()
+
+    return (body, _read_json(jsonPath))
+
+
+def _validate(path, record):
+    """
+    Check that neither the folder nor any of its files changed since the record was made.
+    """
+    signature, files = record[0], record[1]
+    try:
+        if _signature(os.stat(path)) != signature:
+            return False
+        for name, fileSignature in files.items():
+            if _signature(os.stat(os.path.join(path, name))) != fileSignature:
+                return False
+    except OSError:
+        return False
+
+    return True
+
+
+def _is_item(path):
+    return path.endswith(".txt") or path.endswith(".py")
+
+
+class _CacheUnpickler(pickle.Unpickler):
+    """
+    Only loads the built-in types the snapshot is made of, so a damaged or replaced
+    cache file cannot create any other objects.
+    """
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError("Unexpected object %s.%s in startup cache" % (module, name))
+
+
+class StartupCache:
+    """
+    Snapshot of the files read while loading the folder tree, stored in a single file.
+
+    For every folder it holds the folder settings, the listing, and the contents and
+    settings of every phrase and script, together with a manifest of the modification
+    time and size of the folder and each of its files. A folder whose manifest still
+    matches is taken from the snapshot, otherwise only that folder is read again.
+    """
+
+    # Bump when the layout of the records changes
+    FORMAT = 2
+
+    def __init__(self, path, lazy=False):
+        """
+        @param lazy: whether item contents are loaded lazily, in which case they are
+        not stored in the snapshot either
+        """
+        self.path = path
+        self.header = {"format": self.FORMAT, "version": common.VERSION, "lazy": lazy}
+        self.records = {}
+
+    def load(self):
+        """
+        Read the snapshot, starting empty if it is missing, was written by another
+        format or version, or cannot be read at all.
+        """
+        self.records = {}
+        try:
+            with open(self.path, 'rb') as inFile:
+                data = _CacheUnpickler(inFile).load()
+        except FileNotFoundError:
+            return
+        except Exception:
+            _logger.warning("Startup cache at %s could not be read, ignoring it", self.path, exc_info=True)
+            return
+
+        if not isinstance(data, dict) or data.get("header") != self.header:
+            _logger.info("Startup cache at %s is from another version, ignoring it", self.path)
+        elif isinstance(data.get("records"), dict):
+            self.records = data["records"]
+
+    def get(self, path):
+        return self.records.get(path)
+
+    def save(self, records):
+        """
+        Replace the snapshot with the given folder records. Folders with files that
+        could not be read or decoded are left out, so their errors are reported again
+        on the next start.
+        """
+        self.records = {}
+        for path, record in records.items():
+            signature, files, settings, entries, items = record
+            if signature is None or settings[2] is not None:
+                continue
+            if any(itemSettings[2] is not None for body, itemSettings in items.values()):
+                continue
+            self.records[path] = record
+
+        tempPath = self.path + ".tmp"
+        try:
+            with open(tempPath, 'wb') as outFile:
+                pickle.dump({"header": self.header, "records": self.records}, outFile,
+                            pickle.HIGHEST_PROTOCOL)
+            os.replace(tempPath, self.path)
+        except Exception:
+            _logger.exception("Error while saving startup cache to %s", self.path)
+
+
+class FolderLoader:
+    """
+    Loads folders with all their subfolders, phrases and scripts, reading the files
+    concurrently and, if given a L{StartupCache}, only those that changed.
+
+    In lazy mode the phrase and script files are not read at all; their contents are
+    loaded on first use through the content cache instead.
+    """
+
+    def __init__(self, maxWorkers=MAX_WORKERS, cache=None, lazy=False):
+        self.maxWorkers = maxWorkers
+        self.cache = cache
+        self.lazy = lazy
+
+    def load(self, paths, parent=None):
+        """
+        Load the folders at the given paths.
+
+        @param paths: list of folder paths
+        @param parent: parent of the loaded folders, None for top level folders
+        @return: list of loaded folders, in the order of the given paths
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.maxWorkers) as pool:
+            records = {}
+            scanned = []
+            pending = list(paths)
+
+            # Walk the tree level by level. Cached folders are only stat'ed; the others
+            # are listed, and their items read as soon as they have been listed
+            while pending:
+                scans = []
+                validations = []
+                for path in pending:
+                    record = self.cache.get(path) if self.cache is not None else None
+                    if record is None:
+                        scans.append(path)
+                    else:
+                        validations.append((path, record, pool.submit(_validate, path, record)))
+
+                for path, record, future in validations:
+                    if future.result():
+                        records[path] = record
+                    else:
+                        scans.append(path)
+
+                futures = [(path, pool.submit(_scan_folder, path)) for path in scans]
+                for path, future in futures:
+                    signature, files, settings, entries = future.result()
+                    items = {}
+                    for entryPath, isDir, isFile in entries:
+                        if isFile and _is_item(entryPath):
+                            item = self.__create_item(entryPath)
+                            encoding = 'UTF-8' if isinstance(item, Script) else None
+                            items[entryPath] = pool.submit(_read_item, entryPath, item.get_json_path(),
+                                                           encoding, self.lazy)
+                    records[path] = (signature, files, settings, entries, items)
+                    scanned.append(path)
+
+                pending = [entryPath for path in pending
+                           for entryPath, isDir, isFile in records[path][3] if isDir]
+
+            for path in scanned:
+                signature, files, settings, entries, items = records[path]
+                items = dict((entryPath, future.result()) for entryPath, future in items.items())
+                records[path] = (signature, files, settings, entries, items)
+
+        if self.cache is not None and (scanned or len(records) != len(self.cache.records)):
+            _logger.info("Read %d changed folders, updating startup cache", len(scanned))
+            self.cache.save(records)
+
+        folders = []
+        for path in paths:
+            folder = Folder("", path=path)
+            self.__assemble(folder, parent, records)
+            folders.append(folder)
+
+        return folders
+
+    def __create_item(self, path):
+        if path.endswith(".txt"):
+            return Phrase("", "", path=path)
+        elif path.endswith(".py"):
+            return Script("", "", path=path)
+
+        return None
+
+    def __assemble(self, folder, parent, records):
+        # Mirrors Folder.load() and Folder.load_children()
+        folder.parent = parent
+        signature, files, settings, entries, items = records[folder.path]
+
+        if not self.__inject(folder, settings):
+            folder.title = os.path.basename(folder.path)
+
+        for entryPath, isDir, isFile in entries:
+            if isDir:
+                f = Folder("", path=entryPath)
+                self.__assemble(f, folder, records)
+                folder.folders.append(f)
+
+            if isFile and entryPath in items:
+                item = self.__create_item(entryPath)
+                body, itemSettings = items[entryPath]
+                # Mirrors Phrase.load() and Script.load()
+                item.parent = folder
+                if isinstance(item, Script):
+                    item.code = body
+                    baseName = os.path.basename(item.path)[:-3]
+                else:
+                    item.phrase = body
+                    baseName = os.path.basename(item.path)[:-4]
+                item.mark_saved()
+
+                if not self.__inject(item, itemSettings):
+                    item.description = baseName
+                folder.items.append(item)
+
+    def __inject(self, target, settings):
+        """
+        Apply settings read by L{_read_json}, like C{load_from_serialized} does.
+
+        @return: False if there was no settings file
+        """
+        exists, data, error = settings
+        if not exists:
+            return False
+
+        try:
+            if error is not None:
+                raise error
+            target.inject_json_data(data)
+        except Exception:
+            if isinstance(target, Folder):
+                name = target.title
+            else:
+                name = target.description
+            _logger.exception("Error while loading json data for %s", name)
+            _logger.error("JSON data not loaded (or loaded incomplete)")
+
+        return True
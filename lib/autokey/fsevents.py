@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Batching of file system events before they reach the configuration.
+
+Saving a file in an editor produces a burst of events for the same path, and
+AutoKey sees events for the files it writes itself. The L{EventCoalescer} turns
+bursts into a single event per path, and the L{WriteTracker} recognises the
+changes AutoKey made itself, without ignoring everything else in the meantime.
+The L{WatchRegistry} keeps track of the watched folders.
+
+This module must not import the rest of AutoKey.
+"""
+
+import collections, os, stat, threading, time
+
+# Seconds without new events before a batch is delivered
+COALESCE_DELAY = 0.2
+
+
+class EventCoalescer:
+    """
+    Collects file system events until no new ones arrived for C{delay} seconds, or
+    the oldest one has waited for C{maxDelay} seconds while events keep coming.
+
+    Events are kept per path, in the order each path was first seen, so a folder
+    created before the files in it is still handled first. Only the last event of
+    each path counts: a file removed and written again is a modification, and a
+    file written and then removed is a removal.
+    """
+
+    def __init__(self, delay=COALESCE_DELAY, maxDelay=None):
+        self.delay = delay
+        self.maxDelay = maxDelay
+        self.__lock = threading.Lock()
+        self.__pending = collections.OrderedDict()
+        self.__first = None
+        self.__last = None
+
+    def __len__(self):
+        return len(self.__pending)
+
+    def add(self, path, removed, now=None):
+        """
+        @param removed: whether the path was removed (or moved away), rather than
+        created or modified
+        """
+        if now is None:
+            now = time.monotonic()
+
+        with self.__lock:
+            if not self.__pending:
+                self.__first = now
+            self.__last = now
+            self.__pending[path] = removed
+
+    def timeout(self, now=None):
+        """
+        Return the number of seconds until the pending events are due, or None if
+        there are none.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        with self.__lock:
+            if not self.__pending:
+                return None
+
+            due = self.__last + self.delay
+            maxDelay = self.maxDelay if self.maxDelay is not None else self.delay * 10
+            due = min(due, self.__first + maxDelay)
+            return max(due - now, 0.0)
+
+    def take(self, now=None):
+        """
+        Return the pending events if they are due, clearing them.
+
+        @return: list of (path, removed) tuples, empty if nothing is due yet
+        """
+        timeout = self.timeout(now)
+        if timeout is None or timeout > 0:
+            return []
+
+        with self.__lock:
+            events = list(self.__pending.items())
+            self.__pending.clear()
+            self.__first = self.__last = None
+
+        return events
+
+
+class WatchRegistry:
+    """
+    The watched folders, by path and by watch descriptor.
+
+    Each path also remembers its watched subfolders, so removing the watches of a
+    whole subtree only visits that subtree. Watches removed by the kernel (because
+    their folder was deleted or its file system unmounted) are dropped with
+    L{discard}, when their C{IN_IGNORED} event arrives.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__paths = {}
+        self.__wds = {}
+        self.__children = {}
+
+    def __len__(self):
+        return len(self.__paths)
+
+    def __contains__(self, path):
+        return path in self.__paths
+
+    def __iter__(self):
+        with self.__lock:
+            return iter(list(self.__paths))
+
+    def add(self, path, wd):
+        with self.__lock:
+            previous = self.__paths.get(path)
+            if previous is not None and self.__wds.get(previous) == path:
+                del self.__wds[previous]
+            self.__paths[path] = wd
+            self.__wds[wd] = path
+            self.__children.setdefault(os.path.dirname(path), set()).add(path)
+
+    def get_wd(self, path):
+        return self.__paths.get(path)
+
+    def get_path(self, wd):
+        return self.__wds.get(wd)
+
+    def remove(self, path):
+        """
+        Forget the watches of the given folder and of everything below it.
+
+        @return: the watch descriptors that were removed
+        """
+        with self.__lock:
+            wds = []
+            pending = [path]
+            while pending:
+                path = pending.pop()
+                pending.extend(self.__children.pop(path, ()))
+                wd = self.__forget(path)
+                if wd is not None:
+                    wds.append(wd)
+
+            return wds
+
+    def discard(self, wd):
+        """
+        Forget a single watch that no longer exists, e.g. after C{IN_IGNORED}.
+        """
+        with self.__lock:
+            path = self.__wds.get(wd)
+            if path is not None:
+                self.__forget(path)
+
+    def __forget(self, path):
+        wd = self.__paths.pop(path, None)
+        if wd is None:
+            return None
+
+        if self.__wds.get(wd) == path:
+            del self.__wds[wd]
+        siblings = self.__children.get(os.path.dirname(path))
+        if siblings is not None:
+            siblings.discard(path)
+            if not siblings:
+                del self.__children[os.path.dirname(path)]
+        return wd
+
+
+def _signature(path):
+    st = os.stat(path)
+    if stat.S_ISDIR(st.st_mode):
+        # The modification time of a folder changes with every file written in it
+        return (st.st_dev, st.st_ino)
+
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class WriteTracker:
+    """
+    Remembers the files AutoKey wrote or removed itself, so that the events caused
+    by them can be told apart from changes made by other programs.
+
+    A written file is recognised by its inode, modification time and size, so a
+    file changed again by someone else is no longer taken for our own write. A
+    removal also covers everything below the removed path. Records are forgotten
+    after C{expiry} seconds.
+    """
+
+    def __init__(self, expiry=60.0):
+        self.expiry = expiry
+        self.__lock = threading.Lock()
+        # Oldest record first, so expired ones are dropped from the front
+        self.__records = collections.OrderedDict()
+
+    def written(self, path):
+        """
+        Record that the given file or folder was just written or created.
+        """
+        try:
+            signature = _signature(path)
+        except OSError:
+            return
+
+        self.__record(path, signature)
+
+    def removed(self, path):
+        """
+        Record that the given file or folder was just removed, or renamed away.
+        """
+        self.__record(path, None)
+
+    def __record(self, path, signature):
+        now = time.monotonic()
+        with self.__lock:
+            self.__records.pop(path, None)
+            self.__records[path] = (signature, now + self.expiry)
+            while self.__records:
+                oldest = next(iter(self.__records))
+                if self.__records[oldest][1] >= now:
+                    break
+                del self.__records[oldest]
+
+    def is_own(self, path, removed):
+        """
+        Return whether an event is explained by a write or removal recorded here.
+
+        @param removed: whether the event is a removal
+        """
+        now = time.monotonic()
+        with self.__lock:
+            if not removed:
+                record = self.__records.get(path)
+                if record is None or record[0] is None or record[1] < now:
+                    return False
+                signature = record[0]
+            else:
+                while True:
+                    record = self.__records.get(path)
+                    if record is not None and record[0] is None and record[1] >= now:
+                        return True
+                    parent = os.path.dirname(path)
+                    if parent == path:
+                        return False
+                    path = parent
+
+        try:
+            return _signature(path) == signature
+        except OSError:
+            return False
+
+
+# Shared by everything that writes to the configuration folders
+WRITE_TRACKER = WriteTracker()
@@ -18,7 +18,7 @@
 from . import common
 common.USING_QT = False
 
-import sys, traceback, os.path, signal, logging, logging.handlers, subprocess, optparse, time
+import sys, traceback, os.path, signal, logging, logging.handlers, subprocess, optparse
 import gettext, dbus, dbus.service, dbus.mainloop.glib
 
 import gi
@@ -153,6 +153,18 @@ class Application:
         self.configManager.config_altered(persistGlobal)
         self.notifier.rebuild_menu()
 
+    def items_added(self, targets, persistGlobal=False):
+        self.configManager.items_added(targets, persistGlobal)
+        self.notifier.rebuild_menu()
+
+    def items_removed(self, targets, persistGlobal=False):
+        self.configManager.items_removed(targets, persistGlobal)
+        self.notifier.rebuild_menu()
+
+    def item_changed(self, target, persistGlobal=False):
+        self.configManager.item_changed(target, persistGlobal)
+        self.notifier.rebuild_menu()
+
     def hotkey_created(self, item):
         logging.debug("Created hotkey: %r %s", item.modifiers, item.hotKey)
         self.service.mediator.interface.grab_hotkey(item)
@@ -161,15 +173,8 @@ class Application:
         logging.debug("Removed hotkey: %r %s", item.modifiers, item.hotKey)
         self.service.mediator.interface.ungrab_hotkey(item)
         
-    def path_created_or_modified(self, path):
-        time.sleep(0.5)
-        changed = self.configManager.path_created_or_modified(path)
-        if changed and self.configWindow is not None: 
-            self.configWindow.config_modified()
-        
-    def path_removed(self, path):
-        time.sleep(0.5)
-        changed = self.configManager.path_removed(path)        
+    def paths_changed(self, events):
+        changed = self.configManager.paths_changed(events)
         if changed and self.configWindow is not None: 
             self.configWindow.config_modified()
         
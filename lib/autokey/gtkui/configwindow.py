@@ -38,6 +38,7 @@ from .dialogs import *
 from .settingsdialog import SettingsDialog
 from ..configmanager import *
 from ..iomediator import Recorder
+from ..persistence import WRITE_BEHIND
 from .. import model, common
 
 CONFIG_WINDOW_TITLE = "AutoKey"
@@ -471,7 +472,7 @@ class ScriptPage:
         self.currentItem.showInTrayMenu = self.showInTrayCheckbox.get_active()
         
         self.settingsWidget.save()
-        self.currentItem.persist()
+        self.currentItem.schedule_persist()
         set_linkbutton(self.linkButton, self.currentItem.path)
         
         return False
@@ -657,7 +658,7 @@ class PhrasePage(ScriptPage):
         self.currentItem.sendMode = model.SEND_MODES[self.sendModeCombo.get_active_text()]
         
         self.settingsWidget.save()
-        self.currentItem.persist()
+        self.currentItem.schedule_persist()
         set_linkbutton(self.linkButton, self.currentItem.path)
         return False
         
@@ -848,7 +849,7 @@ class ConfigWindow:
             
     def save_completed(self, persistGlobal):
         self.uiManager.get_action("/MenuBar/File/save").set_sensitive(False)        
-        self.app.config_altered(persistGlobal)
+        self.app.item_changed(self.selectedObject, persistGlobal)
         
     def set_dirty(self, dirty):
         self.dirty = dirty
@@ -957,6 +958,8 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
             self.hide()
             self.destroy()
             self.app.configWindow = None
+            # Closing the window leaves every edit saved in it on disk
+            WRITE_BEHIND.flush()
             self.app.config_altered(True)
             
     def on_quit(self, widget, data=None):
@@ -976,15 +979,14 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         response = dlg.run()
         if response == Gtk.ResponseType.OK:
             path = dlg.get_filename()
-            self.__createFolder(os.path.basename(path), None, path)
-            self.app.monitor.add_watch(path)
+            newFolder = self.__createFolder(os.path.basename(path), None, path)
             dlg.destroy()
-            self.app.config_altered(True)
+            self.app.items_added([newFolder], True)
         elif response == Gtk.ResponseType.NONE:
             dlg.destroy()
             name = self.__getNewItemName("Folder")
-            self.__createFolder(name, None)
-            self.app.config_altered(True)
+            newFolder = self.__createFolder(name, None)
+            self.app.items_added([newFolder], True)
         else:        
             dlg.destroy()
         
@@ -1001,8 +1003,8 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         if name is not None:
             theModel, selectedPaths = self.treeView.get_selection().get_selected_rows()
             parentIter = self.__getRealParent(theModel[selectedPaths[0]].iter)
-            self.__createFolder(name, parentIter)
-            self.app.config_altered(False)
+            newFolder = self.__createFolder(name, parentIter)
+            self.app.items_added([newFolder])
         
     def __createFolder(self, title, parentIter, path=None):
         self.app.monitor.suspend()        
@@ -1017,6 +1019,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         self.treeView.get_selection().unselect_all()
         self.treeView.get_selection().select_iter(newIter)
         self.on_tree_selection_changed(self.treeView)
+        return newFolder
             
     def __getNewItemName(self, itemType):
         dlg = RenameDialog(self.ui, "New %s" % itemType, True, _("Create New %s") % itemType)
@@ -1086,7 +1089,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
             self.treeView.get_selection().select_iter(model.get_iter_first())
             self.on_tree_selection_changed(self.treeView)
             
-        self.app.config_altered(True)    
+        self.app.items_removed(self.cutCopiedItems, True)
     
     def on_copy_item(self, widget, data=None):
         sourceObjects = self.__getTreeSelection()
@@ -1104,8 +1107,9 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         parentIter = self.__getRealParent(theModel[selectedPaths[0]].iter)
         self.app.monitor.suspend()
         
+        pastedItems = self.cutCopiedItems
         newIters = []
-        for item in self.cutCopiedItems:
+        for item in pastedItems:
             newIter = theModel.append_item(item, parentIter)
             if isinstance(item, model.Folder):
                 theModel.populate_store(newIter, item)
@@ -1122,7 +1126,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         self.on_tree_selection_changed(self.treeView)        
         for iter in newIters:
             self.treeView.get_selection().select_iter(iter)        
-        self.app.config_altered(True)
+        self.app.items_added(pastedItems, True)
         
     def on_clone_item(self, widget, data=None):
         source = self.__getTreeSelection()[0]
@@ -1140,7 +1144,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
 
         self.app.monitor.unsuspend()
         newIter = theModel.append_item(newObj, parentIter)
-        self.app.config_altered(False)        
+        self.app.items_added([newObj])
         
     def on_delete_item(self, widget, data=None):
         selection = self.treeView.get_selection()
@@ -1149,7 +1153,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         for path in selectedPaths:
             refs.append(Gtk.TreeRowReference.new(theModel, path))
 
-        modified = False
+        removedItems = []
         
         if len(refs) == 1:
             item = theModel[refs[0].get_path()].iter
@@ -1170,18 +1174,18 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
                     item = theModel[ref.get_path()].iter
                     modelItem = theModel.get_value(item, AkTreeModel.OBJECT_COLUMN)
                     self.__removeItem(theModel, item)
-                    modified = True
+                    removedItems.append(modelItem)
             self.app.monitor.unsuspend()
             
         dlg.destroy()            
         
-        if modified: 
+        if removedItems: 
             if len(selectedPaths) > 1:
                 self.treeView.get_selection().unselect_all()
                 self.treeView.get_selection().select_iter(theModel.get_iter_first())
                 self.on_tree_selection_changed(self.treeView)
             
-            self.app.config_altered(True)
+            self.app.items_removed(removedItems, True)
             
     def __removeItem(self, model, item):
         #selection = self.treeView.get_selection()
@@ -1316,7 +1320,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
                 persistGlobal = self.__getCurrentPage().save()
                 self.refresh_tree()
                 self.app.monitor.unsuspend()
-                self.app.config_altered(persistGlobal)
+                self.app.item_changed(selectedObject, persistGlobal)
             
         dlg.destroy()
     
@@ -1401,6 +1405,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
             
         for path in self.__sourceRows:
             self.__removeItem(theModel, theModel[path].iter)
+        self.app.items_removed(self.__sourceObjects)
         
         newIters = []
         for item in self.__sourceObjects:
@@ -1419,7 +1424,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         for iter in newIters:
             selection.select_iter(iter)
         self.on_tree_selection_changed(self.treeView)
-        self.app.config_altered(True)
+        self.app.items_added(self.__sourceObjects, True)
         
     def __dropRecurseUpdate(self, folder):
         folder.path = None
@@ -54,6 +54,24 @@ def validate(expression, message, widget, parent):
             widget.grab_focus()
     return expression
 
+def confirm_conflicts(conflicts, parent):
+    """
+    Warn about the abbreviations or hotkey of a dialog getting in the way of others.
+
+    @return: whether to use them anyway
+    """
+    if not conflicts:
+        return True
+
+    message = _("These triggers get in the way of others:") + "\n\n"
+    message += "\n".join(str(conflict) for conflict in conflicts)
+    message += "\n\n" + _("Use them anyway?")
+    dlg = Gtk.MessageDialog(parent, Gtk.DialogFlags.MODAL|Gtk.DialogFlags.DESTROY_WITH_PARENT, Gtk.MessageType.WARNING,
+                             Gtk.ButtonsType.YES_NO, message)
+    response = dlg.run()
+    dlg.destroy()
+    return response == Gtk.ResponseType.YES
+
 
 class DialogBase:
 
@@ -242,7 +260,7 @@ class AbbrSettingsDialog(DialogBase):
         if not validate(len(self.get_abbrs()) > 0, _("You must specify at least one abbreviation"),
                             self.addButton, self.ui): return False
 
-        return True
+        return confirm_conflicts(self.configManager.check_conflicts(self.targetItem, self.save), self.ui)
     
     def reset_focus(self):
         self.addButton.grab_focus()
@@ -424,7 +442,7 @@ class HotkeySettingsDialog(DialogBase):
         if not validate(self.key is not None, _("You must specify a key for the hotkey."),
                             None, self.ui): return False
         
-        return True
+        return confirm_conflicts(self.configManager.check_conflicts(self.targetItem, self.save), self.ui)
         
     def on_setButton_pressed(self, widget, data=None):
         self.setButton.set_sensitive(False)
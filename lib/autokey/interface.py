@@ -18,9 +18,11 @@
 __all__ = ["XRecordInterface", "AtSpiInterface"]
 
 
-import os, threading, re, time, socket, select, logging, queue, subprocess
+import os, threading, re, time, socket, select, logging, queue, subprocess, collections
 
-from autokey import common
+from . import common, latency
+from .keycodepool import KeycodePool, OFFSETS, key_events
+from .windowinfo import WindowInfoCache, ActiveWindowTracker
 
 if common.USING_QT:
     from PyQt4.QtGui import QClipboard, QApplication
@@ -65,6 +67,17 @@ MASK_INDEXES = [
 CAPSLOCK_LEDMASK = 1<<0
 NUMLOCK_LEDMASK = 1<<1
 
+# Events selected on the windows whose title and class are cached, to learn when
+# their properties change, they are reparented or destroyed, or lose the focus
+WINDOW_INFO_EVENT_MASK = X.PropertyChangeMask | X.StructureNotifyMask | X.FocusChangeMask
+
+# Events selected on the root window: window creation, and changes of the active window
+ROOT_EVENT_MASK = (X.SubstructureNotifyMask | X.StructureNotifyMask | X.PropertyChangeMask |
+                   X.FocusChangeMask)
+
+# Seconds a new window must live before hotkeys are grabbed for it
+GRAB_DELAY = 1.0
+
 from typing import Union
 
 
@@ -90,6 +103,32 @@ def str_or_bytes_to_bytes(x: Union[str, bytes, memoryview]) -> bytes:
         return x.tobytes()
     raise RuntimeError("x must be str or bytes or memoryview object, type(x)={}, repr(x)={}".format(type(x), repr(x)))
 
+# Keysyms below 0x100 are the Latin-1 characters, and the Euro sign has a keysym
+# equal to its code point. Any other character has the Unicode keysym 0x1000000 + code point.
+EURO_SIGN_KEYSYM = 0x20ac
+
+
+def _keysym_to_char(keySym):
+    """
+    Return the character typed by a keysym, None for function keys and other
+    keysyms that are neither Latin-1 nor Unicode keysyms.
+    """
+    if keySym & 0xff000000 == 0x01000000:
+        return chr(keySym & 0x00ffffff)
+    if 0x20 <= keySym <= 0x7e or 0xa0 <= keySym <= 0xff or keySym == EURO_SIGN_KEYSYM:
+        return chr(keySym)
+
+    return None
+
+
+def _char_to_keysym(char):
+    codePoint = ord(char)
+    if codePoint <= 0xff or codePoint == EURO_SIGN_KEYSYM:
+        return codePoint
+
+    return 0x01000000 | codePoint
+
+
 class XInterfaceBase(threading.Thread):
     """
     Encapsulates the common functionality for the two X interface classes.
@@ -119,6 +158,9 @@ class XInterfaceBase(threading.Thread):
         else:
             self.clipBoard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
             self.selection = Gtk.Clipboard.get(Gdk.SELECTION_PRIMARY)
+        self.remappedChars = None
+        self.windowInfo = WindowInfoCache()
+        self.activeWindow = ActiveWindowTracker()
         self.__initMappings()
 
         # Set initial lock state
@@ -129,6 +171,10 @@ class XInterfaceBase(threading.Thread):
         # Window name atoms
         self.__NameAtom = self.localDisplay.intern_atom("_NET_WM_NAME", True)
         self.__VisibleNameAtom = self.localDisplay.intern_atom("_NET_WM_VISIBLE_NAME", True)
+        self.__windowInfoAtoms = (self.__NameAtom, self.__VisibleNameAtom,
+                                  self.localDisplay.intern_atom("WM_CLASS", True))
+        # X.NONE when the window manager does not support EWMH, leaving only focus events
+        self.__ActiveWindowAtom = self.localDisplay.intern_atom("_NET_ACTIVE_WINDOW", True)
         
         if not (common.USING_QT or common.USING_QT5):
             self.keyMap = Gdk.Keymap.get_default()
@@ -172,7 +218,10 @@ class XInterfaceBase(threading.Thread):
     def __initMappings(self):
         self.localDisplay = display.Display()
         self.rootWindow = self.localDisplay.screen().root
-        self.rootWindow.change_attributes(event_mask=X.SubstructureNotifyMask|X.StructureNotifyMask)
+        # Events for the cached windows were selected on the previous connection
+        self.windowInfo.clear()
+        self.activeWindow.reset()
+        self.rootWindow.change_attributes(event_mask=ROOT_EVENT_MASK)
         
         altList = self.localDisplay.keysym_to_keycodes(XK.XK_ISO_Level3_Shift)
         self.__usableOffsets = (0, 1)
@@ -202,31 +251,92 @@ class XInterfaceBase(threading.Thread):
 
         logger.debug("Modifier masks: %r", self.modMasks)
 
-        self.__grabHotkeys()
-        self.localDisplay.flush()
+        info = self.localDisplay.display.info
+        firstCode = info.min_keycode
+        keyboardMapping = [tuple(keySyms) for keySyms in
+                           self.localDisplay.get_keyboard_mapping(firstCode, info.max_keycode - firstCode + 1)]
+        self.__keyboardMapping = (firstCode, keyboardMapping)
 
-        # --- get list of keycodes that are unused in the current keyboard mapping
+        # --- get list of keycodes that are unused in the current keyboard mapping,
+        # including those still holding the characters remapped before
 
-        keyCode = 8
         avail = []
-        for keyCodeMapping in self.localDisplay.get_keyboard_mapping(keyCode, 200):
-            codeAvail = True
-            for offset in keyCodeMapping:
-                if offset != 0:
-                    codeAvail = False
-                    break
-
-            if codeAvail:
+        for keyCode, keyCodeMapping in enumerate(keyboardMapping, firstCode):
+            if 8 <= keyCode < 208 and (not any(keyCodeMapping) or self.__holdsRemapped(keyCode, keyCodeMapping)):
                 avail.append(keyCode)
 
-            keyCode += 1
+        self.remappedChars = KeycodePool(avail, self.remappedChars)
+        self.__buildKeyTables(firstCode, keyboardMapping, set(avail))
 
-        self.__availableKeycodes = avail
-        self.remappedChars = {}
+        self.__grabHotkeys()
+        self.localDisplay.flush()
 
         if logging.getLogger().getEffectiveLevel() == logging.DEBUG:
             self.keymap_test()
 
+    def __holdsRemapped(self, keyCode, keySyms):
+        return self.remappedChars is not None and keyCode in self.remappedChars.keyCodes and \
+            tuple(keySyms[:len(OFFSETS)]) == self.__remappedKeysyms(keyCode) and not any(keySyms[len(OFFSETS):])
+
+    def __remappedKeysyms(self, keyCode):
+        return tuple(_char_to_keysym(char) if char is not None else 0 for char in self.remappedChars.row(keyCode))
+
+    def __buildKeyTables(self, firstCode, mapping, spareKeycodes):
+        """
+        Build the tables used to find the keycodes to send, from the current keyboard
+        mapping, so that sending never has to search the keymap. Must be rebuilt
+        whenever the keyboard mapping changes.
+
+        @param spareKeycodes: keycodes left out, as they may be remapped at any time
+        """
+        # Keysym -> keycode, the one keysym_to_keycode() returns
+        keysymCodes = {}
+        # Character -> (keycode, offset), the first one at an offset that can be sent
+        charCodes = {}
+        width = max([len(keySyms) for keySyms in mapping] or [0])
+        for offset in range(width):
+            for keyCode, keySyms in enumerate(mapping, firstCode):
+                if offset >= len(keySyms) or keySyms[offset] == X.NoSymbol or keyCode in spareKeycodes:
+                    continue
+
+                keysymCodes.setdefault(keySyms[offset], keyCode)
+                if offset in self.__usableOffsets:
+                    char = _keysym_to_char(keySyms[offset])
+                    if char is not None:
+                        charCodes.setdefault(char, (keyCode, offset))
+
+        self.__keysymCodes = keysymCodes
+        self.__charCodes = charCodes
+        self.__keyNameCodes = dict((keyName, keysymCodes.get(keySym, 0)) for keyName, keySym in AK_TO_XK_MAP.items())
+
+    def __remapKeycodes(self, keyCodes):
+        """
+        Bind the given spare keycodes to the characters the pool assigned them, with
+        one request per run of consecutive keycodes and a single flush.
+
+        The changes are recorded, so the MappingNotify they cause is not taken for a
+        change of keyboard layout.
+        """
+        mappingFirstCode, mapping = self.__keyboardMapping
+        width = len(mapping[0])
+        for firstCode, count in KeycodePool.runs(keyCodes):
+            rows = []
+            for keyCode in range(firstCode, firstCode + count):
+                keySyms = self.__remappedKeysyms(keyCode)
+                keySyms += (0,) * (width - len(keySyms))
+                mapping[keyCode - mappingFirstCode] = keySyms
+                rows.append(keySyms)
+            self.localDisplay.change_keyboard_mapping(firstCode, rows)
+
+        self.localDisplay.flush()
+
+    def __checkKeymap(self):
+        # Rebuild the mappings after a MappingNotify, unless it was caused by remapping
+        firstCode, mapping = self.__keyboardMapping
+        current = self.localDisplay.get_keyboard_mapping(firstCode, len(mapping))
+        if [tuple(keySyms) for keySyms in current] != mapping:
+            self.on_keys_changed()
+
     def keymap_test(self):
         code = self.localDisplay.keycode_to_keysym(108, 0)
         for attr in XK.__dict__.items():
@@ -526,7 +636,7 @@ class XInterfaceBase(threading.Thread):
             else:
                 self.__fillSelection(string)
 
-            focus = self.localDisplay.get_input_focus().focus
+            focus = self.__getFocus()
             xtest.fake_input(focus, X.ButtonPress, X.Button2)
             xtest.fake_input(focus, X.ButtonRelease, X.Button2)
 
@@ -598,14 +708,26 @@ class XInterfaceBase(threading.Thread):
     def begin_send(self):
         self.__enqueue(self.__grab_keyboard)
 
-    def finish_send(self):
-        self.__enqueue(self.__ungrabKeyboard)
+    def finish_send(self, sendStarted=None, keystroke=None):
+        """
+        Release the keyboard once everything queued for sending has been sent.
+
+        @param sendStarted: latency stamp taken when the send began
+        @param keystroke: latency stamp of the keystroke that triggered the send
+        """
+        self.__enqueue(self.__finishSend, sendStarted, keystroke)
+
+    def __finishSend(self, sendStarted, keystroke):
+        self.__ungrabKeyboard()
+        finished = latency.now()
+        latency.TRACKER.record(latency.SEND, sendStarted, finished)
+        latency.TRACKER.record(latency.TOTAL, keystroke, finished)
 
     def grab_keyboard(self):
         self.__enqueue(self.__grab_keyboard)
 
     def __grab_keyboard(self):
-        focus = self.localDisplay.get_input_focus().focus
+        focus = self.__getFocus()
         focus.grab_keyboard(True, X.GrabModeAsync, X.GrabModeAsync, X.CurrentTime)
         self.localDisplay.flush()
 
@@ -616,13 +738,6 @@ class XInterfaceBase(threading.Thread):
         self.localDisplay.ungrab_keyboard(X.CurrentTime)
         self.localDisplay.flush()
 
-    def __findUsableKeycode(self, codeList):
-        for code, offset in codeList:
-            if offset in self.__usableOffsets:
-                return code, offset
-
-        return None, None
-
     def send_string(self, string):
         self.__enqueue(self.__sendString, string)
         
@@ -635,94 +750,75 @@ class XInterfaceBase(threading.Thread):
         if not ConfigManager.SETTINGS[ENABLE_QT4_WORKAROUND]:
             self.__checkWorkaroundNeeded()
 
-        # First find out if any chars need remapping
-        remapNeeded = False
-        for char in string:
-            keyCodeList = self.localDisplay.keysym_to_keycodes(ord(char))
-            usableCode, offset = self.__findUsableKeycode(keyCodeList)
-            if usableCode is None and char not in self.remappedChars:
-                remapNeeded = True
-                break
-
-        # Now we know chars need remapping, do it
-        if remapNeeded:
+        # Bind the chars that no key produces to spare keycodes, unless they still are
+        missing = [char for char in string if char not in self.__charCodes]
+        changed = self.remappedChars.assign(missing)
+        if changed:
             self.__ignoreRemap = True
-            self.remappedChars = {}
-            remapChars = []
-
-            for char in string:
-                keyCodeList = self.localDisplay.keysym_to_keycodes(ord(char))
-                usableCode, offset = self.__findUsableKeycode(keyCodeList)
-                if usableCode is None:
-                    remapChars.append(char)
-
-            logger.debug("Characters requiring remapping: %r", remapChars)
-            availCodes = self.__availableKeycodes
-            logger.debug("Remapping with keycodes in the range: %r", availCodes)
-            mapping = self.localDisplay.get_keyboard_mapping(8, 200)
-            firstCode = 8
-
-            for i in range(len(availCodes) - 1):
-                code = availCodes[i]
-                sym1 = 0
-                sym2 = 0
-
-                if len(remapChars) > 0:
-                    char = remapChars.pop(0)
-                    self.remappedChars[char] = (code, 0)
-                    sym1 = ord(char)
-                if len(remapChars) > 0:
-                    char = remapChars.pop(0)
-                    self.remappedChars[char] = (code, 1)
-                    sym2 = ord(char)
-
-                if sym1 != 0:
-                    mapping[code - firstCode][0] = sym1
-                    mapping[code - firstCode][1] = sym2
-
-            mapping = [tuple(l) for l in mapping]
-            self.localDisplay.change_keyboard_mapping(firstCode, mapping)
-            self.localDisplay.flush()
-
-        focus = self.localDisplay.get_input_focus().focus
+            logger.debug("Remapping keycodes %r for characters %r", changed, missing)
+            self.__remapKeycodes(changed)
 
+        keys = []
         for char in string:
-            try:
-                keyCodeList = self.localDisplay.keysym_to_keycodes(ord(char))
-                keyCode, offset = self.__findUsableKeycode(keyCodeList)
-                if keyCode is not None:
-                    if offset == 0:
-                        self.__sendKeyCode(keyCode, theWindow=focus)
-                    if offset == 1:
-                        self.__pressKey(Key.SHIFT)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.SHIFT], focus)
-                        self.__releaseKey(Key.SHIFT)
-                    if offset == 4:
-                        self.__pressKey(Key.ALT_GR)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.ALT_GR], focus)
-                        self.__releaseKey(Key.ALT_GR)
-                    if offset == 5:
-                        self.__pressKey(Key.ALT_GR)
-                        self.__pressKey(Key.SHIFT)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.ALT_GR]|self.modMasks[Key.SHIFT], focus)
-                        self.__releaseKey(Key.SHIFT)
-                        self.__releaseKey(Key.ALT_GR)
-
-                elif char in self.remappedChars:
-                    keyCode, offset = self.remappedChars[char]
-                    if offset == 0:
-                        self.__sendKeyCode(keyCode, theWindow=focus)
-                    if offset == 1:
-                        self.__pressKey(Key.SHIFT)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.SHIFT], focus)
-                        self.__releaseKey(Key.SHIFT)
-                else:
-                    logger.warn("Unable to send character %r", char)
-            except Exception as e:
-                logger.exception("Error sending char %r: %s", char, str(e))
+            key = self.__charCodes.get(char) or self.remappedChars.lookup(char)
+            if key is not None:
+                keys.append(key)
+            else:
+                logger.warn("Unable to send character %r", char)
+
+        try:
+            self.__sendKeys(keys, self.__getFocus())
+        except Exception as e:
+            logger.exception("Error sending string %r: %s", string, str(e))
 
         self.__ignoreRemap = False
 
+    def __sendKeys(self, keys, focus):
+        """
+        Send the given (keycode, offset) pairs to the focused window in one go.
+
+        The focus is resolved once by the caller and the events for each distinct key
+        are built only once. Nothing reaches the X server until the single flush at
+        the end, unless the QT4 workaround needs to pause between repeated keys.
+        """
+        modifierCodes = dict((modifier, self.__lookupKeyCode(modifier))
+                             for keyCode, offset in keys for modifier in OFFSET_MODIFIERS[offset])
+        workaround = ConfigManager.SETTINGS[ENABLE_QT4_WORKAROUND] or self.__enableQT4Workaround
+        events = {}
+
+        for press, key, modifiers in key_events(keys, OFFSET_MODIFIERS):
+            eventType = X.KeyPress if press else X.KeyRelease
+            if modifiers is None:
+                keyCode = modifierCodes[key]
+                state = 0
+            else:
+                keyCode = key
+                state = 0
+                for modifier in modifiers:
+                    state |= self.modMasks[modifier]
+                if workaround and press:
+                    self.__doQT4Workaround(keyCode)
+
+            keyEvent = events.get((eventType, keyCode, state))
+            if keyEvent is None:
+                keyEvent = KEY_EVENT_CLASSES[eventType](
+                                      detail=keyCode,
+                                      time=X.CurrentTime,
+                                      root=self.rootWindow,
+                                      window=focus,
+                                      child=X.NONE,
+                                      root_x=1,
+                                      root_y=1,
+                                      event_x=1,
+                                      event_y=1,
+                                      state=state,
+                                      same_screen=1
+                                      )
+                events[(eventType, keyCode, state)] = keyEvent
+            focus.send_event(keyEvent)
+
+        self.localDisplay.flush()
+
 
     def send_key(self, keyName):
         """
@@ -769,9 +865,10 @@ class XInterfaceBase(threading.Thread):
             for mod in modifiers:
                 mask |= self.modMasks[mod]
             keyCode = self.__lookupKeyCode(keyName)
-            for mod in modifiers: self.__pressKey(mod)
-            self.__sendKeyCode(keyCode, mask)
-            for mod in modifiers: self.__releaseKey(mod)
+            focus = self.__getFocus()
+            for mod in modifiers: self.__pressKey(mod, focus)
+            self.__sendKeyCode(keyCode, mask, focus)
+            for mod in modifiers: self.__releaseKey(mod, focus)
         except Exception as e:
             logger.warn("Error sending modified key %r %r: %s", modifiers, keyName, str(e))
 
@@ -783,7 +880,7 @@ class XInterfaceBase(threading.Thread):
         pos = self.rootWindow.query_pointer()
 
         if relative:
-            focus = self.localDisplay.get_input_focus().focus
+            focus = self.__getFocus()
             focus.warp_pointer(xCoord, yCoord)
             xtest.fake_input(focus, X.ButtonPress, button, x=xCoord, y=yCoord)
             xtest.fake_input(focus, X.ButtonRelease, button, x=xCoord, y=yCoord)
@@ -824,51 +921,102 @@ class XInterfaceBase(threading.Thread):
     def press_key(self, keyName):
         self.__enqueue(self.__pressKey, keyName)
         
-    def __pressKey(self, keyName):
-        self.__sendKeyPressEvent(self.__lookupKeyCode(keyName), 0)
+    def __pressKey(self, keyName, theWindow=None):
+        self.__sendKeyPressEvent(self.__lookupKeyCode(keyName), 0, theWindow)
 
     def release_key(self, keyName):
         self.__enqueue(self.__releaseKey, keyName)
         
-    def __releaseKey(self, keyName):
-        self.__sendKeyReleaseEvent(self.__lookupKeyCode(keyName), 0)
+    def __releaseKey(self, keyName, theWindow=None):
+        self.__sendKeyReleaseEvent(self.__lookupKeyCode(keyName), 0, theWindow)
 
     def __flushEvents(self):
+        # Window id -> (window, creation time) of the windows waiting for their hotkeys
+        # to be grabbed. Events are handled straight away, so cached window titles are
+        # invalidated as soon as they change, but windows that are destroyed within
+        # GRAB_DELAY never have their hotkeys grabbed.
+        createdWindows = collections.OrderedDict()
         while True:
             try:
-                readable, w, e = select.select([self.localDisplay], [], [], 1)
-                time.sleep(1)
-                if self.localDisplay in readable:
-                    createdWindows = []
-                    destroyedWindows = []
-                    
-                    for x in range(self.localDisplay.pending_events()):
+                # Xlib may already have read events from the socket into its own queue,
+                # e.g. while waiting for the reply to a request, so the socket is only
+                # waited on when that queue is empty
+                pending = self.localDisplay.pending_events()
+                if not pending:
+                    select.select([self.localDisplay], [], [], GRAB_DELAY / 4)
+                    pending = self.localDisplay.pending_events()
+
+                if pending:
+                    keymapChanged = False
+                    focusChanged = False
+                    infoChanged = False
+
+                    for x in range(pending):
                         event = self.localDisplay.next_event()
                         if event.type == X.CreateNotify:
-                            createdWindows.append(event.window)
-                        if event.type == X.DestroyNotify:
-                            destroyedWindows.append(event.window)
-                            
-                    for window in createdWindows:
-                        if window not in destroyedWindows:
-                            self.__enqueue(self.__grabHotkeysForWindow, window)
+                            createdWindows[event.window.id] = (event.window, time.time())
+                        elif event.type == X.DestroyNotify:
+                            createdWindows.pop(event.window.id, None)
+                            self.windowInfo.invalidate(event.window.id)
+                        elif event.type == X.PropertyNotify:
+                            if event.atom in self.__windowInfoAtoms:
+                                self.windowInfo.invalidate(event.window.id)
+                                infoChanged = True
+                            elif event.atom == self.__ActiveWindowAtom and self.__ActiveWindowAtom:
+                                focusChanged = True
+                        elif event.type in (X.FocusIn, X.FocusOut):
+                            # Fallback for window managers that do not set _NET_ACTIVE_WINDOW.
+                            # Focus events caused by keyboard grabs, like those of hotkeys,
+                            # do not move the focus.
+                            if event.mode in (X.NotifyNormal, X.NotifyWhileGrabbed):
+                                focusChanged = True
+                        elif event.type == X.ReparentNotify:
+                            self.windowInfo.invalidate(event.window.id)
+                        elif event.type == X.MappingNotify and event.request == X.MappingKeyboard:
+                            keymapChanged = True
+
+                    if keymapChanged:
+                        self.__enqueue(self.__checkKeymap)
+
+                    if focusChanged:
+                        # Keypresses handled from now on query the focus themselves
+                        self.activeWindow.reset()
+                        self.__enqueue(self.__updateActiveWindow)
+                    if infoChanged:
+                        self.activeWindow.info_changed()
+
+                grabBefore = time.time() - GRAB_DELAY
+                while createdWindows:
+                    window, created = next(iter(createdWindows.values()))
+                    if created > grabBefore:
+                        break
+                    createdWindows.popitem(last=False)
+                    self.__enqueue(self.__grabHotkeysForWindow, window)
 
                 if self.shutdown:
                     break
-            except:
-                pass
+            except error.ConnectionClosedError:
+                logger.exception("Connection to the X server closed, no longer handling window events")
+                break
+            except Exception:
+                logger.exception("Error handling window events")
 
-    def handle_keypress(self, keyCode):
-        self.__enqueue(self.__handleKeyPress, keyCode)
+    def handle_keypress(self, keyCode, received=None):
+        self.__enqueue(self.__handleKeyPress, keyCode, received)
     
-    def __handleKeyPress(self, keyCode):
-        focus = self.localDisplay.get_input_focus().focus
+    def __handleKeyPress(self, keyCode, received):
+        started = latency.TRACKER.stamp()
+        latency.TRACKER.record(latency.EVENT_QUEUE, received, started)
+        focus = self.__getFocus()
 
         modifier = self.__decodeModifier(keyCode)
         if modifier is not None:
             self.mediator.handle_modifier_down(modifier)
         else:
-            self.mediator.handle_keypress(keyCode, self.get_window_title(focus), self.get_window_class(focus))
+            windowTitle = self.get_window_title(focus)
+            windowClass = self.get_window_class(focus)
+            latency.TRACKER.record(latency.WINDOW_INFO, started)
+            self.mediator.handle_keypress(keyCode, windowTitle, windowClass, received)
 
     def handle_keyrelease(self, keyCode):
         self.__enqueue(self.__handleKeyrelease, keyCode)
@@ -887,10 +1035,10 @@ class XInterfaceBase(threading.Thread):
         info = (title, klass)
         
         if x is None and y is None:
-            ret = self.localDisplay.get_input_focus().focus.query_pointer()
+            ret = self.__getFocus().query_pointer()
             self.mediator.handle_mouse_click(ret.root_x, ret.root_y, ret.win_x, ret.win_y, button, info)
         else:
-            focus = self.localDisplay.get_input_focus().focus
+            focus = self.__getFocus()
             try:
                 rel = focus.translate_coords(self.rootWindow, x, y)
                 self.mediator.handle_mouse_click(x, y, rel.x, rel.y, button, info)
@@ -915,7 +1063,7 @@ class XInterfaceBase(threading.Thread):
         self.__sendKeyReleaseEvent(keyCode, modifiers, theWindow)
 
     def __checkWorkaroundNeeded(self):
-        focus = self.localDisplay.get_input_focus().focus
+        focus = self.__getFocus()
         windowName = self.get_window_title(focus)
         windowClass = self.get_window_class(focus)
         w = self.app.configManager.workAroundApps
@@ -937,7 +1085,7 @@ class XInterfaceBase(threading.Thread):
 
     def __sendKeyPressEvent(self, keyCode, modifiers, theWindow=None):
         if theWindow is None:
-            focus = self.localDisplay.get_input_focus().focus
+            focus = self.__getFocus()
         else:
             focus = theWindow
         keyEvent = event.KeyPress(
@@ -957,7 +1105,7 @@ class XInterfaceBase(threading.Thread):
 
     def __sendKeyReleaseEvent(self, keyCode, modifiers, theWindow=None):
         if theWindow is None:
-            focus = self.localDisplay.get_input_focus().focus
+            focus = self.__getFocus()
         else:
             focus = theWindow
         keyEvent = event.KeyRelease(
@@ -976,13 +1124,13 @@ class XInterfaceBase(threading.Thread):
         focus.send_event(keyEvent)
 
     def __lookupKeyCode(self, char):
-        if char in AK_TO_XK_MAP:
-            return self.localDisplay.keysym_to_keycode(AK_TO_XK_MAP[char])
+        if char in self.__keyNameCodes:
+            return self.__keyNameCodes[char]
         elif char.startswith("<code"):
             return int(char[5:-1])
         else:
             try:
-                return self.localDisplay.keysym_to_keycode(ord(char))
+                return self.__keysymCodes.get(ord(char), 0)
             except Exception as e:
                 logger.error("Unknown key name: %s", char)
                 raise
@@ -990,10 +1138,12 @@ class XInterfaceBase(threading.Thread):
     def get_window_title(self, window=None, traverse=True):
         try:
             if window is None:
-                windowvar = self.localDisplay.get_input_focus().focus
+                windowvar = self.__getFocus()
             else:
                 windowvar = window
 
+            if traverse and not isinstance(windowvar, int):
+                return self.__getWindowInfo(windowvar)[0]
             return self.__getWinTitle(windowvar, traverse)
 
         except AttributeError as e:
@@ -1006,24 +1156,27 @@ class XInterfaceBase(threading.Thread):
         except:  # Default handler
             return ""
 
-    def __getWinTitle(self, windowvar, traverse):
+    def __getWinTitle(self, windowvar, traverse, sources=None):
+        self.__watchWindow(windowvar, sources)
         atom = windowvar.get_property(self.__VisibleNameAtom, 0, 0, 255)
         if atom is None:
             atom = windowvar.get_property(self.__NameAtom, 0, 0, 255)
         if atom:
             return atom.value #.decode("utf-8")
         elif traverse:
-            return self.__getWinTitle(windowvar.query_tree().parent, True)
+            return self.__getWinTitle(windowvar.query_tree().parent, True, sources)
         else:
             return ""
 
     def get_window_class(self, window=None, traverse=True):
         try:
             if window is None:
-                windowvar = self.localDisplay.get_input_focus().focus
+                windowvar = self.__getFocus()
             else:
                 windowvar = window
 
+            if traverse and not isinstance(windowvar, int):
+                return self.__getWindowInfo(windowvar)[1]
             return self.__getWinClass(windowvar, traverse)
         except AttributeError as e:
             if str(e)=="'int' object has no attribute 'get_wm_class'":
@@ -1035,16 +1188,65 @@ class XInterfaceBase(threading.Thread):
         # except:
         #     return ""
     
-    def __getWinClass(self, windowvar, traverse):
+    def __getWinClass(self, windowvar, traverse, sources=None):
+        self.__watchWindow(windowvar, sources)
         wmclass = windowvar.get_wm_class()
 
         if (wmclass == None or wmclass == ""):
             if traverse:
-                return self.__getWinClass(windowvar.query_tree().parent, True)
+                return self.__getWinClass(windowvar.query_tree().parent, True, sources)
             else:
                 return ""
 
         return wmclass[0] + '.' + wmclass[1]
+
+    def __getFocus(self):
+        """
+        Return the window that has the input focus, asking the X server only if it
+        has moved since it was last asked for.
+        """
+        focus = self.activeWindow.window
+        if focus is None:
+            token = self.activeWindow.begin()
+            focus = self.localDisplay.get_input_focus().focus
+            if not isinstance(focus, int):
+                # Learn when it loses the focus, even without _NET_ACTIVE_WINDOW
+                self.__watchWindow(focus, [])
+            self.activeWindow.set_window(focus, getattr(focus, "id", focus), token)
+
+        return focus
+
+    def __updateActiveWindow(self):
+        # The input focus rather than _NET_ACTIVE_WINDOW itself, which names the top
+        # level window while the focus may be on one of its children
+        if self.activeWindow.window is None:
+            self.__getFocus()
+
+    def __getWindowInfo(self, window):
+        """
+        Return the (title, class) of a window and its ancestors, from the cache if
+        possible, so that no X round trips are needed for windows seen before.
+        """
+        info = self.windowInfo.get(window.id)
+        if info is not None:
+            return info
+
+        token = self.windowInfo.begin()
+        sources = []
+        title = str_or_bytes_to_str(self.__getWinTitle(window, True, sources))
+        info = (title, self.__getWinClass(window, True, sources))
+        self.windowInfo.put(window.id, info, sources, token)
+        return info
+
+    def __watchWindow(self, window, sources):
+        # Ask for the events that invalidate the cached information read from a window.
+        # The root window is left alone, as that would replace the events selected on it.
+        if sources is None or window == self.rootWindow:
+            return
+
+        if window.id not in sources:
+            window.change_attributes(event_mask=WINDOW_INFO_EVENT_MASK)
+            sources.append(window.id)
     
     def cancel(self):
         self.queue.put_nowait((None, None))
@@ -1104,16 +1306,19 @@ class XRecordInterface(XInterfaceBase):
             # not an event
             return
 
+        received = latency.TRACKER.stamp()
         data = reply.data
         while len(data):
             event, data = rq.EventField(None).parse_binary_value(data, self.recordDisplay.display, None, None)
             if event.type == X.KeyPress:
-                self.handle_keypress(event.detail)
+                self.handle_keypress(event.detail, received)
             elif event.type == X.KeyRelease:
                 self.handle_keyrelease(event.detail)
             elif event.type == X.ButtonPress:
                 self.handle_mouseclick(event.detail, event.root_x, event.root_y)
 
+        latency.TRACKER.record(latency.RECORD, received)
+
 
 class AtSpiInterface(XInterfaceBase):
 
@@ -1221,6 +1426,19 @@ XK_TO_AK_MAP = {
 
 AK_TO_XK_MAP = dict((v,k) for k, v in XK_TO_AK_MAP.items())
 
+KEY_EVENT_CLASSES = {
+           X.KeyPress : event.KeyPress,
+           X.KeyRelease : event.KeyRelease
+           }
+
+# Modifiers to hold down for the symbol at each usable offset of a keycode's keysyms
+OFFSET_MODIFIERS = {
+           0 : (),
+           1 : (Key.SHIFT,),
+           4 : (Key.ALT_GR,),
+           5 : (Key.ALT_GR, Key.SHIFT)
+           }
+
 XK_TO_AK_NUMLOCKED = {
            XK.XK_KP_Insert : "0",
            XK.XK_KP_Delete : ".",
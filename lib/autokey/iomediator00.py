@@ -1,6 +1,7 @@
 import datetime, time, threading, queue, re, logging
 from .configmanager import ConfigManager
 from .configmanager_constants import INTERFACE_TYPE
+from . import latency
 from .iomediator_Key import Key
 from .iomediator_constants import X_RECORD_INTERFACE, KEY_SPLIT_RE
 
@@ -51,7 +52,7 @@ class IoMediator(threading.Thread):
         
     def shutdown(self):
         self.interface.cancel()
-        self.queue.put_nowait((None, None, None))
+        self.queue.put_nowait((None, None, None, None, None))
         self.join()
 
     # Callback methods for Interfaces ----
@@ -82,16 +83,18 @@ class IoMediator(threading.Thread):
         if not modifier in (Key.CAPSLOCK, Key.NUMLOCK):
             self.modifiers[modifier] = False
     
-    def handle_keypress(self, keyCode, windowName, windowClass):
+    def handle_keypress(self, keyCode, windowName, windowClass, received=None):
         """
         Looks up the character for the given key code, applying any 
         modifiers currently in effect, and passes it to the expansion service.
+
+        @param received: latency stamp taken when the X event was received
         """
-        self.queue.put_nowait((keyCode, windowName, windowClass))
+        self.queue.put_nowait((keyCode, windowName, windowClass, received, latency.TRACKER.stamp()))
         
     def run(self):
         while True:
-            keyCode, windowName, windowClass = self.queue.get()
+            keyCode, windowName, windowClass, received, queued = self.queue.get()
             if keyCode is None and windowName is None:
                 break
             
@@ -100,6 +103,9 @@ class IoMediator(threading.Thread):
             shifted = self.modifiers[Key.CAPSLOCK] ^ self.modifiers[Key.SHIFT]
             key = self.interface.lookup_string(keyCode, shifted, numLock, self.modifiers[Key.ALT_GR])
             rawKey = self.interface.lookup_string(keyCode, False, False, False)
+            latency.TRACKER.record(latency.MEDIATOR, queued)
+            # Lets the listeners attribute their work to this keystroke
+            latency.TRACKER.set_keystroke(received)
             
             for target in self.listeners:
                 target.handle_keypress(rawKey, modifiers, key, windowName, windowClass)                
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Assignment of characters missing from the keyboard mapping to spare keycodes, and
+planning of the key events that type a string.
+
+This module must not import the rest of AutoKey.
+"""
+
+import collections
+
+# Keysym offsets of a spare keycode that are used: unshifted and shifted
+OFFSETS = (0, 1)
+
+
+class KeycodePool:
+    """
+    Keeps characters that no key produces bound to spare keycodes, two characters per
+    keycode, for as long as their slot is not needed for another character.
+
+    Characters stay assigned across sends, so sending the same characters again does
+    not change the keyboard mapping at all. When all slots are taken, the characters
+    used least recently give up theirs.
+
+    The pool only does the bookkeeping; the caller changes the keyboard mapping for
+    the keycodes returned by L{assign}.
+    """
+
+    def __init__(self, keyCodes, previous=None):
+        """
+        @param keyCodes: spare keycodes, in the order in which they are handed out
+        @param previous: pool whose assignments to any of the given keycodes are kept
+        """
+        self.keyCodes = tuple(keyCodes)
+        # Character -> (keycode, offset), least recently used first
+        self.__chars = collections.OrderedDict()
+        self.__slots = {}
+        self.__free = collections.deque()
+
+        kept = set()
+        if previous is not None:
+            for char, slot in previous.__chars.items():
+                if slot[0] in self.keyCodes:
+                    self.__chars[char] = slot
+                    self.__slots[slot] = char
+                    kept.add(slot)
+
+        for keyCode in self.keyCodes:
+            for offset in OFFSETS:
+                if (keyCode, offset) not in kept:
+                    self.__free.append((keyCode, offset))
+
+    def __len__(self):
+        return len(self.__chars)
+
+    def __contains__(self, char):
+        return char in self.__chars
+
+    def lookup(self, char):
+        """
+        Return the (keycode, offset) the character is bound to, None if it is not.
+        """
+        return self.__chars.get(char)
+
+    def row(self, keyCode):
+        """
+        Return the characters bound to the offsets of a keycode, None for free slots.
+        """
+        return tuple(self.__slots.get((keyCode, offset)) for offset in OFFSETS)
+
+    def assign(self, chars):
+        """
+        Bind the given characters to keycodes, marking them as recently used.
+
+        Characters that do not fit, because there are more of them than slots, are
+        left unbound.
+
+        @return: sorted list of the keycodes whose mapping must be changed
+        """
+        needed = set(chars)
+        changed = set()
+        for char in chars:
+            if char in self.__chars:
+                self.__chars.move_to_end(char)
+                continue
+
+            slot = self.__take(needed)
+            if slot is None:
+                continue
+
+            self.__chars[char] = slot
+            self.__slots[slot] = char
+            changed.add(slot[0])
+
+        return sorted(changed)
+
+    def __take(self, needed):
+        if self.__free:
+            return self.__free.popleft()
+
+        for char, slot in self.__chars.items():
+            if char not in needed:
+                del self.__chars[char]
+                del self.__slots[slot]
+                return slot
+
+        return None
+
+    @staticmethod
+    def runs(keyCodes):
+        """
+        Split a sorted list of keycodes into runs of consecutive keycodes, so that
+        each run can be changed with one request.
+
+        @return: list of (first keycode, number of keycodes)
+        """
+        runs = []
+        for keyCode in keyCodes:
+            if runs and runs[-1][0] + runs[-1][1] == keyCode:
+                runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+            else:
+                runs.append((keyCode, 1))
+
+        return runs
+
+
+def key_events(keys, offsetModifiers):
+    """
+    Plan the key events that type the given keys. The modifiers each offset needs are
+    pressed around its keys, and stay pressed while consecutive keys need the same ones.
+
+    @param keys: list of (keycode, offset)
+    @param offsetModifiers: dictionary of offset -> tuple of the modifiers it needs
+    @return: list of (press, key, modifiers). For the keys themselves, key is the
+    keycode and modifiers those held for it. For the presses and releases of the
+    modifiers, key is the modifier and modifiers is None.
+    """
+    events = []
+    held = ()
+    for keyCode, offset in keys:
+        modifiers = offsetModifiers[offset]
+        if modifiers != held:
+            for modifier in reversed(held):
+                events.append((False, modifier, None))
+            for modifier in modifiers:
+                events.append((True, modifier, None))
+            held = modifiers
+
+        events.append((True, keyCode, modifiers))
+        events.append((False, keyCode, modifiers))
+
+    for modifier in reversed(held):
+        events.append((False, modifier, None))
+
+    return events
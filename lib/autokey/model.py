@@ -15,10 +15,17 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import re, os, os.path, glob, logging
+import re, os, os.path, glob, logging, threading
 from .configmanager import *
-from .iomediator import Key, NAVIGATION_KEYS, KEY_SPLIT_RE
+# Not from iomediator, which would pull in the X interface and the UI toolkits
+from .iomediator_Key import Key
+from .iomediator_constants import NAVIGATION_KEYS, KEY_SPLIT_RE
 from .scripting_Store import Store
+from .triggerindex import WindowFilterCache
+from .contentcache import ContentCache
+from .fsevents import WRITE_TRACKER
+from .persistence import WRITE_BEHIND, atomic_write
+from .usagestats import USAGE_STATS
 
 _logger = logging.getLogger("model")
 
@@ -27,6 +34,16 @@ DEFAULT_WORDCHAR_REGEX = '[\w]'
 JSON_FILE_PATTERN = "%s/.%s.json"
 SPACES_RE = re.compile(r"^ | $")
 
+# Shared by all window filters. Invalidated once by ConfigManager whenever changes to the
+# configuration are applied, not by the setters, which are also called for every item loaded
+WINDOW_FILTER_CACHE = WindowFilterCache()
+
+# Bodies of phrases and scripts loaded in lazy content mode
+CONTENT_CACHE = ContentCache()
+
+# Guards the body of a phrase or script against edits while WRITE_BEHIND writes it
+_CONTENT_LOCK = threading.Lock()
+
 def make_wordchar_re(wordChars):
     return "[^%s]" % wordChars
 
@@ -39,7 +56,54 @@ def get_value_or_default(jsonData, key, default):
     else:
         return default
     
-def get_safe_path(basePath, name, ext=""):
+def _write_settings(target, jsonPath):
+    """
+    Write the settings of a folder, phrase or script, unless the file already holds
+    exactly these settings because they were written before.
+    """
+    settings = json.dumps(target.get_serializable(), indent=4)
+    saved = (jsonPath, hash(settings))
+    if target._savedSettings != saved:
+        atomic_write(jsonPath, settings)
+        target._savedSettings = saved
+
+def _moved_settings(target, oldJson, newJson):
+    if target._savedSettings is not None and target._savedSettings[0] == oldJson:
+        target._savedSettings = (newJson, target._savedSettings[1])
+
+def _write_content(target, name):
+    """
+    Write the body of a phrase or script (its C{name} attribute), unless the file at
+    its path already holds it. The body may be edited by another thread while it is
+    written: such an edit stays unsaved, and is kept in lazy content mode.
+    """
+    with _CONTENT_LOCK:
+        path = target.path
+        saved = target._savedContent
+        if saved == path:
+            return
+        content = getattr(target, name)
+        target._savedContent = path
+
+    try:
+        atomic_write(path, content)
+    except:
+        with _CONTENT_LOCK:
+            if target._savedContent == path:
+                target._savedContent = saved
+        raise
+
+    with _CONTENT_LOCK:
+        # The setters reset _savedContent, so it only still matches without an edit
+        if target._savedContent == path:
+            CONTENT_CACHE.invalidate(target)
+            if ConfigManager.SETTINGS[LAZY_CONTENT]:
+                setattr(target, '_' + name, None)
+
+def get_safe_path(basePath, name, ext="", taken=()):
+    """
+    Return a path for a new folder or item that neither exists nor is in C{taken}.
+    """
     name = SPACES_RE.sub('_', name)
     safeName = ''.join([char for char in name if char.isalnum() or char in "_ -."])
     
@@ -52,7 +116,7 @@ def get_safe_path(basePath, name, ext=""):
         jsonPath = basePath + '/.' + safeName + ".json"
         n = 1
 
-    while os.path.exists(path) or os.path.exists(jsonPath):
+    while path in taken or os.path.exists(path) or os.path.exists(jsonPath):
         path = basePath + '/' + safeName + str(n) + ext
         jsonPath = basePath + '/.' + safeName + str(n) + ".json"
         n += 1
@@ -274,12 +338,16 @@ class AbstractWindowFilter:
         return None
 
     def _should_trigger_window_title(self, windowInfo):
-        from . import interface
-        r = self.get_applicable_regex()
+        r = WINDOW_FILTER_CACHE.applicable_regex(self)
         if r is not None:
-            return r.match(interface.str_or_bytes_to_str(windowInfo[0])) or r.match(windowInfo[1])
+            return WINDOW_FILTER_CACHE.matches(r, windowInfo, _match_window_info)
         else:
             return True
+
+
+def _match_window_info(regex, windowInfo):
+    from . import interface
+    return regex.match(interface.str_or_bytes_to_str(windowInfo[0])) or regex.match(windowInfo[1])
             
           
             
@@ -355,6 +423,7 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         self.showInTrayMenu = showInTrayMenu
         self.parent = None
         self.path = path
+        self._savedSettings = None
         
     def build_path(self, baseName=None):
         if baseName is None:
@@ -371,9 +440,10 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         
         if not os.path.exists(self.path):
             os.mkdir(self.path)
-        
-        with open(self.path + "/.folder.json", 'w') as outFile:
-            json.dump(self.get_serializable(), outFile, indent=4)
+            WRITE_TRACKER.written(self.path)
+            self._savedSettings = None
+
+        _write_settings(self, self.path + "/.folder.json")
 
     def get_serializable(self):
         d = {
@@ -425,6 +495,7 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
                     self.items.append(i)
                 
     def load_from_serialized(self):
+        self._savedSettings = None
         try:
             with open(self.path + "/.folder.json", 'r') as inFile:
                 data = json.load(inFile)
@@ -446,10 +517,17 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         
     def rebuild_path(self):
         if self.path is not None:
+            # Pending writes of the contents go to the old paths
+            WRITE_BEHIND.flush()
             oldName = self.path
             self.path = get_safe_path(os.path.split(oldName)[0], self.title)            
             self.update_children()            
             os.rename(oldName, self.path)
+            WRITE_TRACKER.removed(oldName)
+            WRITE_TRACKER.written(self.path)
+            _moved_settings(self, oldName + "/.folder.json", self.path + "/.folder.json")
+            USAGE_STATS.moved(oldName, self.path)
+            Store.moved(oldName, self.path)
         else:
             self.build_path()     
             
@@ -463,10 +541,13 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         
     def remove_data(self):
         if self.path is not None:
+            WRITE_BEHIND.flush()
             try:
                 shutil.rmtree(self.path)
             except OSError:
                 pass
+            WRITE_TRACKER.removed(self.path)
+            self._savedSettings = None
         
     def get_tuple(self):
         return ("folder", self.title, self.get_abbreviations(), self.get_hotkey_string(), self)
@@ -507,10 +588,13 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         else:
             return False
         
-    def increment_usage_count(self):
-        self.usageCount += 1
-        if self.parent is not None:
-            self.parent.increment_usage_count()
+    def get_usage_count(self):
+        """
+        Return how often the phrases and scripts in this folder and its subfolders
+        were used. The C{usageCount} saved with the folder only holds the uses counted
+        before the usage statistics log existed.
+        """
+        return self.usageCount + USAGE_STATS.folder_uses(self.path)
         
     def get_backspace_count(self, buffer):
         """
@@ -534,10 +618,11 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         """
         if TriggerMode.ABBREVIATION in self.modes and self.backspace:
             if self._should_trigger_abbreviation(buffer):
+                abbr = self._get_trigger_abbreviation(buffer)
                 if self.immediate:
-                    return len(self.abbreviation)
+                    return len(abbr)
                 else:
-                    return len(self.abbreviation) + 1
+                    return len(abbr) + 1
                         
         if self.parent is not None:
             return self.parent.calculate_input(buffer)
@@ -613,6 +698,31 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         self.showInTrayMenu = False
         self.sendMode = SendMode.KEYBOARD
         self.path = path
+        self._savedSettings = None
+
+    @property
+    def phrase(self):
+        """
+        The phrase text. In lazy content mode it is read from the file on first use,
+        and only kept in memory as long as the content cache budget allows.
+        """
+        if self._phrase is None:
+            return CONTENT_CACHE.read(self, self.path)
+
+        return self._phrase
+
+    @phrase.setter
+    def phrase(self, phrase):
+        with _CONTENT_LOCK:
+            self._phrase = phrase
+            self._savedContent = None
+
+    def mark_saved(self):
+        """
+        Record that the file at C{path} holds the current phrase text, e.g. because it
+        was just read from there, so L{persist} does not write it again.
+        """
+        self._savedContent = self.path
 
     def build_path(self, baseName=None):        
         if baseName is None:
@@ -629,12 +739,20 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         if self.path is None:
             self.build_path()
             
-        with open(self.get_json_path(), 'w') as jsonFile:
-            json.dump(self.get_serializable(), jsonFile, indent=4)
-                
-        with open(self.path, "w") as outFile:
-            outFile.write(self.phrase)
-            # outFile.write(self.phrase.encode("utf-8"))
+        _write_settings(self, self.get_json_path())
+
+        # Only rewritten when the text was changed, or the item moved
+        _write_content(self, "phrase")
+
+    def schedule_persist(self):
+        """
+        Save the phrase later, on the C{WRITE_BEHIND} thread. A new phrase
+        is written right away instead, so no other new item can take its file name.
+        """
+        if self.path is None:
+            self.persist()
+        else:
+            WRITE_BEHIND.schedule(self)
 
     def get_serializable(self):
         d = {
@@ -657,8 +775,13 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
     def load(self, parent):
         self.parent = parent
         
-        with open(self.path, "r") as inFile:
-            self.phrase = inFile.read()
+        CONTENT_CACHE.invalidate(self)
+        if ConfigManager.SETTINGS[LAZY_CONTENT]:
+            self._phrase = None
+        else:
+            with open(self.path, "r") as inFile:
+                self.phrase = inFile.read()
+        self.mark_saved()
         
         if os.path.exists(self.get_json_path()):           
             self.load_from_serialized()
@@ -666,6 +789,7 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
             self.description = os.path.basename(self.path)[:-4]
 
     def load_from_serialized(self):
+        self._savedSettings = None
         try:
             with open(self.get_json_path(), "r") as jsonFile:
                 data = json.load(jsonFile)
@@ -689,20 +813,34 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         
     def rebuild_path(self):
         if self.path is not None:
+            WRITE_BEHIND.flush(self)
             oldName = self.path
             oldJson = self.get_json_path()
             self.build_path()
             os.rename(oldName, self.path)
             os.rename(oldJson, self.get_json_path())
+            for path in (oldName, oldJson):
+                WRITE_TRACKER.removed(path)
+            for path in (self.path, self.get_json_path()):
+                WRITE_TRACKER.written(path)
+            if self._savedContent == oldName:
+                self._savedContent = self.path
+            _moved_settings(self, oldJson, self.get_json_path())
+            USAGE_STATS.moved(oldName, self.path)
         else:
             self.build_path()  
         
     def remove_data(self):
         if self.path is not None:
+            WRITE_BEHIND.cancel(self)
             if os.path.exists(self.path):
                 os.remove(self.path)
+                WRITE_TRACKER.removed(self.path)
             if os.path.exists(self.get_json_path()):
                 os.remove(self.get_json_path())
+                WRITE_TRACKER.removed(self.get_json_path())
+            self._savedSettings = None
+            self._savedContent = None
         
     def copy(self, thePhrase):
         self.description = thePhrase.description
@@ -721,6 +859,13 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         self.copy_hotkey(thePhrase)
         self.copy_window_filter(thePhrase)
 
+    def get_usage_count(self):
+        """
+        Return how often this phrase was used. The C{usageCount} saved with it only
+        holds the uses counted before the usage statistics log existed.
+        """
+        return self.usageCount + USAGE_STATS.uses(self.path)
+
     def get_tuple(self):
         return ("text-plain", self.description, self.get_abbreviations(), self.get_hotkey_string(), self)
         
@@ -744,8 +889,6 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         return False
     
     def build_phrase(self, buffer):
-        self.usageCount += 1
-        self.parent.increment_usage_count()
         expansion = Expansion(self.phrase)
         triggerFound = False
         
@@ -783,6 +926,10 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
             expansion.backspaces = self.parent.get_backspace_count(buffer)
         
         #self.__parsePositionTokens(expansion)
+        saved = 0
+        if ConfigManager.SETTINGS[INPUT_SAVINGS]:
+            saved = max(len(expansion.string) - self.calculate_input(buffer), 0)
+        USAGE_STATS.record(self.path, saved)
         return expansion
     
     def calculate_input(self, buffer):
@@ -791,10 +938,11 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         """
         if TriggerMode.ABBREVIATION in self.modes:
             if self._should_trigger_abbreviation(buffer):
+                abbr = self._get_trigger_abbreviation(buffer)
                 if self.immediate:
-                    return len(self.abbreviation)
+                    return len(abbr)
                 else:
-                    return len(self.abbreviation) + 1
+                    return len(abbr) + 1
         
         # TODO - re-enable me if restoring predictive functionality
         #if TriggerMode.PREDICTIVE in self.modes:
@@ -899,6 +1047,31 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         self.parent = None
         self.showInTrayMenu = False
         self.path = path
+        self._savedSettings = None
+
+    @property
+    def code(self):
+        """
+        The script source. In lazy content mode it is read from the file on first use,
+        and only kept in memory as long as the content cache budget allows.
+        """
+        if self._code is None:
+            return CONTENT_CACHE.read(self, self.path, 'UTF-8')
+
+        return self._code
+
+    @code.setter
+    def code(self, code):
+        with _CONTENT_LOCK:
+            self._code = code
+            self._savedContent = None
+
+    def mark_saved(self):
+        """
+        Record that the file at C{path} holds the current script source, e.g. because
+        it was just read from there, so L{persist} does not write it again.
+        """
+        self._savedContent = self.path
         
     def build_path(self, baseName=None):        
         if baseName is None:
@@ -915,19 +1088,27 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         if self.path is None:
             self.build_path()
             
-        with open(self.get_json_path(), 'w') as jsonFile:
-            json.dump(self.get_serializable(), jsonFile, indent=4)
-                        
-        with open(self.path, "w") as outFile:
-            outFile.write(self.code)
-            # outFile.write(self.code.encode("utf-8"))
+        _write_settings(self, self.get_json_path())
+
+        # Only rewritten when the source was changed, or the item moved
+        _write_content(self, "code")
+
+    def schedule_persist(self):
+        """
+        Save the script later, on the C{WRITE_BEHIND} thread. A new script
+        is written right away instead, so no other new item can take its file name.
+        """
+        if self.path is None:
+            self.persist()
+        else:
+            WRITE_BEHIND.schedule(self)
 
     def get_serializable(self):
         d = {
             "type": "script",
             "description": self.description,
             #"code": self.code,
-            "store": self.store,
+            "store": self.store.get_serializable(),
             "modes": self.modes,
             "usageCount": self.usageCount,
             "prompt": self.prompt,
@@ -942,8 +1123,13 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
     def load(self, parent):
         self.parent = parent
         
-        with open(self.path, "r", encoding='UTF-8') as inFile:
-            self.code = inFile.read()
+        CONTENT_CACHE.invalidate(self)
+        if ConfigManager.SETTINGS[LAZY_CONTENT]:
+            self._code = None
+        else:
+            with open(self.path, "r", encoding='UTF-8') as inFile:
+                self.code = inFile.read()
+        self.mark_saved()
         
         if os.path.exists(self.get_json_path()):           
             self.load_from_serialized()
@@ -951,6 +1137,7 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
             self.description = os.path.basename(self.path)[:-3]
 
     def load_from_serialized(self):
+        self._savedSettings = None
         try:
             with open(self.get_json_path(), "r") as jsonFile:
                 data = json.load(jsonFile)
@@ -973,20 +1160,35 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         
     def rebuild_path(self):
         if self.path is not None:
+            WRITE_BEHIND.flush(self)
             oldName = self.path
             oldJson = self.get_json_path()
             self.build_path()
             os.rename(oldName, self.path)
             os.rename(oldJson, self.get_json_path())
+            for path in (oldName, oldJson):
+                WRITE_TRACKER.removed(path)
+            for path in (self.path, self.get_json_path()):
+                WRITE_TRACKER.written(path)
+            if self._savedContent == oldName:
+                self._savedContent = self.path
+            _moved_settings(self, oldJson, self.get_json_path())
+            USAGE_STATS.moved(oldName, self.path)
+            Store.moved(oldName, self.path)
         else:
             self.build_path()         
         
     def remove_data(self):
         if self.path is not None:
+            WRITE_BEHIND.cancel(self)
             if os.path.exists(self.path):
                 os.remove(self.path)
+                WRITE_TRACKER.removed(self.path)
             if os.path.exists(self.get_json_path()):
                 os.remove(self.get_json_path())
+                WRITE_TRACKER.removed(self.get_json_path())
+            self._savedSettings = None
+            self._savedContent = None
 
     def copy(self, theScript):
         self.description = theScript.description
@@ -1000,6 +1202,21 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         self.copy_hotkey(theScript)
         self.copy_window_filter(theScript)
 
+    def get_store(self):
+        """
+        Return the store of this script, tied to its current path so its values can be
+        kept in the store database.
+        """
+        self.store.namespace = self.path
+        return self.store
+
+    def get_usage_count(self):
+        """
+        Return how often this script was used. The C{usageCount} saved with it only
+        holds the uses counted before the usage statistics log existed.
+        """
+        return self.usageCount + USAGE_STATS.uses(self.path)
+
     def get_tuple(self):
         return ("text-x-python", self.description, self.get_abbreviations(), self.get_hotkey_string(), self)
 
@@ -1014,8 +1231,7 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         return False
         
     def process_buffer(self, buffer):
-        self.usageCount += 1
-        self.parent.increment_usage_count()
+        USAGE_STATS.record(self.path)
         triggerFound = False
         backspaces = 0
         string = ""
@@ -16,20 +16,27 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import threading, logging, os.path, time
+import threading, logging, os.path
 
 from pyinotify import WatchManager, Notifier, EventsCodes, ProcessEvent
 
+from . import common
+from .fsevents import EventCoalescer, WatchRegistry, COALESCE_DELAY, WRITE_TRACKER
+
 _logger = logging.getLogger("inotify")
 
+# Files in the configuration folder that keep changing without being recorded in
+# WRITE_TRACKER: the log, and the store database with its journals
+IGNORED_PATHS = frozenset([common.LOG_FILE] + [common.STORE_FILE + suffix
+                                               for suffix in ("", "-wal", "-shm", "-journal")])
+
 m = EventsCodes.OP_FLAGS
 MASK = m["IN_CREATE"]|m["IN_MODIFY"]|m["IN_DELETE"]|m["IN_MOVED_TO"]|m["IN_MOVED_FROM"]
 
 class Processor(ProcessEvent):
     
-    def __init__(self, monitor, listener):
+    def __init__(self, monitor):
         ProcessEvent.__init__(self)
-        self.listener = listener
         self.monitor = monitor
         
     def __getEventPath(self, event):
@@ -41,91 +48,126 @@ class Processor(ProcessEvent):
         return path
     
     def process_IN_MOVED_TO(self, event):
-        path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_created_or_modified(path)
+        self.monitor.queue_event(self.__getEventPath(event), False)
     
     def process_IN_CREATE(self, event):
-        path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_created_or_modified(path)
+        self.monitor.queue_event(self.__getEventPath(event), False)
         
     def process_IN_MODIFY(self, event):
-        path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_created_or_modified(path)
+        self.monitor.queue_event(self.__getEventPath(event), False)
         
     def process_IN_DELETE(self, event):
-        path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():        
-            self.listener.path_removed(path)
+        self.monitor.queue_event(self.__getEventPath(event), True)
             
     def process_IN_MOVED_FROM(self, event):
-        path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_removed(path)
+        self.monitor.queue_event(self.__getEventPath(event), True)
+
+    def process_IN_IGNORED(self, event):
+        # Sent whenever a watch goes away, including after IN_DELETE_SELF
+        self.monitor.watch_removed(event.wd)
 
 
 class FileMonitor(threading.Thread):
+    """
+    Watches the configuration folders and reports changes to the listener in batches.
+
+    Events are coalesced per path until none arrived for C{delay} seconds; events
+    caused by AutoKey's own writes, as recorded in C{fsevents.WRITE_TRACKER}, and
+    events of the L{IGNORED_PATHS} are dropped. What remains is passed to C{listener.paths_changed} as a single list
+    of (path, removed) tuples.
+
+    Watched folders are kept in a L{WatchRegistry}; watches the kernel removed are
+    dropped from it as their C{IN_IGNORED} events arrive.
+    """
     
-    def __init__(self, listener):
+    def __init__(self, listener, delay=COALESCE_DELAY):
         threading.Thread.__init__(self)
-        self.__p = Processor(self, listener)
+        self.listener = listener
+        self.coalescer = EventCoalescer(delay)
+        self.__p = Processor(self)
         self.manager = WatchManager()
         self.notifier = Notifier(self.manager, self.__p)
         self.event = threading.Event()
         self.setDaemon(True)
-        self.watches = []
-        #self.suspended = []
-        self.__isSuspended = False
+        self.watches = WatchRegistry()
+
+    @property
+    def delay(self):
+        return self.coalescer.delay
+
+    @delay.setter
+    def delay(self, delay):
+        self.coalescer.delay = delay
         
     def suspend(self):
-        self.__isSuspended = True
+        """
+        Kept for callers that bracket their writes with suspend/unsuspend. Nothing is
+        suspended any more: own writes are recognised individually, so changes made
+        by other programs in the meantime are no longer lost.
+        """
+        pass
     
     def unsuspend(self):
-        t = threading.Thread(target=self.__unsuspend)
-        t.start()
-        
-    def __unsuspend(self):
-        time.sleep(1.5)
-        self.__isSuspended = False
-        for watch in self.watches:
-            if not os.path.exists(watch):
-                _logger.debug("Removed stale watch on %s", watch)
-                self.watches.remove(watch)
-        
-    def is_suspended(self):
-        return self.__isSuspended
+        pass
+
+    def queue_event(self, path, removed):
+        if path not in IGNORED_PATHS:
+            self.coalescer.add(path, removed)
+
+    def watch_removed(self, wd):
+        path = self.watches.get_path(wd)
+        if path is not None:
+            _logger.debug("Removed stale watch on %s", path)
+            self.watches.discard(wd)
         
     def has_watch(self, path):
         return path in self.watches
     
-    def add_watch(self, path):
+    def add_watch(self, path, rec=False):
+        """
+        Watch the given folder, and with C{rec} all folders below it as well.
+        """
         _logger.debug("Adding watch for %s", path)
-        self.manager.add_watch(path, MASK, self.__p)
-        self.watches.append(path)
+        wdd = self.manager.add_watch(path, MASK, self.__p, rec=rec)
+        for watchedPath, wd in wdd.items():
+            if wd >= 0:
+                self.watches.add(watchedPath, wd)
         
     def remove_watch(self, path):
+        """
+        Stop watching the given folder and all folders below it.
+        """
         _logger.debug("Removing watch for %s", path)
-        wd = self.manager.get_wd(path)
-        self.manager.rm_watch(wd, True)
-        self.watches.remove(path)
-        for i in range(len(self.watches)):
-            try:
-                if self.watches[i].startswith(path):
-                    self.watches.remove(self.watches[i])
-            except IndexError:
-                break       
+        wds = self.watches.remove(path)
+        if wds:
+            self.manager.rm_watch(wds, quiet=True)
         
     def run(self):        
         while not self.event.isSet():
             self.notifier.process_events()
-            if self.notifier.check_events(1000):
+            self.__deliver()
+
+            timeout = self.coalescer.timeout()
+            if timeout is None:
+                timeout = 1000
+            else:
+                timeout = max(int(timeout * 1000), 1)
+            if self.notifier.check_events(timeout):
                 self.notifier.read_events()
         
         _logger.info("Shutting down file monitor")
         self.notifier.stop()        
         
+    def __deliver(self):
+        events = [(path, removed) for path, removed in self.coalescer.take()
+                  if not WRITE_TRACKER.is_own(path, removed)]
+        if events:
+            _logger.debug("Delivering %d coalesced events", len(events))
+            try:
+                self.listener.paths_changed(events)
+            except Exception:
+                _logger.exception("Error while handling file system events")
+        
     def stop(self):
         self.event.set()
         self.join()
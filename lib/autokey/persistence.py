@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Writing configuration files safely and off the keystroke and UI threads.
+
+This module must not import the rest of AutoKey, except for L{fsevents}.
+"""
+
+import collections, contextlib, logging, os, shutil, stat, threading, time
+
+from .fsevents import WRITE_TRACKER
+
+_logger = logging.getLogger("persistence")
+
+# Seconds between the first change scheduled and the write
+WRITE_DELAY = 1.0
+
+# The SyncBatch of the deferred_sync() block the current thread is in, if any
+_local = threading.local()
+
+
+def atomic_write(path, text, encoding=None):
+    """
+    Replace the contents of a file in a single step.
+
+    The text is written to a hidden temporary file in the same folder, which is
+    then renamed over the file, so the file always holds either its old or its new
+    contents, even if AutoKey or the system crashes while writing. A symbolic
+    link is followed rather than replaced, and the permissions of an existing file
+    are kept. Both files are recorded in the C{WRITE_TRACKER}, so the file monitor
+    ignores the events they cause.
+
+    Inside a L{deferred_sync} block, the data is not flushed to the disk before the
+    rename; the block syncs the files written in it when it ends instead.
+
+    @param encoding: encoding of the file, None for the locale default
+    """
+    if os.path.islink(path):
+        path = os.path.realpath(path)
+
+    directory, baseName = os.path.split(path)
+    tempPath = os.path.join(directory, ".%s.tmp" % baseName.lstrip('.'))
+    batch = getattr(_local, "batch", None)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = None
+
+    try:
+        with open(tempPath, 'w', encoding=encoding) as outFile:
+            if mode is not None:
+                os.fchmod(outFile.fileno(), mode)
+            outFile.write(text)
+            if batch is None:
+                outFile.flush()
+                os.fsync(outFile.fileno())
+        os.replace(tempPath, path)
+    except BaseException:
+        try:
+            os.remove(tempPath)
+        except OSError:
+            pass
+        raise
+    finally:
+        WRITE_TRACKER.removed(tempPath)
+
+    WRITE_TRACKER.written(path)
+    if batch is not None:
+        batch.written(path)
+
+
+def _fsync_path(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        # Removed again since it was written
+        return
+
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SyncBatch:
+    """
+    The files written by L{atomic_write} in a L{deferred_sync} block, which are
+    synced to the disk together with their folders when the block ends.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__paths = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.__paths)
+
+    def written(self, path):
+        with self.__lock:
+            self.__paths[path] = True
+
+    def run(self, function, *args, **kwargs):
+        """
+        Call a function with the files it writes added to this batch. The block only
+        covers the thread it is entered in, so this is how writes made by worker
+        threads are deferred, e.g. C{pool.submit(batch.run, phrase.persist)}.
+        """
+        previous = getattr(_local, "batch", None)
+        _local.batch = self
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.batch = previous
+
+    def sync(self):
+        with self.__lock:
+            paths = list(self.__paths)
+            self.__paths.clear()
+
+        directories = collections.OrderedDict()
+        for path in paths:
+            _fsync_path(path)
+            directories[os.path.dirname(path)] = True
+
+        # Makes the renames themselves durable
+        for directory in directories:
+            _fsync_path(directory)
+
+
+@contextlib.contextmanager
+def deferred_sync():
+    """
+    Write many files with L{atomic_write} without waiting for the disk after each
+    one, e.g. when importing phrases in bulk. Only the thread entering the block,
+    and functions called through L{SyncBatch.run} of the batch it yields, defer
+    their syncs. A block nested in another one joins the outer batch.
+
+    A crash before the block ends may leave some of the files written in it empty,
+    so it must only be used for new files, or for files that can be recreated.
+    """
+    batch = getattr(_local, "batch", None)
+    if batch is not None:
+        yield batch
+        return
+
+    batch = SyncBatch()
+    _local.batch = batch
+    try:
+        yield batch
+    finally:
+        _local.batch = None
+        batch.sync()
+
+
+def backup_file(path, backupPath):
+    """
+    Make backupPath refer to the current contents of path, without copying them
+    when a hard link can be used. The file at path must only ever be replaced
+    with L{atomic_write}, never rewritten in place, for the link to stay a backup.
+    """
+    if not os.path.exists(path):
+        return
+
+    try:
+        os.remove(backupPath)
+    except OSError:
+        pass
+
+    try:
+        os.link(path, backupPath)
+    except OSError:
+        shutil.copy2(path, backupPath)
+
+
+class WriteBehind:
+    """
+    Persists objects on a background thread, batching changes made in quick
+    succession.
+
+    Objects passed to L{schedule} must have a C{persist()} method, which is called
+    once, C{delay} seconds after the first of any number of schedule calls. Pending
+    writes are done immediately by L{flush}, which must be called before shutting
+    down.
+    """
+
+    def __init__(self, delay=WRITE_DELAY):
+        self.delay = delay
+        self.__lock = threading.Lock()
+        self.__flushLock = threading.Lock()
+        self.__pending = collections.OrderedDict()
+        self.__wakeUp = threading.Event()
+        self.__thread = None
+
+    def __len__(self):
+        return len(self.__pending)
+
+    def schedule(self, target):
+        with self.__lock:
+            self.__pending[target] = True
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name="WriteBehind", daemon=True)
+                self.__thread.start()
+
+        self.__wakeUp.set()
+
+    def cancel(self, target):
+        """
+        Forget a pending write, e.g. because the object was deleted. Waits for a write
+        already in progress, so none is done after this returns.
+        """
+        with self.__flushLock, self.__lock:
+            self.__pending.pop(target, None)
+
+    def flush(self, target=None):
+        """
+        Do all pending writes now, in the calling thread.
+
+        @param target: only do the pending write of this object, e.g. before its files
+        are renamed
+        """
+        with self.__flushLock:
+            with self.__lock:
+                if target is None:
+                    pending = list(self.__pending)
+                    self.__pending.clear()
+                elif self.__pending.pop(target, None):
+                    pending = [target]
+                else:
+                    pending = []
+
+            for target in pending:
+                try:
+                    target.persist()
+                except Exception:
+                    _logger.exception("Error while saving %r", target)
+
+    def __run(self):
+        while True:
+            self.__wakeUp.wait()
+            self.__wakeUp.clear()
+            # Collect everything scheduled during the delay into one batch
+            time.sleep(self.delay)
+            self.flush()
+
+
+# Shared by everything that persists configuration in the background
+WRITE_BEHIND = WriteBehind()
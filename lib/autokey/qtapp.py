@@ -19,7 +19,7 @@
 from . import common
 common.USING_QT = True
 
-import sys, traceback, os.path, signal, logging, logging.handlers, subprocess, queue, time, dbus
+import sys, traceback, os.path, signal, logging, logging.handlers, subprocess, queue, dbus
 import dbus.mainloop.qt
 from PyKDE4.kdecore import KCmdLineArgs, KCmdLineOptions, KAboutData, ki18n, i18n
 from PyKDE4.kdeui import KMessageBox, KApplication
@@ -173,6 +173,18 @@ class Application:
         self.configManager.config_altered(persistGlobal)
         self.notifier.build_menu()
 
+    def items_added(self, targets, persistGlobal=False):
+        self.configManager.items_added(targets, persistGlobal)
+        self.notifier.build_menu()
+
+    def items_removed(self, targets, persistGlobal=False):
+        self.configManager.items_removed(targets, persistGlobal)
+        self.notifier.build_menu()
+
+    def item_changed(self, target, persistGlobal=False):
+        self.configManager.item_changed(target, persistGlobal)
+        self.notifier.build_menu()
+
     def hotkey_created(self, item):
         logging.debug("Created hotkey: %r %s", item.modifiers, item.hotKey)
         self.service.mediator.interface.grab_hotkey(item)
@@ -181,15 +193,8 @@ class Application:
         logging.debug("Removed hotkey: %r %s", item.modifiers, item.hotKey)
         self.service.mediator.interface.ungrab_hotkey(item)
         
-    def path_created_or_modified(self, path):
-        time.sleep(0.5)
-        changed = self.configManager.path_created_or_modified(path)
-        if changed and self.configWindow is not None: 
-            self.configWindow.config_modified()
-        
-    def path_removed(self, path):
-        time.sleep(0.5)
-        changed = self.configManager.path_removed(path)        
+    def paths_changed(self, events):
+        changed = self.configManager.paths_changed(events)
         if changed and self.configWindow is not None: 
             self.configWindow.config_modified()
         
@@ -33,6 +33,7 @@ from .dialogs import *
 from .settingsdialog import SettingsDialog
 from ..configmanager import *
 from ..iomediator import Recorder
+from ..persistence import WRITE_BEHIND
 from .. import model
 
 PROBLEM_MSG_PRIMARY = ki18n("Some problems were found")
@@ -289,7 +290,7 @@ class ScriptPage(QWidget, scriptpage.Ui_ScriptPage):
         self.currentScript.code = str(self.scriptCodeEditor.text())
         self.currentScript.showInTrayMenu = self.showInTrayCheckbox.isChecked()
         
-        self.currentScript.persist()
+        self.currentScript.schedule_persist()
         set_url_label(self.urlLabel, self.currentScript.path)
         return False
 
@@ -422,7 +423,7 @@ class PhrasePage(QWidget, phrasepage.Ui_PhrasePage):
         
         self.currentPhrase.prompt = self.promptCheckbox.isChecked()
         
-        self.currentPhrase.persist()
+        self.currentPhrase.schedule_persist()
         set_url_label(self.urlLabel, self.currentPhrase.path)
         return False
 
@@ -673,7 +674,7 @@ class CentralWidget(QWidget, centralwidget.Ui_CentralWidget):
 
                 persistGlobal = self.stack.currentWidget().save()
                 self.parentWidget().app.monitor.unsuspend()
-                self.parentWidget().app.config_altered(persistGlobal)
+                self.parentWidget().app.item_changed(self.__extractData(item), persistGlobal)
 
                 self.treeWidget.sortItems(0, Qt.AscendingOrder)
             else:
@@ -724,7 +725,7 @@ class CentralWidget(QWidget, centralwidget.Ui_CentralWidget):
                 newItem = FolderWidgetItem(None, folder)
                 self.treeWidget.addTopLevelItem(newItem)
                 self.configManager.folders.append(folder)
-                self.topLevelWidget().app.config_altered(True)
+                self.topLevelWidget().app.items_added([folder], True)
 
             self.topLevelWidget().app.monitor.unsuspend()
         else:
@@ -749,6 +750,7 @@ class CentralWidget(QWidget, centralwidget.Ui_CentralWidget):
         
         folder.persist()
         self.topLevelWidget().app.monitor.unsuspend()
+        self.topLevelWidget().app.items_added([folder], parentItem is None)
 
         self.treeWidget.sortItems(0, Qt.AscendingOrder)
         self.treeWidget.setCurrentItem(newItem)
@@ -829,7 +831,7 @@ class CentralWidget(QWidget, centralwidget.Ui_CentralWidget):
         self.treeWidget.setCurrentItem(newItem)
         self.treeWidget.setItemSelected(parentItem, False)
         self.on_treeWidget_itemSelectionChanged()
-        self.parentWidget().app.config_altered(False)
+        self.parentWidget().app.items_added([newObj])
 
     def on_cut(self):
         self.cutCopiedItems = self.__getSelection()
@@ -841,15 +843,16 @@ class CentralWidget(QWidget, centralwidget.Ui_CentralWidget):
             self.__removeItem(item)
 
         self.topLevelWidget().app.monitor.unsuspend()
-        self.parentWidget().app.config_altered(False)
-        
+        self.parentWidget().app.items_removed(self.cutCopiedItems)
+
     def on_paste(self):
         parentItem = self.treeWidget.selectedItems()[0]
         parent = self.__extractData(parentItem)
         self.topLevelWidget().app.monitor.suspend()
         
+        pastedItems = self.cutCopiedItems
         newItems = []
-        for item in self.cutCopiedItems:
+        for item in pastedItems:
             if isinstance(item, model.Folder):
                 f = WidgetItemFactory(None)
                 newItem = FolderWidgetItem(parentItem, item)
@@ -873,7 +876,7 @@ class CentralWidget(QWidget, centralwidget.Ui_CentralWidget):
         for item in newItems:
             self.treeWidget.setItemSelected(item, True)
         self.topLevelWidget().app.monitor.unsuspend()
-        self.parentWidget().app.config_altered(False)
+        self.parentWidget().app.items_added(pastedItems)
 
     def on_delete(self):
         widgetItems = self.treeWidget.selectedItems()
@@ -892,12 +895,13 @@ class CentralWidget(QWidget, centralwidget.Ui_CentralWidget):
         result = KMessageBox.questionYesNo(self.topLevelWidget(), msg)
 
         if result == KMessageBox.Yes:
+            removedItems = [self.__extractData(widgetItem) for widgetItem in widgetItems]
             for widgetItem in widgetItems:
                 self.__removeItem(widgetItem)
 
         self.topLevelWidget().app.monitor.unsuspend()
         if result == KMessageBox.Yes:
-            self.parentWidget().app.config_altered(False)
+            self.parentWidget().app.items_removed(removedItems)
             
     def on_rename(self):
         widgetItem = self.treeWidget.selectedItems()[0]
@@ -907,7 +911,7 @@ class CentralWidget(QWidget, centralwidget.Ui_CentralWidget):
         if self.stack.currentWidget().validate():
             self.parentWidget().app.monitor.suspend()
             persistGlobal = self.stack.currentWidget().save()
-            self.topLevelWidget().save_completed(persistGlobal)
+            self.topLevelWidget().save_completed(persistGlobal, self.__getSelection()[0])
             self.set_dirty(False)
             
             item = self.treeWidget.selectedItems()[0]
@@ -949,8 +953,10 @@ class CentralWidget(QWidget, centralwidget.Ui_CentralWidget):
         # Filter out any child objects that belong to a parent already in the list
         result = [f for f in sourceItems if f.parent() not in sourceItems]
         
+        sourceModelItems = [self.__extractData(source) for source in result]
         self.parentWidget().app.monitor.suspend()
-        
+        self.parentWidget().app.items_removed(sourceModelItems)
+
         for source in result:
             self.__removeItem(source)
             sourceModelItem = self.__extractData(source)
@@ -967,7 +973,7 @@ class CentralWidget(QWidget, centralwidget.Ui_CentralWidget):
         
         self.parentWidget().app.monitor.unsuspend()
         self.treeWidget.sortItems(0, Qt.AscendingOrder)
-        self.parentWidget().app.config_altered(True)  
+        self.parentWidget().app.items_added(sourceModelItems, True)  
         
     def __moveRecurseUpdate(self, folder):
         folder.path = None
@@ -1177,9 +1183,9 @@ class ConfigWindow(KXmlGuiWindow):
     def set_redo_available(self, state):
         self.redo.setEnabled(state)
 
-    def save_completed(self, persistGlobal):
+    def save_completed(self, persistGlobal, target):
         self.save.setEnabled(False)
-        self.app.config_altered(persistGlobal)
+        self.app.item_changed(target, persistGlobal)
         
     def __createAction(self, actionName, name, iconName=None, target=None, shortcut=None):
         if iconName is not None:
@@ -1239,6 +1245,8 @@ class ConfigWindow(KXmlGuiWindow):
 
         self.hide()
         logging.getLogger().removeHandler(self.centralWidget.logHandler)
+        # Closing the window leaves every edit saved in it on disk
+        WRITE_BEHIND.flush()
         return True
     
     # File Menu
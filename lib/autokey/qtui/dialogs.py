@@ -44,6 +44,20 @@ def validate(expression, message, widget, parent):
             widget.setFocus()
     return expression
 
+def confirm_conflicts(conflicts, parent):
+    """
+    Warn about the abbreviations or hotkey of a dialog getting in the way of others.
+
+    @return: whether to use them anyway
+    """
+    if not conflicts:
+        return True
+
+    message = i18n("These triggers get in the way of others:") + "\n\n"
+    message += "\n".join(str(conflict) for conflict in conflicts)
+    message += "\n\n" + i18n("Use them anyway?")
+    return KMessageBox.warningYesNo(parent, message) == KMessageBox.Yes
+
 class AbbrListItem(QListWidgetItem):
 
     def __init__(self, text):
@@ -227,7 +241,8 @@ class AbbrSettingsDialog(KDialog):
         if not validate(len(self.get_abbrs()) > 0, i18n("You must specify at least one abbreviation"),
                             self.widget.addButton, self): return False
 
-        return True
+        configManager = self.parentWidget().topLevelWidget().app.configManager
+        return confirm_conflicts(configManager.check_conflicts(self.targetItem, self.save), self)
         
     def slotButtonClicked(self, button):
         if button == KDialog.Ok:
@@ -373,10 +388,18 @@ class HotkeySettingsDialog(KDialog):
         if not validate(self.key is not None, i18n("You must specify a key for the hotkey."),
                             None, self): return False
         
-        return True
+        return self.check_conflicts()
+
+    def check_conflicts(self):
+        configManager = self.parentWidget().topLevelWidget().app.configManager
+        return confirm_conflicts(configManager.check_conflicts(self.targetItem, self.save), self)
         
         
 class GlobalHotkeyDialog(HotkeySettingsDialog):
+
+    def check_conflicts(self):
+        # Global hotkeys are not folders or items
+        return True
     
     def load(self, item):
         self.targetItem = item
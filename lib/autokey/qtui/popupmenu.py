@@ -38,8 +38,8 @@ class MenuBase:
         
         if ConfigManager.SETTINGS[SORT_BY_USAGE_COUNT]:
             _logger.debug("Sorting phrase menu by usage count")
-            folders.sort(key=lambda obj: obj.usageCount, reverse=True)
-            items.sort(key=lambda obj: obj.usageCount, reverse=True)
+            folders.sort(key=lambda obj: obj.get_usage_count(), reverse=True)
+            items.sort(key=lambda obj: obj.get_usage_count(), reverse=True)
         else:
             _logger.debug("Sorting phrase menu by item name/title")
             folders.sort(key=lambda obj: str(obj))
@@ -75,7 +75,7 @@ class MenuBase:
     def _addItemsToSelf(self, items, onDesktop):
         # Create item (script/phrase) section
         if ConfigManager.SETTINGS[SORT_BY_USAGE_COUNT]:
-            items.sort(key=lambda obj: obj.usageCount, reverse=True)
+            items.sort(key=lambda obj: obj.get_usage_count(), reverse=True)
         else:
             items.sort(key=lambda obj: str(obj))
             
@@ -15,8 +15,10 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import subprocess, threading, time, re
+import subprocess, threading, time, re, contextlib, concurrent.futures
 from . import common, model, iomediator
+from .folderloader import MAX_WORKERS
+from .persistence import deferred_sync
 
 if common.USING_QT:
     from PyQt4.QtGui import QClipboard, QApplication
@@ -846,18 +848,19 @@ class Window:
         @rtype: boolean
         """
         regex = re.compile(title)
-        waited = 0
-        while waited <= timeOut:
+        # Woken up by focus and title changes instead of polling
+        activeWindow = self.mediator.interface.activeWindow
+        deadline = time.time() + timeOut
+        changes = activeWindow.changes
+        while True:
             if regex.match(self.mediator.interface.get_window_title()):
                 return True
-            
-            if timeOut == 0:
-                break # zero length timeout, if not matched go straight to end
-                
-            time.sleep(0.3)
-            waited += 0.3
-            
-        return False
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+
+            changes = activeWindow.wait(changes, remaining)
         
     def wait_for_exist(self, title, timeOut=5):
         """
@@ -1051,6 +1054,23 @@ class Window:
         return (retCode, output)
         
         
+class _Batch:
+    """
+    Phrases created inside an C{engine.batch()} block, with their triggers.
+    """
+
+    def __init__(self):
+        self.phrases = []
+        self.abbreviations = set()
+        self.hotkeys = set()
+
+    def add(self, folder, phrase):
+        self.phrases.append((folder, phrase))
+        self.abbreviations.update(phrase.abbreviations)
+        if phrase.hotKey is not None:
+            self.hotkeys.add((tuple(phrase.modifiers), phrase.hotKey))
+
+
 class Engine:
     """
     Provides access to the internals of AutoKey.
@@ -1064,6 +1084,8 @@ class Engine:
         self.runner = runner
         self.monitor = configManager.app.monitor
         self.__returnValue = ''
+        # Batch of the calling script, if it is inside engine.batch()
+        self.__local = threading.local()
         
     def get_folder(self, title):
         """
@@ -1072,12 +1094,10 @@ class Engine:
         Usage: C{engine.get_folder(title)}
         
         Note that if more than one folder has the same title, only the first match will be
-        returned.
+        returned. To pick another one, qualify the title with those of the enclosing
+        folders, as in C{engine.get_folder("My Phrases/Addresses")}.
         """
-        for folder in self.configManager.allFolders:
-            if folder.title == title:
-                return folder
-        return None
+        return self.configManager.find_folder(title)
         
     def create_phrase(self, folder, description, contents):
         """
@@ -1091,12 +1111,8 @@ class Engine:
         @param description: description for the phrase
         @param contents: the expansion text
         """
-        self.monitor.suspend()
         p = model.Phrase(description, contents)
-        folder.add_item(p)
-        p.persist()
-        self.monitor.unsuspend()
-        self.configManager.config_altered(False)
+        self.__add(folder, p)
         
     def create_abbreviation(self, folder, description, abbr, contents):
         """
@@ -1113,17 +1129,15 @@ class Engine:
         @param contents: the expansion text
         @raise Exception: if the specified abbreviation is not unique
         """
-        if not self.configManager.check_abbreviation_unique(abbr, None, None):
+        batch = self.__getBatch()
+        unique, conflicting = self.configManager.check_abbreviation_unique(abbr, None, None)
+        if not unique or (batch is not None and abbr in batch.abbreviations):
             raise Exception("The specified abbreviation is already in use")
         
-        self.monitor.suspend()
         p = model.Phrase(description, contents)
         p.modes.append(model.TriggerMode.ABBREVIATION)
         p.abbreviations = [abbr]
-        folder.add_item(p)
-        p.persist()
-        self.monitor.unsuspend()
-        self.configManager.config_altered(False)
+        self.__add(folder, p)
         
     def create_hotkey(self, folder, description, modifiers, key, contents):
         """
@@ -1152,17 +1166,80 @@ class Engine:
         @raise Exception: if the specified hotkey is not unique
         """
         modifiers.sort()
-        if not self.configManager.check_hotkey_unique(modifiers, key, None, None):
+        batch = self.__getBatch()
+        unique, conflicting = self.configManager.check_hotkey_unique(modifiers, key, None, None)
+        if not unique or (batch is not None and (tuple(modifiers), key) in batch.hotkeys):
             raise Exception("The specified hotkey and modifier combination is already in use")
         
-        self.monitor.suspend()
         p = model.Phrase(description, contents)
         p.modes.append(model.TriggerMode.HOTKEY)
         p.set_hotkey(modifiers, key)
-        folder.add_item(p)
-        p.persist()
-        self.monitor.unsuspend()
-        self.configManager.config_altered(False)
+        self.__add(folder, p)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Create many phrases at once
+        
+        Usage: C{with engine.batch(): ...}
+        
+        Phrases created with C{create_phrase()}, C{create_abbreviation()} and
+        C{create_hotkey()} inside the block are checked for conflicts with each other
+        and with the existing configuration straight away, but only written to disk
+        when the block ends, all together, and then added to the configuration in a
+        single update. If the block raises an exception, or writing any phrase fails,
+        none of them is added.
+        
+        A batch started inside another one is part of the outer batch.
+        """
+        if self.__getBatch() is not None:
+            yield
+            return
+
+        batch = self.__local.batch = _Batch()
+        try:
+            yield
+        finally:
+            self.__local.batch = None
+
+        self.__commit(batch)
+
+    def __getBatch(self):
+        return getattr(self.__local, "batch", None)
+
+    def __add(self, folder, phrase):
+        batch = self.__getBatch()
+        if batch is not None:
+            batch.add(folder, phrase)
+        else:
+            folder.add_item(phrase)
+            phrase.persist()
+            self.configManager.item_added(phrase)
+
+    def __commit(self, batch):
+        if not batch.phrases:
+            return
+
+        # Paths are chosen up front, as phrases with the same description must not
+        # end up with the same file
+        taken = set()
+        for folder, phrase in batch.phrases:
+            phrase.path = model.get_safe_path(folder.path, phrase.description, ".txt", taken)
+            taken.add(phrase.path)
+
+        # Only new files are written, so they are synced once at the end
+        with deferred_sync() as syncBatch, concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            futures = [pool.submit(syncBatch.run, phrase.persist) for folder, phrase in batch.phrases]
+
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            for folder, phrase in batch.phrases:
+                phrase.remove_data()
+            raise errors[0]
+
+        for folder, phrase in batch.phrases:
+            folder.add_item(phrase)
+        self.configManager.items_added([phrase for folder, phrase in batch.phrases])
 
     def run_script(self, description):
         """
@@ -1170,14 +1247,11 @@ class Engine:
         
         Usage: C{engine.run_script(description)}
         
-        @param description: description of the script to run
+        @param description: description of the script to run, optionally qualified
+        with the titles of the enclosing folders, as in C{"My Scripts/Tools/backup"}
         @raise Exception: if the specified script does not exist
         """
-        targetScript = None
-        for item in self.configManager.allItems:
-            if item.description == description and isinstance(item, model.Script):
-                targetScript = item
-
+        targetScript = self.configManager.find_item(description, model.Script)
         if targetScript is not None:
             self.runner.run_subscript(targetScript)
         else:
@@ -1,15 +1,205 @@
+import threading
+
+from .storedb import GLOBAL_NAMESPACE
+
+_MISSING = object()
+
 class Store(dict):
     """
     Allows persistent storage of values between invocations of the script.
+
+    When a store database is set as C{Store.BACKEND}, the values of a script's store
+    are kept there, one at a time, instead of in the script settings; values left
+    in the settings are moved into the database on first use. All dictionary
+    methods then read and write the database.
     """
     
-    def set_value(self, key, value):
+    # Store database, None to keep the values in the settings files
+    BACKEND = None
+
+    # Makes locked() atomic when there is no store database
+    LOCK = threading.RLock()
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        # Namespace of this store in the database, set when its script runs
+        self.namespace = None
+
+    def __backend(self):
+        backend = Store.BACKEND
+        if backend is None or self.namespace is None:
+            return None
+
+        if dict.__len__(self) > 0:
+            backend.import_values(self.namespace, dict(dict.items(self)))
+            dict.clear(self)
+        return backend
+
+    def __globalBackend(self):
+        backend = Store.BACKEND
+        if backend is not None and self.GLOBALS:
+            backend.import_values(GLOBAL_NAMESPACE, self.GLOBALS)
+            self.GLOBALS.clear()
+        return backend
+
+    def __getitem__(self, key):
+        backend = self.__backend()
+        if backend is None:
+            return dict.__getitem__(self, key)
+
+        value = backend.get(self.namespace, key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        backend = self.__backend()
+        if backend is None:
+            dict.__setitem__(self, key, value)
+        else:
+            backend.set(self.namespace, key, value)
+
+    def __delitem__(self, key):
+        backend = self.__backend()
+        if backend is None:
+            dict.__delitem__(self, key)
+        elif not backend.remove(self.namespace, key):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        backend = self.__backend()
+        if backend is None:
+            return dict.__contains__(self, key)
+        return backend.contains(self.namespace, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        backend = self.__backend()
+        if backend is None:
+            return dict.__len__(self)
+        return len(backend.items(self.namespace))
+
+    def __eq__(self, other):
+        backend = self.__backend()
+        if backend is None:
+            return dict.__eq__(self, other)
+        return dict(backend.items(self.namespace)) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def get(self, key, default=None):
+        backend = self.__backend()
+        if backend is None:
+            return dict.get(self, key, default)
+        return backend.get(self.namespace, key, default)
+
+    def keys(self):
+        backend = self.__backend()
+        if backend is None:
+            return dict.keys(self)
+        return [key for key, value in backend.items(self.namespace)]
+
+    def values(self):
+        backend = self.__backend()
+        if backend is None:
+            return dict.values(self)
+        return [value for key, value in backend.items(self.namespace)]
+
+    def items(self):
+        backend = self.__backend()
+        if backend is None:
+            return dict.items(self)
+        return backend.items(self.namespace)
+
+    def copy(self):
+        backend = self.__backend()
+        if backend is None:
+            return dict.copy(self)
+        return dict(backend.items(self.namespace))
+
+    def clear(self):
+        backend = self.__backend()
+        if backend is None:
+            dict.clear(self)
+        else:
+            backend.clear(self.namespace)
+
+    def pop(self, key, *default):
+        backend = self.__backend()
+        if backend is None:
+            return dict.pop(self, key, *default)
+
+        with backend.locked():
+            value = backend.get(self.namespace, key, _MISSING)
+            if value is _MISSING:
+                if default:
+                    return default[0]
+                raise KeyError(key)
+            backend.remove(self.namespace, key)
+        return value
+
+    def popitem(self):
+        backend = self.__backend()
+        if backend is None:
+            return dict.popitem(self)
+
+        with backend.locked():
+            items = backend.items(self.namespace)
+            if not items:
+                raise KeyError("popitem(): store is empty")
+            key, value = items[-1]
+            backend.remove(self.namespace, key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        backend = self.__backend()
+        if backend is None:
+            return dict.setdefault(self, key, default)
+
+        with backend.locked():
+            value = backend.get(self.namespace, key, _MISSING)
+            if value is _MISSING:
+                backend.set(self.namespace, key, default)
+                value = default
+        return value
+
+    def update(self, *args, **kwargs):
+        backend = self.__backend()
+        if backend is None:
+            dict.update(self, *args, **kwargs)
+            return
+
+        with backend.locked():
+            for key, value in dict(*args, **kwargs).items():
+                backend.set(self.namespace, key, value)
+
+    def get_serializable(self):
+        """
+        Return the values to keep in the script settings, none once they were moved
+        into the store database.
+        """
+        return dict(dict.items(self))
+
+    def set_value(self, key, value, ttl=None):
         """
         Store a value
         
-        Usage: C{store.set_value(key, value)}
+        Usage: C{store.set_value(key, value, ttl=None)}
+
+        @param ttl: number of seconds after which the value expires, None to keep it
+        until it is removed. Only honoured when values are kept in the store database.
         """
-        self[key] = value
+        backend = self.__backend()
+        if backend is None:
+            self[key] = value
+        else:
+            backend.set(self.namespace, key, value, ttl)
         
     def get_value(self, key):
         """
@@ -27,15 +217,22 @@ class Store(dict):
         """
         del self[key]
         
-    def set_global_value(self, key, value):
+    def set_global_value(self, key, value, ttl=None):
         """
         Store a global value
         
-        Usage: C{store.set_global_value(key, value)}
+        Usage: C{store.set_global_value(key, value, ttl=None)}
         
         The value stored with this method will be available to all scripts.
+
+        @param ttl: number of seconds after which the value expires, None to keep it
+        until it is removed. Only honoured when values are kept in the store database.
         """
-        Store.GLOBALS[key] = value
+        backend = self.__globalBackend()
+        if backend is None:
+            Store.GLOBALS[key] = value
+        else:
+            backend.set(GLOBAL_NAMESPACE, key, value, ttl)
         
     def get_global_value(self, key):
         """
@@ -43,7 +240,10 @@ class Store(dict):
         
         Usage: C{store.get_global_value(key)}
         """
-        return self.GLOBALS.get(key, None)        
+        backend = self.__globalBackend()
+        if backend is None:
+            return self.GLOBALS.get(key, None)
+        return backend.get(GLOBAL_NAMESPACE, key, None)
         
     def remove_global_value(self, key):
         """
@@ -51,10 +251,38 @@ class Store(dict):
         
         Usage: C{store.remove_global_value(key)}
         """
-        del self.GLOBALS[key]
+        backend = self.__globalBackend()
+        if backend is None:
+            del self.GLOBALS[key]
+        elif not backend.remove(GLOBAL_NAMESPACE, key):
+            raise KeyError(key)
+
+    def locked(self):
+        """
+        Lock the store, so that other scripts cannot change any value until the
+        block ends
+
+        Usage: C{with store.locked(): ...}
+
+        For example, to safely increment a counter shared by several scripts::
+            with store.locked():
+                store.set_global_value("count", (store.get_global_value("count") or 0) + 1)
+        """
+        backend = Store.BACKEND
+        if backend is None:
+            return Store.LOCK
+        return backend.locked()
         
     def has_key(self, key):
         """
         python 2 compatibility
         """
         return key in self
+
+    @staticmethod
+    def moved(oldPath, newPath):
+        """
+        Carry the stored values over to the new path of a renamed script or folder.
+        """
+        if Store.BACKEND is not None and oldPath is not None and oldPath != newPath:
+            Store.BACKEND.move(oldPath, newPath)
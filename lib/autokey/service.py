@@ -16,21 +16,24 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import time, logging, threading, traceback, collections
-from autokey import common
+import time, logging, threading, traceback, collections, json
+from . import common, latency
 # from .iomediator import Key, IoMediator
-from autokey.iomediator_Key import Key
-from autokey.iomediator import IoMediator
-from autokey.configmanager import *
+from .iomediator_Key import Key
+from .iomediator import IoMediator
+from .configmanager import *
 if common.USING_QT:
-    from autokey.qtui.popupmenu import *
+    from .qtui.popupmenu import *
     from PyKDE4.kdecore import i18n
 elif common.USING_QT5:
-    from autokey.qt5ui.popupmenu import *
+    from .qt5ui.popupmenu import *
 else:
-    from autokey.gtkui.popupmenu import *
-from autokey.macro import MacroManager
-from autokey import scripting, model
+    from .gtkui.popupmenu import *
+from .macro import MacroManager
+from .triggerindex import AbbreviationMatcher
+from .persistence import WRITE_BEHIND
+from .storedb import StoreDatabase
+from . import scripting, model
 
 logger = logging.getLogger("service")
 
@@ -75,11 +78,16 @@ class Service:
         self.mediator = None
         self.app = app
         self.inputStack = collections.deque(maxlen=MAX_STACK_LENGTH)
+        self.matchedTriggers = None
+        self.itemMatcher = None
+        self.folderMatcher = None
         self.lastStackState = ''
         self.lastMenu = None
 
     def start(self):
         self.mediator = IoMediator(self)
+        # Filter results of the previous window are no use in the new one
+        self.mediator.interface.activeWindow.subscribe(model.WINDOW_FILTER_CACHE.focus_changed)
         self.mediator.interface.initialise()
 
         self.mediator.interface.start()
@@ -88,6 +96,12 @@ class Service:
         self.scriptRunner = ScriptRunner(self.mediator, self.app)
         self.phraseRunner = PhraseRunner(self)
         scripting.Store.GLOBALS = ConfigManager.SETTINGS[SCRIPT_GLOBALS]
+        if ConfigManager.SETTINGS[STORE_DATABASE] and scripting.Store.BACKEND is None:
+            try:
+                scripting.Store.BACKEND = StoreDatabase(common.STORE_FILE)
+            except Exception:
+                logger.exception("Error opening the store database, keeping script stores in the settings")
+        latency.TRACKER.enabled = ConfigManager.SETTINGS[TRACK_LATENCY]
         logger.info("Service now marked as running")
 
     def unpause(self):
@@ -104,11 +118,29 @@ class Service:
     def shutdown(self, save=True):
         logger.info("Service shutting down")
         if self.mediator is not None: self.mediator.shutdown()
-        if save: save_config(self.configManager)
+        if save: WRITE_BEHIND.schedule(self.configManager)
+        WRITE_BEHIND.flush()
+        if latency.TRACKER.enabled: self.dump_latency_stats()
+
+    def get_latency_stats(self):
+        """
+        Return the keystroke latency percentiles of each stage, as a JSON string.
+        """
+        return json.dumps(latency.TRACKER.get_serializable(), sort_keys=True)
+
+    def dump_latency_stats(self):
+        """
+        Write the keystroke latency percentiles of each stage to the latency file.
+
+        @return: the path of the latency file
+        """
+        logger.info("Writing latency statistics to %s", common.LATENCY_FILE)
+        latency.TRACKER.dump(common.LATENCY_FILE)
+        return common.LATENCY_FILE
 
     def handle_mouseclick(self, rootX, rootY, relX, relY, button, windowTitle):
         logger.debug("Received mouse click - resetting buffer")
-        self.inputStack.clear()
+        self.__clearStack()
 
         # If we had a menu and receive a mouse click, means we already
         # hid the menu. Don't need to do it again
@@ -118,20 +150,27 @@ class Service:
         self.phraseRunner.clear_last()
 
     def handle_keypress(self, rawKey, modifiers, key, windowName, windowClass):
+        started = latency.TRACKER.stamp()
+        self.__handleKeypress(rawKey, modifiers, key, windowName, windowClass)
+        latency.TRACKER.record(latency.MATCH, started)
+
+    def __handleKeypress(self, rawKey, modifiers, key, windowName, windowClass):
         logger.debug("Raw key: %r, modifiers: %r, Key: %s", rawKey, modifiers, key)
         logger.debug("Window visible title: %r, Window class: %r" % (windowName, windowClass))
-        self.configManager.lock.acquire()
+        # Published snapshots are never modified, so no locking is needed while matching
+        triggers = self.configManager.triggers
         windowInfo = (windowName, windowClass)
 
         # Always check global hotkeys
-        for hotkey in self.configManager.globalHotkeys:
+        for hotkey in triggers.globalHotkeyTable.lookup(modifiers, rawKey):
             hotkey.check_hotkey(modifiers, rawKey, windowInfo)
 
         if self.__shouldProcess(windowInfo):
             itemMatch = None
             menu = None
 
-            for item in self.configManager.hotKeys:
+            # Only the items bound to the pressed chord need their window filter checked
+            for item in triggers.hotkeyTable.lookup(modifiers, rawKey):
                 if item.check_hotkey(modifiers, rawKey, windowInfo):
                     itemMatch = item
                     break
@@ -146,7 +185,7 @@ class Service:
 
             else:
                 logger.debug("No phrase/script matched hotkey")
-                for folder in self.configManager.hotKeyFolders:
+                for folder in triggers.folderHotkeyTable.lookup(modifiers, rawKey):
                     if folder.check_hotkey(modifiers, rawKey, windowInfo):
                         #menu = PopupMenu(self, [folder], [])
                         menu = ([folder], [])
@@ -163,7 +202,6 @@ class Service:
                 self.app.show_popup_menu(*menu)
 
             if itemMatch is not None:
-                self.__tryReleaseLock()
                 self.__processItem(itemMatch)
 
 
@@ -172,23 +210,27 @@ class Service:
             modifierCount = len(modifiers)
 
             if modifierCount > 1 or (modifierCount == 1 and Key.SHIFT not in modifiers):
-                self.inputStack.clear()
-                self.__tryReleaseLock()
+                self.__clearStack()
                 return
 
             ### --- end of processing if non-printing modifiers are on --- ###
 
+            self.__syncMatchers(triggers)
+
             if self.__updateStack(key):
-                currentInput = ''.join(self.inputStack)
-                item, menu = self.__checkTextMatches([], self.configManager.abbreviations,
-                                                    currentInput, windowInfo, True)
-                if not item or menu:
-                    item, menu = self.__checkTextMatches(self.configManager.allFolders,
-                                                         self.configManager.allItems,
-                                                         currentInput, windowInfo)
+                # Only items/folders whose trigger condition was completed by this key can match
+                candidates = self.itemMatcher.push(self.inputStack)
+                folderCandidates = self.folderMatcher.push(self.inputStack)
+                item = menu = None
+
+                if candidates or folderCandidates:
+                    currentInput = ''.join(self.inputStack)
+                    item, menu = self.__checkTextMatches([], candidates, currentInput, windowInfo, True)
+                    if not item or menu:
+                        item, menu = self.__checkTextMatches(folderCandidates, candidates,
+                                                             currentInput, windowInfo)
 
                 if item:
-                    self.__tryReleaseLock()
                     self.__processItem(item, currentInput)
                 elif menu:
                     if self.lastMenu is not None:
@@ -200,20 +242,8 @@ class Service:
 
                 logger.debug("Input stack at end of handle_keypress: %s", self.inputStack)
 
-        self.__tryReleaseLock()
-
-    def __tryReleaseLock(self):
-        try:
-            self.configManager.lock.release()
-        except:
-            logger.debug("Ignored locking error in handle_keypress")
-
     def run_folder(self, name):
-        folder = None
-        for f in self.configManager.allFolders:
-            if f.title == name:
-                folder = f
-
+        folder = self.configManager.find_folder(name)
         if folder is None:
             raise Exception("No folder found with name '%s'" % name)
 
@@ -229,11 +259,11 @@ class Service:
         self.scriptRunner.execute(script)
 
     def __findItem(self, name, objType, typeDescription):
-        for item in self.configManager.allItems:
-            if item.description == name and isinstance(item, objType):
-                return item
+        item = self.configManager.find_item(name, objType)
+        if item is None:
+            raise Exception("No %s found with name '%s'" % (typeDescription, name))
 
-        raise Exception("No %s found with name '%s'" % (typeDescription, name))
+        return item
 
     @threaded
     def item_selected(self, item):
@@ -280,6 +310,8 @@ class Service:
                 # handle backspace by dropping the last saved character
                 try:
                     self.inputStack.pop()
+                    self.itemMatcher.pop()
+                    self.folderMatcher.pop()
                 except IndexError:
                     # in case self.inputStack is empty
                     pass
@@ -288,16 +320,37 @@ class Service:
 
         elif len(key) > 1:
             # non-simple key
-            self.inputStack.clear()
+            self.__clearStack()
             self.phraseRunner.clear_last()
             return False
         else:
             # Key is a character
             self.phraseRunner.clear_last()
             # if len(self.inputStack) == MAX_STACK_LENGTH, front items will removed for appending new items.
+            # The caller scans the new character with the matchers, which drop their front states alike.
             self.inputStack.append(key)
             return True
 
+    def __clearStack(self):
+        self.inputStack.clear()
+        if self.matchedTriggers is not None:
+            self.itemMatcher.reset()
+            self.folderMatcher.reset()
+
+    def __syncMatchers(self, triggers):
+        """
+        Make the abbreviation matchers follow the given trigger snapshot, rescanning the
+        current input if the configuration was changed since the last keypress.
+        """
+        if triggers is self.matchedTriggers:
+            return
+
+        self.itemMatcher = AbbreviationMatcher(triggers.abbreviationIndex, MAX_STACK_LENGTH)
+        self.itemMatcher.rebuild(self.inputStack)
+        self.folderMatcher = AbbreviationMatcher(triggers.folderAbbreviationIndex, MAX_STACK_LENGTH)
+        self.folderMatcher.rebuild(self.inputStack)
+        self.matchedTriggers = triggers
+
     def __checkTextMatches(self, folders, items, buffer, windowInfo, immediate=False):
         """
         Check for an abbreviation/predictive match among the given folder and items
@@ -338,11 +391,11 @@ class Service:
         return windowInfo[0] != "Set Abbreviations" and self.is_running()
 
     def __processItem(self, item, buffer=''):
-        self.inputStack.clear()
+        self.__clearStack()
         self.lastStackState = ''
 
         if isinstance(item, model.Phrase):
-            self.phraseRunner.execute(item, buffer)
+            self.phraseRunner.execute(item, buffer, latency.TRACKER.get_keystroke())
         else:
             self.scriptRunner.execute(item, buffer)
 
@@ -384,7 +437,8 @@ class PhraseRunner:
 
     @threaded
     #@synchronized(iomediator.SEND_LOCK)
-    def execute(self, phrase, buffer=''):
+    def execute(self, phrase, buffer='', keystroke=None):
+        started = latency.TRACKER.stamp()
         mediator = self.service.mediator
         mediator.interface.begin_send()
 
@@ -396,7 +450,7 @@ class PhraseRunner:
             mediator.send_string(expansion.string)
         else:
             mediator.paste_string(expansion.string, phrase.sendMode)
-        mediator.interface.finish_send()
+        mediator.interface.finish_send(started, keystroke)
 
         self.lastExpansion = expansion
         self.lastPhrase = phrase
@@ -457,7 +511,7 @@ class ScriptRunner:
         logger.debug("Script runner executing: %r", script)
 
         scope = self.scope.copy()
-        scope["store"] = script.store
+        scope["store"] = script.get_store()
 
         backspaces, stringAfter = script.process_buffer(buffer)
         self.mediator.send_backspace(backspaces)
@@ -481,5 +535,5 @@ class ScriptRunner:
 
     def run_subscript(self, script):
         scope = self.scope.copy()
-        scope["store"] = script.store
+        scope["store"] = script.get_store()
         exec(script.code, scope)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Database backend for the script stores.
+
+This module must not import the rest of AutoKey.
+"""
+
+import contextlib, json, logging, os, sqlite3, threading, time
+
+_logger = logging.getLogger("storedb")
+
+# Namespace of the values shared by all scripts
+GLOBAL_NAMESPACE = ""
+
+
+class StoreDatabase:
+    """
+    Keeps the values of the script stores in an SQLite database, one row per value.
+
+    Every script has its own namespace, normally the path of the script, so
+    values are read and written one key at a time without loading or saving a
+    whole store. Values are encoded as JSON, like they were in the script settings,
+    and may expire after a given number of seconds.
+
+    All access goes through one connection, serialised by a lock. Each write is
+    committed on its own, unless it is made inside L{locked}.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__lock = threading.RLock()
+        self.__depth = 0
+        self.__connection = sqlite3.connect(path, timeout=10, check_same_thread=False,
+                                            isolation_level=None)
+        # Survives AutoKey crashing without syncing every single write
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.execute("CREATE TABLE IF NOT EXISTS store ("
+                                  "namespace TEXT NOT NULL, "
+                                  "key TEXT NOT NULL, "
+                                  "value TEXT NOT NULL, "
+                                  "expires REAL, "
+                                  "PRIMARY KEY (namespace, key))")
+        self.purge()
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def get(self, namespace, key, default=None):
+        with self.__lock:
+            row = self.__connection.execute("SELECT value, expires FROM store WHERE namespace = ? AND key = ?",
+                                            (namespace, json.dumps(key))).fetchone()
+
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+
+        return json.loads(row[0])
+
+    def contains(self, namespace, key):
+        missing = object()
+        return self.get(namespace, key, missing) is not missing
+
+    def set(self, namespace, key, value, ttl=None):
+        """
+        @param ttl: seconds after which the value expires, None to keep it forever
+        """
+        expires = time.time() + ttl if ttl is not None else None
+        with self.__lock:
+            self.__connection.execute("INSERT OR REPLACE INTO store VALUES (?, ?, ?, ?)",
+                                      (namespace, json.dumps(key), json.dumps(value), expires))
+
+    def items(self, namespace):
+        """
+        Return the (key, value) tuples of a namespace, leaving out expired values.
+        """
+        with self.__lock:
+            rows = self.__connection.execute("SELECT key, value FROM store WHERE namespace = ? "
+                                             "AND (expires IS NULL OR expires > ?) ORDER BY rowid",
+                                             (namespace, time.time())).fetchall()
+
+        return [(json.loads(key), json.loads(value)) for key, value in rows]
+
+    def remove(self, namespace, key):
+        """
+        @return: whether there was a value that had not expired yet
+        """
+        with self.__lock:
+            found = self.contains(namespace, key)
+            self.__connection.execute("DELETE FROM store WHERE namespace = ? AND key = ?",
+                                      (namespace, json.dumps(key)))
+        return found
+
+    def clear(self, namespace):
+        with self.__lock:
+            self.__connection.execute("DELETE FROM store WHERE namespace = ?", (namespace,))
+
+    def import_values(self, namespace, values):
+        """
+        Add the values of a dictionary, without replacing values already present.
+        """
+        with self.locked():
+            self.__connection.executemany("INSERT OR IGNORE INTO store VALUES (?, ?, ?, NULL)",
+                                          [(namespace, json.dumps(key), json.dumps(value))
+                                           for key, value in values.items()])
+
+    def move(self, oldNamespace, newNamespace):
+        """
+        Rename a namespace, and all namespaces below it when namespaces are paths.
+        """
+        prefix = oldNamespace + os.sep
+        with self.locked():
+            self.__connection.execute("UPDATE OR REPLACE store SET namespace = ? || substr(namespace, ?) "
+                                      "WHERE namespace = ? OR substr(namespace, 1, ?) = ?",
+                                      (newNamespace, len(oldNamespace) + 1,
+                                       oldNamespace, len(prefix), prefix))
+
+    def purge(self):
+        """
+        Delete the expired values.
+        """
+        with self.__lock:
+            cursor = self.__connection.execute("DELETE FROM store WHERE expires <= ?", (time.time(),))
+        if cursor.rowcount > 0:
+            _logger.debug("Purged %d expired store values", cursor.rowcount)
+
+    @contextlib.contextmanager
+    def locked(self):
+        """
+        Run the reads and writes made inside the C{with} block as a single transaction,
+        without other threads changing the database in between.
+        """
+        with self.__lock:
+            if self.__depth == 0:
+                self.__connection.execute("BEGIN IMMEDIATE")
+            self.__depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.__depth -= 1
+                if self.__depth == 0:
+                    self.__connection.execute("ROLLBACK")
+                raise
+            else:
+                self.__depth -= 1
+                if self.__depth == 0:
+                    self.__connection.execute("COMMIT")
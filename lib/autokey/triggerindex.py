@@ -0,0 +1,888 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Lookup structures built from the configuration so that the keypress path does not
+have to scan every phrase, script and folder.
+
+This module must not import the rest of AutoKey; the indexes only rely on the
+attributes of the objects they are given.
+"""
+
+import collections, threading
+
+# Key under which a trie node stores the targets whose abbreviation ends there.
+# Never clashes with an input character, as those are always strings.
+_TERMINAL = None
+
+# Hash bits used by PersistentMap, and how many of them each level of its trie takes
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+_LEVEL_BITS = 5
+
+# Default of PersistentMap lookups, told apart from any value stored
+_MISSING = object()
+
+
+def _chunk(key, shift):
+    return ((hash(key) & _HASH_MASK) >> shift) & ((1 << _LEVEL_BITS) - 1)
+
+
+class PersistentMap:
+    """
+    Mapping with constant time copies, for the tables of the indexes that every
+    configuration change has to copy.
+
+    Entries are kept in a hash trie, each level of which is selected by a few more
+    bits of the hash of the key. Like the L{AbbreviationIndex}, a map that may be in
+    use is never modified: L{copy} returns a map sharing all nodes, and changes to
+    either copy only the nodes on the way to the key changed. That is about log32
+    of the number of entries, so the cost of a change does not depend on the size
+    of the map. Keys whose hashes are equal end up in a plain dictionary at the
+    bottom of the trie.
+    """
+
+    def __init__(self, items=()):
+        self.__root = {}
+        # Ids of the nodes that may be modified in place, None if all of them
+        self.__owned = None
+        self.__count = 0
+        for key, value in items:
+            self[key] = value
+
+    def __len__(self):
+        return self.__count
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        return (key for key, value in self.items())
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+
+        return value
+
+    def copy(self):
+        """
+        Return a map that can be changed without affecting this one, and the other
+        way round.
+        """
+        other = PersistentMap()
+        other.__root = self.__root
+        other.__owned = set()
+        other.__count = self.__count
+        self.__owned = set()
+        return other
+
+    def get(self, key, default=None):
+        node = self.__root
+        shift = 0
+        while shift < _HASH_BITS:
+            entry = node.get(_chunk(key, shift))
+            if entry is None:
+                return default
+            if type(entry) is not dict:
+                return entry[1] if entry[0] == key else default
+            node = entry
+            shift += _LEVEL_BITS
+
+        return node.get(key, default)
+
+    def setdefault(self, key, default=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self[key] = value = default
+
+        return value
+
+    def __setitem__(self, key, value):
+        node = self.__root = self.__own(self.__root)
+        shift = 0
+        while shift < _HASH_BITS:
+            chunk = _chunk(key, shift)
+            entry = node.get(chunk)
+            if entry is None:
+                node[chunk] = (key, value)
+                self.__count += 1
+                return
+
+            if type(entry) is dict:
+                child = self.__own(entry)
+            elif entry[0] == key:
+                node[chunk] = (key, value)
+                return
+            else:
+                # Another key shares the bits so far, move it down one level
+                child = self.__new()
+                if shift + _LEVEL_BITS < _HASH_BITS:
+                    child[_chunk(entry[0], shift + _LEVEL_BITS)] = entry
+                else:
+                    child[entry[0]] = entry[1]
+            node[chunk] = child
+            node = child
+            shift += _LEVEL_BITS
+
+        if key not in node:
+            self.__count += 1
+        node[key] = value
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def pop(self, key, *default):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            if default:
+                return default[0]
+            raise KeyError(key)
+
+        node = self.__root = self.__own(self.__root)
+        shift = 0
+        while shift < _HASH_BITS:
+            chunk = _chunk(key, shift)
+            entry = node[chunk]
+            if type(entry) is not dict:
+                # Emptied nodes are kept, they are simply passed over
+                del node[chunk]
+                break
+            child = self.__own(entry)
+            node[chunk] = child
+            node = child
+            shift += _LEVEL_BITS
+        else:
+            del node[key]
+
+        self.__count -= 1
+        return value
+
+    def items(self):
+        """
+        Return the (key, value) tuples of all entries, in no particular order.
+        """
+        return list(self.__items(self.__root, 0))
+
+    def __items(self, node, shift):
+        if shift >= _HASH_BITS:
+            yield from node.items()
+            return
+
+        for entry in node.values():
+            if type(entry) is dict:
+                yield from self.__items(entry, shift + _LEVEL_BITS)
+            else:
+                yield entry
+
+    def __new(self):
+        node = {}
+        if self.__owned is not None:
+            self.__owned.add(id(node))
+        return node
+
+    def __own(self, node):
+        if self.__owned is None or id(node) in self.__owned:
+            return node
+
+        node = dict(node)
+        self.__owned.add(id(node))
+        return node
+
+
+class AbbreviationIndex:
+    """
+    Trie over the abbreviations of a set of folders or items.
+
+    The index is scanned one input character at a time: a scan state holds the trie
+    nodes reached by every suffix of the input that is still the start of some
+    abbreviation, so each step only follows one edge per live node. The number of
+    live nodes is bounded by the longest abbreviation, regardless of how many
+    abbreviations are configured or how long the input buffer is. L{AbbreviationMatcher}
+    keeps these states across keystrokes.
+
+    Abbreviations of targets with C{ignoreCase} set are kept in a separate trie that
+    is scanned using the lower-cased input, mirroring C{_partition_input}.
+
+    Scan states hold on to trie nodes, so nodes reachable from an index that may be
+    in use are never modified. L{copy} returns a new index sharing all nodes, and
+    changes to it copy only the nodes on the path of each abbreviation added or
+    removed. The targets are kept in a L{PersistentMap}, so a copy takes the same
+    time however many targets are indexed.
+
+    The index only narrows down the candidates; the caller must still confirm each
+    one with C{check_input}, which also applies the window filter.
+    """
+
+    # Scan state before any input was seen
+    EMPTY_STATE = ((), ())
+
+    def __init__(self):
+        self.__caseSensitive = {}
+        self.__ignoreCase = {}
+        # Target -> (ignoreCase, abbreviations, position) it was added with
+        self.__keys = PersistentMap()
+        # Ids of the nodes that may be modified in place, None if all of them
+        self.__owned = None
+        self.__count = 0
+        self.__next = 0
+        self.maxLength = 0
+
+    def __len__(self):
+        return self.__count
+
+    def __contains__(self, target):
+        return target in self.__keys
+
+    def copy(self):
+        """
+        Return an index that can be changed without affecting this one, and the
+        other way round.
+        """
+        index = AbbreviationIndex()
+        index.__caseSensitive = self.__caseSensitive
+        index.__ignoreCase = self.__ignoreCase
+        index.__keys = self.__keys.copy()
+        index.__owned = set()
+        index.__count = self.__count
+        index.__next = self.__next
+        index.maxLength = self.maxLength
+        self.__owned = set()
+        return index
+
+    def add(self, target, position=None):
+        """
+        Add all abbreviations of the given folder or item to the index. Targets are
+        returned by L{candidates} in the order in which they were added.
+
+        @param position: position of the target in that order, defaults to the end
+        """
+        if target in self.__keys:
+            return
+
+        if position is None:
+            position = self.__next
+            self.__next += 1
+
+        abbreviations = tuple(abbr for abbr in target.abbreviations if len(abbr) > 0)
+        self.__keys[target] = (target.ignoreCase, abbreviations, position)
+        self.__count += 1
+
+        for abbr in abbreviations:
+            node = self.__path(target.ignoreCase, abbr)
+            node[_TERMINAL] = node.get(_TERMINAL, ()) + ((target, len(abbr), position),)
+            self.maxLength = max(self.maxLength, len(abbr))
+
+    def remove(self, target):
+        """
+        Remove the given folder or item, under the abbreviations it was added with.
+
+        @return: its position in the order of the index, None if it was not added
+        """
+        keys = self.__keys.pop(target, None)
+        if keys is None:
+            return None
+
+        ignoreCase, abbreviations, position = keys
+        self.__count -= 1
+        for abbr in abbreviations:
+            node = self.__path(ignoreCase, abbr)
+            terminals = tuple(entry for entry in node.get(_TERMINAL, ()) if entry[0] is not target)
+            if terminals:
+                node[_TERMINAL] = terminals
+            else:
+                node.pop(_TERMINAL, None)
+
+        # maxLength is left as it is; it only needs to be an upper bound
+        return position
+
+    def update(self, target):
+        """
+        Index the current abbreviations of a target that was already added, keeping
+        its position in the order of the index.
+        """
+        position = self.remove(target)
+        self.add(target, position)
+
+    def __path(self, ignoreCase, abbr):
+        # Return the node reached by the given abbreviation, creating it if needed and
+        # copying every shared node on the way
+        if ignoreCase:
+            node = self.__ignoreCase = self.__own(self.__ignoreCase)
+        else:
+            node = self.__caseSensitive = self.__own(self.__caseSensitive)
+
+        for char in abbr:
+            child = node.get(char)
+            if child is None:
+                child = {}
+                if self.__owned is not None:
+                    self.__owned.add(id(child))
+            else:
+                child = self.__own(child)
+            node[char] = child
+            node = child
+
+        return node
+
+    def __own(self, node):
+        if self.__owned is None or id(node) in self.__owned:
+            return node
+
+        node = dict(node)
+        self.__owned.add(id(node))
+        return node
+
+    def advance(self, state, char):
+        """
+        Return the scan state reached by feeding one more input character.
+        """
+        return (self.__advance(self.__caseSensitive, state[0], char),
+                self.__advance(self.__ignoreCase, state[1], char.lower()))
+
+    def __advance(self, trie, nodes, text):
+        for char in text:
+            reached = []
+            node = trie.get(char)
+            if node is not None:
+                reached.append(node)
+            for node in nodes:
+                node = node.get(char)
+                if node is not None:
+                    reached.append(node)
+            nodes = reached
+
+        return tuple(nodes)
+
+    def completed(self, state):
+        """
+        Return (target, length, position) tuples for the abbreviations ending at the
+        position of the given scan state.
+        """
+        for nodes in state:
+            for node in nodes:
+                if _TERMINAL in node:
+                    yield from node[_TERMINAL]
+
+    def items(self):
+        """
+        Return (target, abbreviations) tuples of all targets, in index order. Only
+        valid for the most recent copy of an index.
+        """
+        keys = sorted(self.__keys.items(), key=lambda item: item[1][2])
+        return [(target, abbreviations) for target, (ignoreCase, abbreviations, position) in keys]
+
+    def lookup(self, abbr):
+        """
+        Return the targets having exactly the given abbreviation, in index order.
+        """
+        found = {}
+        for trie in (self.__caseSensitive, self.__ignoreCase):
+            node = trie
+            for char in abbr:
+                node = node.get(char)
+                if node is None:
+                    break
+            else:
+                found.update((target, position) for target, length, position in node.get(_TERMINAL, ()))
+
+        return self.sort(found)
+
+    @staticmethod
+    def sort(found):
+        """
+        Return the targets of a dictionary of target to position, in index order.
+        """
+        return sorted(found, key=found.__getitem__)
+
+    def candidates(self, buffer):
+        """
+        Return the targets having an abbreviation that ends either at the end of the
+        given buffer or one character before it, ignoring the trigger rules.
+
+        @param buffer: the current input buffer (as string)
+        @return: list of targets, in the order they were added
+        """
+        if not self.__count:
+            return []
+
+        previous = state = self.EMPTY_STATE
+        for char in buffer[-(self.maxLength + 1):]:
+            previous, state = state, self.advance(state, char)
+
+        found = dict((target, position) for target, length, position in self.completed(state))
+        if buffer:
+            found.update((target, position) for target, length, position in self.completed(previous))
+        return self.sort(found)
+
+
+class AbbreviationMatcher:
+    """
+    Incremental abbreviation matcher following the keyboard input buffer.
+
+    One scan state of the L{AbbreviationIndex} is kept per buffered character, so
+    typing a character costs a single step and backspace simply drops the last
+    state. A keystroke yields the targets whose trigger condition it completes:
+
+     - immediate abbreviations ending at the new character
+     - other abbreviations ending just before it, when the new character is not a
+       word character of the target
+
+    In both cases the character preceding the abbreviation must not be a word
+    character, unless the target has C{triggerInside} set. This is the same rule
+    as C{check_input} applies, which remains the final authority (it also checks
+    the window filter), but keystrokes that complete nothing no longer need to
+    join or partition the buffer at all.
+    """
+
+    def __init__(self, index, maxLength):
+        self.index = index
+        self.__states = collections.deque(maxlen=maxLength)
+
+    def reset(self):
+        """
+        Forget all input, e.g. after the input buffer was cleared.
+        """
+        self.__states.clear()
+
+    def pop(self):
+        """
+        Drop the last character, e.g. after a backspace.
+        """
+        try:
+            self.__states.pop()
+        except IndexError:
+            pass
+
+    def rebuild(self, buffer):
+        """
+        Scan the whole buffer again, e.g. after the index was replaced.
+        """
+        self.__states.clear()
+        state = AbbreviationIndex.EMPTY_STATE
+        for char in buffer:
+            state = self.index.advance(state, char)
+            self.__states.append(state)
+
+    def push(self, buffer):
+        """
+        Scan the character just appended to the buffer.
+
+        @param buffer: the input buffer, ending with the new character
+        @return: list of targets triggered by the new character, in index order
+        """
+        if self.__states:
+            previous = self.__states[-1]
+        else:
+            previous = AbbreviationIndex.EMPTY_STATE
+
+        char = buffer[-1]
+        state = self.index.advance(previous, char)
+        self.__states.append(state)
+
+        if not state[0] and not state[1] and not previous[0] and not previous[1]:
+            return []
+
+        found = {}
+        end = len(buffer)
+        for target, length, position in self.index.completed(state):
+            if target.immediate and self.__boundary(target, buffer, end - length - 1):
+                found[target] = position
+
+        for target, length, position in self.index.completed(previous):
+            if not target.immediate and not target.wordChars.match(char) \
+                    and self.__boundary(target, buffer, end - length - 2):
+                found[target] = position
+
+        return self.index.sort(found)
+
+    def __boundary(self, target, buffer, position):
+        if position < 0 or target.triggerInside:
+            return True
+
+        before = buffer[position]
+        if target.ignoreCase:
+            # Some characters lower-case to several, only the last one precedes the abbreviation
+            before = before.lower()[-1:]
+        return not target.wordChars.match(before)
+
+
+class HotkeyTable:
+    """
+    Dispatch table mapping a (modifiers, key) chord to the folders or items bound to it.
+
+    Lookups are two dictionary accesses, so only the few targets bound to the pressed
+    chord have their window filter evaluated. The caller must still confirm each
+    candidate with C{check_hotkey}.
+
+    Like the L{AbbreviationIndex}, a table that may be in use is never modified;
+    changes are made to a L{copy}. The keys of each set of modifiers and the targets
+    are kept in L{PersistentMap}s, so a change only copies a few of their nodes and
+    the dictionary of the sets of modifiers in use.
+    """
+
+    def __init__(self):
+        self.__table = {}
+        # Target -> chord it was added under
+        self.__keys = PersistentMap()
+        # Ids of the dictionaries that may be modified in place, None if all of them
+        self.__owned = None
+        self.__count = 0
+
+    def __len__(self):
+        return self.__count
+
+    def __contains__(self, target):
+        return target in self.__keys
+
+    def copy(self):
+        """
+        Return a table that can be changed without affecting this one, and the
+        other way round.
+        """
+        table = HotkeyTable()
+        table.__table = self.__table
+        table.__keys = self.__keys.copy()
+        table.__owned = set()
+        table.__count = self.__count
+        self.__owned = set()
+        return table
+
+    def add(self, target):
+        """
+        Add the given target under its current hotkey. Targets bound to the same chord
+        are returned by L{lookup} in the order in which they were added.
+        """
+        if target.hotKey is None or target in self.__keys:
+            return
+
+        modifiers = tuple(target.modifiers)
+        keys = self.__keysFor(modifiers)
+        keys[target.hotKey] = keys.get(target.hotKey, ()) + (target,)
+        self.__keys[target] = (modifiers, target.hotKey)
+        self.__count += 1
+
+    def remove(self, target):
+        """
+        Remove the given target, under the hotkey it was added with.
+        """
+        chord = self.__keys.pop(target, None)
+        if chord is None:
+            return
+
+        modifiers, key = chord
+        self.__count -= 1
+        keys = self.__keysFor(modifiers)
+        targets = tuple(t for t in keys.get(key, ()) if t is not target)
+        if targets:
+            keys[key] = targets
+        else:
+            keys.pop(key, None)
+
+    def __keysFor(self, modifiers):
+        if self.__owned is None:
+            return self.__table.setdefault(modifiers, PersistentMap())
+
+        if id(self.__table) not in self.__owned:
+            self.__table = dict(self.__table)
+            self.__owned.add(id(self.__table))
+
+        keys = self.__table.get(modifiers)
+        if keys is None or id(keys) not in self.__owned:
+            keys = keys.copy() if keys is not None else PersistentMap()
+            self.__owned.add(id(keys))
+            self.__table[modifiers] = keys
+
+        return keys
+
+    def chords(self):
+        """
+        Return (modifiers, key, targets) tuples of all chords in use.
+        """
+        return [(modifiers, key, targets) for modifiers, keys in self.__table.items()
+                for key, targets in keys.items()]
+
+    def lookup(self, modifiers, key):
+        """
+        Return the targets bound to the given chord.
+
+        @param modifiers: sorted list of modifiers currently held
+        @param key: the raw (unshifted) key pressed
+        """
+        keys = self.__table.get(tuple(modifiers))
+        if keys is None:
+            return ()
+
+        return keys.get(key, ())
+
+
+class PathIndex:
+    """
+    Maps the paths on disk of folders and items to the objects, so that file system
+    events can be resolved without scanning the whole configuration.
+
+    Three maps are kept: folder paths to folders, content (.txt/.py) paths to items,
+    and JSON sidecar paths to items. Each target remembers the keys it was added
+    under, so it can be removed or renamed after its path has already changed.
+
+    Folders are also indexed by title and items by description, for the entry points
+    that run or return a folder or item by name. Names need not be unique; all
+    targets sharing one are kept, in the order they were added.
+
+    All maps are L{PersistentMap}s, so a copy costs the same for any number of
+    folders and items.
+    """
+
+    def __init__(self):
+        self.folders = PersistentMap()
+        self.items = PersistentMap()
+        self.jsonPaths = PersistentMap()
+        self.titles = PersistentMap()
+        self.descriptions = PersistentMap()
+        self.__keys = PersistentMap()
+
+    def copy(self):
+        """
+        Return an index that can be changed without affecting this one, and the
+        other way round.
+        """
+        index = PathIndex()
+        index.folders = self.folders.copy()
+        index.items = self.items.copy()
+        index.jsonPaths = self.jsonPaths.copy()
+        index.titles = self.titles.copy()
+        index.descriptions = self.descriptions.copy()
+        index.__keys = self.__keys.copy()
+        return index
+
+    def add_folder(self, folder):
+        """
+        Add a single folder, without its contents. Folders that were never saved
+        (without a path) are only indexed by title.
+        """
+        if folder in self.__keys:
+            return
+
+        if folder.path is not None:
+            self.folders.setdefault(folder.path, folder)
+        self.__addName(self.titles, folder.title, folder)
+        self.__keys[folder] = (True, folder.path, None, folder.title)
+
+    def add_item(self, item):
+        """
+        Add a phrase or script. Items that were never saved (without a path) are only
+        indexed by description.
+        """
+        if item in self.__keys:
+            return
+
+        jsonPath = None
+        if item.path is not None:
+            jsonPath = item.get_json_path()
+            self.items.setdefault(item.path, item)
+            self.jsonPaths.setdefault(jsonPath, item)
+        self.__addName(self.descriptions, item.description, item)
+        self.__keys[item] = (False, item.path, jsonPath, item.description)
+
+    def targets(self):
+        """
+        Return all indexed folders and all indexed items, as two lists in no
+        particular order.
+        """
+        folders = []
+        items = []
+        for target, keys in self.__keys.items():
+            if keys[0]:
+                folders.append(target)
+            else:
+                items.append(target)
+        return folders, items
+
+    def __addName(self, names, name, target):
+        # Tuples are replaced rather than changed, for readers on other threads
+        names[name] = names.get(name, ()) + (target,)
+
+    def __removeName(self, names, name, target):
+        targets = tuple(t for t in names.get(name, ()) if t is not target)
+        if targets:
+            names[name] = targets
+        else:
+            names.pop(name, None)
+
+    def remove(self, target):
+        """
+        Remove a folder (without its contents) or an item, under the paths it was added with.
+        """
+        keys = self.__keys.pop(target, None)
+        if keys is None:
+            return
+
+        isFolder, path, jsonPath, name = keys
+        if isFolder:
+            if self.folders.get(path) is target:
+                del self.folders[path]
+            self.__removeName(self.titles, name, target)
+        else:
+            if self.items.get(path) is target:
+                del self.items[path]
+            if self.jsonPaths.get(jsonPath) is target:
+                del self.jsonPaths[jsonPath]
+            self.__removeName(self.descriptions, name, target)
+
+    def moved(self, target):
+        """
+        Update the paths and name of a folder (without its contents) or an item after
+        it was renamed or moved.
+        """
+        if target not in self.__keys:
+            return
+
+        isFolder = self.__keys[target][0]
+        self.remove(target)
+        if isFolder:
+            self.add_folder(target)
+        else:
+            self.add_item(target)
+
+    def folder(self, path):
+        return self.folders.get(path)
+
+    def item(self, path):
+        return self.items.get(path)
+
+    def json_owner(self, jsonPath):
+        """
+        Return the item whose settings are stored in the given JSON sidecar file.
+        """
+        return self.jsonPaths.get(jsonPath)
+
+    def folder_named(self, title):
+        """
+        Return the first folder with the given title, or None.
+
+        The title may be qualified with the titles of the enclosing folders, as in
+        C{"Top/Sub/Title"}, to pick one of several folders sharing a title.
+        """
+        return self.__named(self.titles, title, None)
+
+    def item_named(self, description, itemType=None):
+        """
+        Return the first item with the given description, or None. Like folder titles,
+        the description may be qualified with the titles of the enclosing folders.
+
+        @param itemType: only return items of this class
+        """
+        return self.__named(self.descriptions, description, itemType)
+
+    def __named(self, names, name, targetType):
+        for target in names.get(name, ()):
+            if targetType is None or isinstance(target, targetType):
+                return target
+
+        # Try every split into enclosing folders and name, as names may contain '/'
+        position = name.rfind('/')
+        while position > 0:
+            qualifier = name[:position]
+            for target in names.get(name[position + 1:], ()):
+                if (targetType is None or isinstance(target, targetType)) and \
+                        self.__qualifier(target) == qualifier:
+                    return target
+            position = name.rfind('/', 0, position)
+
+        return None
+
+    def __qualifier(self, target):
+        titles = []
+        parent = target.parent
+        while parent is not None:
+            titles.append(parent.title)
+            parent = parent.parent
+
+        return '/'.join(reversed(titles))
+
+
+class WindowFilterCache:
+    """
+    Caches window filter results for recently seen windows.
+
+    Results are keyed on the (title, class) window info and on the compiled filter
+    regex, so any number of items sharing a folder filter cost a single regex match
+    per window. The regex that applies to each folder or item is cached as well, to
+    avoid walking up the parent chain on every keypress.
+
+    The cache must be invalidated whenever the configuration changes. Only the most
+    recently used windows are kept.
+    """
+
+    def __init__(self, maxWindows=64):
+        self.maxWindows = maxWindows
+        self.__lock = threading.Lock()
+        self.__windows = collections.OrderedDict()
+        self.__regexes = {}
+
+    def invalidate(self):
+        """
+        Forget everything, e.g. after filters or the folder hierarchy were changed.
+        """
+        with self.__lock:
+            self.__windows.clear()
+            self.__regexes = {}
+
+    def focus_changed(self):
+        """
+        Forget the cached results for all windows, keeping the applicable regexes.
+        """
+        with self.__lock:
+            self.__windows.clear()
+
+    def applicable_regex(self, target):
+        """
+        Return the (possibly inherited) filter regex of the given folder or item.
+        """
+        regexes = self.__regexes
+        try:
+            return regexes[target]
+        except KeyError:
+            regex = target.get_applicable_regex()
+            regexes[target] = regex
+            return regex
+
+    def matches(self, regex, windowInfo, evaluate):
+        """
+        Return whether the given filter regex matches the window.
+
+        @param regex: the compiled filter regex
+        @param windowInfo: tuple of window title and window class
+        @param evaluate: callable taking the regex and window info, used on a cache miss
+        """
+        with self.__lock:
+            results = self.__windows.get(windowInfo)
+            if results is None:
+                results = {}
+                self.__windows[windowInfo] = results
+                if len(self.__windows) > self.maxWindows:
+                    self.__windows.popitem(last=False)
+            else:
+                self.__windows.move_to_end(windowInfo)
+
+            if regex in results:
+                return results[regex]
+
+        result = bool(evaluate(regex, windowInfo))
+        results[regex] = result
+        return result
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Usage statistics of phrases and scripts, kept apart from their configuration.
+
+This module must not import the rest of AutoKey, except for L{fsevents} and
+L{persistence}.
+"""
+
+import json, logging, os, threading, time
+
+from .fsevents import WRITE_TRACKER
+from .persistence import WRITE_BEHIND, atomic_write
+
+_logger = logging.getLogger("usagestats")
+
+# Number of log lines beyond one per item after which the log is compacted
+COMPACT_AFTER = 5000
+
+
+class UsageStats:
+    """
+    Counts how often each phrase and script was used, and how many keystrokes it
+    saved, in an append-only log.
+
+    Items are identified by the path of their file. Every line of the log is a JSON
+    list, one of:
+        - C{["use", timestamp, saved, path]} for a single use
+        - C{["total", lastUsed, uses, saved, path]} for the uses folded in by L{compact}
+        - C{["move", timestamp, oldPath, newPath]} for an item or folder renamed
+
+    Uses are counted in memory and appended to the log in the background through
+    C{WRITE_BEHIND}, so recording one never writes to disk on the keystroke path.
+    Until L{open} is called, nothing is read or written at all.
+    """
+
+    def __init__(self, compactAfter=COMPACT_AFTER):
+        self.path = None
+        self.compactAfter = compactAfter
+        self.__lock = threading.Lock()
+        self.__items = {}
+        self.__folders = {}
+        self.__pending = []
+        self.__logged = 0
+
+    def open(self, path):
+        """
+        Read the totals from the log at the given path, and append to it from now on.
+        """
+        with self.__lock:
+            self.path = path
+            self.__items = {}
+            self.__logged = 0
+            damaged = False
+            try:
+                with open(path, 'r') as inFile:
+                    for line in inFile:
+                        self.__logged += 1
+                        try:
+                            self.__apply(json.loads(line))
+                        except Exception:
+                            # A line cut short by a crash while appending
+                            _logger.warning("Ignoring invalid usage record %r", line)
+                            damaged = True
+            except FileNotFoundError:
+                pass
+
+            for record in self.__pending:
+                self.__apply(record)
+            self.__rebuildFolders()
+
+        # Rewritten without the damaged lines, so appending starts on a fresh line
+        if damaged or self.__logged > len(self.__items) + self.compactAfter:
+            self.compact()
+
+    def record(self, itemPath, saved=0, timestamp=None):
+        """
+        Count one use of the phrase or script at the given path.
+
+        @param saved: number of keystrokes saved by this use
+        """
+        if itemPath is None:
+            return
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        record = ["use", timestamp, saved, itemPath]
+        with self.__lock:
+            self.__apply(record)
+            for folderPath in self.__ancestors(itemPath):
+                self.__folders[folderPath] = self.__folders.get(folderPath, 0) + 1
+            self.__pending.append(record)
+
+        if self.path is not None:
+            WRITE_BEHIND.schedule(self)
+
+    def moved(self, oldPath, newPath):
+        """
+        Carry the statistics over to the new path of a renamed item or folder.
+        """
+        if oldPath is None or oldPath == newPath:
+            return
+
+        record = ["move", int(time.time()), oldPath, newPath]
+        with self.__lock:
+            if not self.__apply(record):
+                return
+            self.__rebuildFolders()
+            self.__pending.append(record)
+
+        if self.path is not None:
+            WRITE_BEHIND.schedule(self)
+
+    def uses(self, itemPath):
+        entry = self.__items.get(itemPath)
+        return entry[1] if entry is not None else 0
+
+    def saved(self, itemPath):
+        """
+        Return the number of keystrokes saved by the phrase or script at the given path.
+        """
+        entry = self.__items.get(itemPath)
+        return entry[2] if entry is not None else 0
+
+    def last_used(self, itemPath):
+        """
+        Return the time of the last use of the given item, or None if it was never used.
+        """
+        entry = self.__items.get(itemPath)
+        return entry[0] if entry is not None else None
+
+    def folder_uses(self, folderPath):
+        """
+        Return the number of uses of all phrases and scripts in the given folder and
+        its subfolders.
+        """
+        return self.__folders.get(folderPath, 0)
+
+    def total_saved(self):
+        """
+        Return the number of keystrokes saved by all phrases and scripts together.
+        """
+        with self.__lock:
+            return sum(entry[2] for entry in self.__items.values())
+
+    def persist(self):
+        """
+        Append the uses recorded since the last call to the log. Called by
+        C{WRITE_BEHIND}.
+        """
+        with self.__lock:
+            pending = self.__pending
+            self.__pending = []
+            path = self.path
+
+        if path is None or not pending:
+            return
+
+        with open(path, 'a') as outFile:
+            outFile.write("".join(json.dumps(record) + "\n" for record in pending))
+        WRITE_TRACKER.written(path)
+
+        with self.__lock:
+            self.__logged += len(pending)
+            compact = self.__logged > len(self.__items) + self.compactAfter
+
+        if compact:
+            self.compact()
+
+    def compact(self):
+        """
+        Replace the log with a single total per item.
+        """
+        with self.__lock:
+            if self.path is None:
+                return
+            records = [["total", lastUsed, uses, saved, itemPath]
+                       for itemPath, (lastUsed, uses, saved) in self.__items.items()]
+            atomic_write(self.path, "".join(json.dumps(record) + "\n" for record in records))
+            self.__logged = len(records)
+            # Already part of the totals
+            self.__pending = []
+
+        _logger.info("Compacted usage statistics to %d items", len(records))
+
+    def __apply(self, record):
+        """
+        Add a log record to the totals.
+
+        @return: whether the record changed anything
+        """
+        kind = record[0]
+        if kind == "use":
+            timestamp, saved, itemPath = record[1:]
+            self.__add(itemPath, timestamp, 1, saved)
+        elif kind == "total":
+            lastUsed, uses, saved, itemPath = record[1:]
+            self.__add(itemPath, lastUsed, uses, saved)
+        elif kind == "move":
+            timestamp, oldPath, newPath = record[1:]
+            prefix = oldPath + os.sep
+            moved = [itemPath for itemPath in self.__items
+                     if itemPath == oldPath or itemPath.startswith(prefix)]
+            for itemPath in moved:
+                entry = self.__items.pop(itemPath)
+                self.__add(newPath + itemPath[len(oldPath):], *entry)
+            return bool(moved)
+        else:
+            raise ValueError("Unknown usage record %r" % kind)
+
+        return True
+
+    def __add(self, itemPath, lastUsed, uses, saved):
+        entry = self.__items.get(itemPath)
+        if entry is None:
+            self.__items[itemPath] = (lastUsed, uses, saved)
+        else:
+            self.__items[itemPath] = (max(entry[0], lastUsed), entry[1] + uses, entry[2] + saved)
+
+    def __rebuildFolders(self):
+        folders = {}
+        for itemPath, entry in self.__items.items():
+            for folderPath in self.__ancestors(itemPath):
+                folders[folderPath] = folders.get(folderPath, 0) + entry[1]
+        self.__folders = folders
+
+    def __ancestors(self, itemPath):
+        path = os.path.dirname(itemPath)
+        while path and path != os.path.dirname(path):
+            yield path
+            path = os.path.dirname(path)
+
+
+# Shared by the phrases and scripts, and the popup menus sorted by usage
+USAGE_STATS = UsageStats()
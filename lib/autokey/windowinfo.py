@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Caching of window information and of the active window, kept up to date by X events.
+
+This module must not import the rest of AutoKey, nor Xlib; windows are
+identified by their X resource id.
+"""
+
+import collections, logging, threading
+
+_logger = logging.getLogger("windowinfo")
+
+
+class WindowInfoCache:
+    """
+    Caches the (title, class) of windows, keyed by window id.
+
+    The title and class of a window may come from one of its ancestors, so every
+    entry records the windows whose properties it was read from. A property change
+    on any of them invalidates the entry.
+
+    Lookups run on the X event thread while invalidations come from the X event
+    listener, so an entry is only stored if nothing was invalidated while it was
+    being read; otherwise it could hold a title that has already changed.
+    """
+
+    def __init__(self, maxWindows=256):
+        self.maxWindows = maxWindows
+        self.__lock = threading.Lock()
+        self.__entries = collections.OrderedDict()
+        # Window id -> ids of the windows whose entry was read from its properties
+        self.__dependents = {}
+        self.__generation = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, windowId):
+        """
+        Return the cached (title, class) of a window, None if it is not cached.
+        """
+        with self.__lock:
+            entry = self.__entries.get(windowId)
+            if entry is None:
+                return None
+
+            self.__entries.move_to_end(windowId)
+            return entry[0]
+
+    def begin(self):
+        """
+        Return a token to pass to L{put} for information read after this call.
+        """
+        return self.__generation
+
+    def put(self, windowId, info, sources, token):
+        """
+        Store the information of a window, unless a window was invalidated since
+        the token was taken.
+
+        @param sources: ids of the windows whose properties the information was read from
+        @return: whether the information was stored
+        """
+        with self.__lock:
+            if token != self.__generation:
+                return False
+
+            self.__remove(windowId)
+            sources = frozenset(sources) | frozenset([windowId])
+            self.__entries[windowId] = (info, sources)
+            for source in sources:
+                self.__dependents.setdefault(source, set()).add(windowId)
+
+            while len(self.__entries) > self.maxWindows:
+                self.__remove(next(iter(self.__entries)))
+
+            return True
+
+    def invalidate(self, windowId):
+        """
+        Drop the information read from the properties of the given window, because
+        they changed or the window is gone.
+        """
+        with self.__lock:
+            self.__generation += 1
+            for dependent in self.__dependents.pop(windowId, ()):
+                self.__remove(dependent)
+
+    def clear(self):
+        with self.__lock:
+            self.__generation += 1
+            self.__entries.clear()
+            self.__dependents.clear()
+
+    def __remove(self, windowId):
+        entry = self.__entries.pop(windowId, None)
+        if entry is None:
+            return
+
+        for source in entry[1]:
+            dependents = self.__dependents.get(source)
+            if dependents is not None:
+                dependents.discard(windowId)
+                if not dependents:
+                    del self.__dependents[source]
+
+
+class ActiveWindowTracker:
+    """
+    Keeps the window that has the input focus, so that it does not have to be asked
+    from the X server on every keypress, send and click.
+
+    The X interface resets the tracker when X events tell that the focus may have
+    moved, and sets the window again once it has asked for it. While the window is
+    unknown, L{window} is None and the focus must be queried.
+
+    Components that depend on the active window subscribe to be called, without
+    arguments, whenever it changes to another window. Waits for the active window or
+    its title use L{wait}.
+    """
+
+    def __init__(self):
+        self.__condition = threading.Condition()
+        self.__window = None
+        self.__windowId = None
+        self.__resets = 0
+        self.__listeners = []
+        # Number of changes of the active window or its information, for L{wait}
+        self.changes = 0
+
+    @property
+    def window(self):
+        """
+        The window that has the focus, None if it is not known.
+        """
+        return self.__window
+
+    def subscribe(self, listener):
+        with self.__condition:
+            self.__listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self.__condition:
+            self.__listeners.remove(listener)
+
+    def begin(self):
+        """
+        Return a token to pass to L{set_window} for a focus queried after this call.
+        """
+        return self.__resets
+
+    def set_window(self, window, windowId, token):
+        """
+        Record the window that has the focus, unless the tracker was reset since the
+        token was taken, and notify the subscribers if it is another window.
+
+        @return: whether the window was recorded
+        """
+        with self.__condition:
+            if token != self.__resets:
+                return False
+
+            self.__window = window
+            changed = windowId != self.__windowId
+            self.__windowId = windowId
+            if changed:
+                self.changes += 1
+                self.__condition.notify_all()
+            listeners = list(self.__listeners) if changed else []
+
+        for listener in listeners:
+            try:
+                listener()
+            except Exception:
+                _logger.exception("Error in focus change listener %r", listener)
+
+        return True
+
+    def reset(self):
+        """
+        Forget the active window, because the focus may have moved.
+        """
+        with self.__condition:
+            self.__resets += 1
+            self.__window = None
+
+    def info_changed(self):
+        """
+        Wake the waits, because the title or class of a window changed.
+        """
+        with self.__condition:
+            self.changes += 1
+            self.__condition.notify_all()
+
+    def wait(self, changes, timeout):
+        """
+        Wait until the active window or the information of a window changed.
+
+        @param changes: value of L{changes} when the active window was last checked
+        @param timeout: maximum time to wait, in seconds
+        @return: the current value of L{changes}
+        """
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.changes != changes, timeout)
+            return self.changes
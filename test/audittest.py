@@ -0,0 +1,65 @@
+import contextlib, io, json, os, shutil, sys, tempfile, unittest
+
+from lib.autokey.audit import *
+from lib.autokey import audit as auditmodule
+
+def make_phrase(folder, description, abbreviation=None, immediate=False, hotkey=None):
+    phrase = Phrase(description, "Text of " + description)
+    phrase.parent = folder
+    if abbreviation is not None:
+        phrase.add_abbreviation(abbreviation)
+        phrase.immediate = immediate
+        phrase.modes.append(TriggerMode.ABBREVIATION)
+    if hotkey is not None:
+        phrase.set_hotkey(["<ctrl>"], hotkey)
+        phrase.modes.append(TriggerMode.HOTKEY)
+    folder.items.append(phrase)
+    phrase.persist()
+
+class AuditTest(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.path = os.path.join(self.base, "Library")
+        folder = Folder("Library", path=self.path)
+        folder.persist()
+        make_phrase(folder, "short", "ad", immediate=True)
+        make_phrase(folder, "long", "address")
+        make_phrase(folder, "first", hotkey="k")
+        make_phrase(folder, "second", hotkey="k")
+        make_phrase(folder, "unrelated", "brb")
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def testLoadFolders(self):
+        folders, globalHotkeys = load_folders([self.path])
+        self.assertEqual([folder.title for folder in folders], ["Library"])
+        self.assertEqual(len(folders[0].items), 5)
+        self.assertEqual(globalHotkeys, [])
+
+    def testAudit(self):
+        folders, globalHotkeys = load_folders([self.path])
+        found = sorted((c.kind, c.target.description, c.other.description)
+                       for c in audit(folders, globalHotkeys))
+        # Hotkey duplicates are reported in load order
+        self.assertEqual(found[0][0], conflicts.DUPLICATE)
+        self.assertEqual(sorted(found[0][1:]), ["first", "second"])
+        self.assertEqual(found[1], (conflicts.SHADOWED, "long", "short"))
+
+        found = audit(folders, globalHotkeys, duplicatesOnly=True)
+        self.assertEqual([c.kind for c in found], [conflicts.DUPLICATE])
+
+    def testMain(self):
+        output = io.StringIO()
+        argv = sys.argv
+        sys.argv = ["audit", "--json", self.path]
+        try:
+            with contextlib.redirect_stdout(output), self.assertRaises(SystemExit) as exit:
+                auditmodule.main()
+        finally:
+            sys.argv = argv
+
+        self.assertEqual(exit.exception.code, 1)
+        self.assertEqual(sorted(c["kind"] for c in json.loads(output.getvalue())),
+                         [conflicts.DUPLICATE, conflicts.SHADOWED])
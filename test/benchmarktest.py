@@ -0,0 +1,17 @@
+import unittest
+
+from lib.autokey.benchmark import *
+
+class BenchmarkTest(unittest.TestCase):
+
+    def testRun(self):
+        folders, abbreviations = generate_config(folders=3, phrases=50, scripts=5, hotkeys=5, filters=3)
+        self.assertEqual(len(abbreviations), 55)
+        trace = generate_trace(abbreviations, keys=2000, abbreviationRate=0.5)
+        self.assertEqual(len(trace), 2000)
+
+        results = Benchmark(folders).run(trace)
+        self.assertGreater(results["keysPerSecond"], 0)
+        self.assertGreater(results["expansions"] + results["scripts"], 0)
+        for key in ("mean", "p50", "p95", "p99", "max"):
+            self.assertIn(key, results)
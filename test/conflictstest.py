@@ -0,0 +1,123 @@
+import re, unittest
+
+from lib.autokey.conflicts import *
+from lib.autokey.triggerindex import AbbreviationIndex, HotkeyTable
+
+WORD_CHARS = re.compile(r"[\w]", re.UNICODE)
+
+class Target:
+
+    def __init__(self, name, abbreviations=(), ignoreCase=False, immediate=False, triggerInside=False,
+                 regex=None, modifiers=(), hotKey=None):
+        self.name = name
+        self.path = "/" + name
+        self.abbreviations = list(abbreviations)
+        self.ignoreCase = ignoreCase
+        self.immediate = immediate
+        self.triggerInside = triggerInside
+        self.wordChars = WORD_CHARS
+        self.regex = re.compile(regex) if regex is not None else None
+        self.modifiers = list(modifiers)
+        self.hotKey = hotKey
+
+    def get_applicable_regex(self):
+        return self.regex
+
+    def __repr__(self):
+        return self.name
+
+    __str__ = __repr__
+
+def detector(*targets):
+    index = AbbreviationIndex()
+    table = HotkeyTable()
+    for target in targets:
+        index.add(target)
+        table.add(target)
+    return ConflictDetector([index], [table])
+
+def summary(conflicts):
+    return sorted((c.kind, c.target.name, c.trigger, c.other.name, c.otherTrigger) for c in conflicts)
+
+class ConflictDetectorTest(unittest.TestCase):
+
+    def testDuplicate(self):
+        first = Target("first", ["brb"])
+        second = Target("second", ["brb"])
+        conflicts = detector(first, second)
+        self.assertEqual(summary(conflicts.abbreviation_conflicts(first, "brb")),
+                         [(DUPLICATE, "first", "brb", "second", "brb")])
+        self.assertEqual(len(conflicts.audit()), 1)
+
+    def testFilters(self):
+        first = Target("first", ["brb"], regex="gedit")
+        second = Target("second", ["brb"], regex="firefox")
+        unfiltered = Target("unfiltered", ["brb"])
+        conflicts = detector(first, second, unfiltered)
+        self.assertEqual(summary(conflicts.abbreviation_conflicts(first, "brb")),
+                         [(DUPLICATE, "first", "brb", "unfiltered", "brb")])
+
+    def testImmediatePrefix(self):
+        short = Target("short", ["ad"], immediate=True)
+        long = Target("long", ["address"])
+        conflicts = detector(short, long)
+        expected = [(SHADOWED, "long", "address", "short", "ad")]
+        # Found from either side
+        self.assertEqual(summary(conflicts.abbreviation_conflicts(long, "address")), expected)
+        self.assertEqual(summary(conflicts.abbreviation_conflicts(short, "ad")), expected)
+        self.assertEqual(summary(conflicts.audit()), expected)
+
+    def testPrefixNeedsTrigger(self):
+        # "ad" only fires after a non-word character, so typing "address" is fine
+        conflicts = detector(Target("short", ["ad"]), Target("long", ["address"]))
+        self.assertEqual(conflicts.audit(), [])
+
+        conflicts = detector(Target("short", ["ad"]), Target("long", ["ad.dress"]))
+        self.assertEqual(summary(conflicts.audit()), [(SHADOWED, "long", "ad.dress", "short", "ad")])
+
+    def testSuffix(self):
+        # Both wait for the same trigger character
+        conflicts = detector(Target("short", ["ess"], triggerInside=True), Target("long", ["address"]))
+        self.assertEqual(summary(conflicts.audit()), [(AMBIGUOUS, "long", "address", "short", "ess")])
+
+        # Without trigger inside, the suffix never fires inside the word
+        conflicts = detector(Target("short", ["ess"]), Target("long", ["address"]))
+        self.assertEqual(conflicts.audit(), [])
+
+        conflicts = detector(Target("short", ["ess"], triggerInside=True, immediate=True),
+                             Target("long", ["address"]))
+        self.assertEqual(summary(conflicts.audit()), [(SHADOWED, "long", "address", "short", "ess")])
+
+    def testInfix(self):
+        conflicts = detector(Target("short", ["dre"], triggerInside=True, immediate=True),
+                             Target("long", ["address"]))
+        self.assertEqual(summary(conflicts.audit()), [(SHADOWED, "long", "address", "short", "dre")])
+
+        conflicts = detector(Target("short", ["dre"], triggerInside=True), Target("long", ["address"]))
+        self.assertEqual(conflicts.audit(), [])
+
+    def testIgnoreCase(self):
+        short = Target("short", ["ad"], ignoreCase=True, immediate=True)
+        long = Target("long", ["ADdress"])
+        conflicts = detector(short, long)
+        expected = [(SHADOWED, "long", "ADdress", "short", "ad")]
+        self.assertEqual(summary(conflicts.abbreviation_conflicts(long, "ADdress")), expected)
+        self.assertEqual(summary(conflicts.abbreviation_conflicts(short, "ad")), expected)
+
+        conflicts = detector(Target("short", ["ad"], immediate=True), long)
+        self.assertEqual(conflicts.audit(), [])
+
+    def testUnsavedTarget(self):
+        conflicts = detector(Target("long", ["address"]))
+        new = Target("new", ["ad"], immediate=True)
+        self.assertEqual(summary(conflicts.abbreviation_conflicts(new, "ad")),
+                         [(SHADOWED, "long", "address", "new", "ad")])
+
+    def testHotkeys(self):
+        first = Target("first", modifiers=["<ctrl>"], hotKey="k")
+        second = Target("second", modifiers=["<ctrl>"], hotKey="k", regex="gedit")
+        third = Target("third", modifiers=["<ctrl>"], hotKey="k", regex="firefox")
+        conflicts = detector(first, second, third)
+        self.assertEqual(summary(conflicts.hotkey_conflicts(second, ["<ctrl>"], "k")),
+                         [(DUPLICATE, "second", "<ctrl>+k", "first", "<ctrl>+k")])
+        self.assertEqual(len(conflicts.audit()), 2)
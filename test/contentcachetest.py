@@ -0,0 +1,65 @@
+import os, tempfile, unittest
+
+from lib.autokey.contentcache import *
+
+class Owner:
+    pass
+
+class ContentCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = ContentCache(budget=10)
+
+    def tearDown(self):
+        self.cache.clear()
+        self.dir.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w') as outFile:
+            outFile.write(text)
+        return path
+
+    def testRead(self):
+        owner = Owner()
+        path = self.write("a.txt", "hello")
+        self.assertEqual(self.cache.read(owner, path), "hello")
+        self.assertEqual(self.cache.size, 5)
+
+        # cached until invalidated
+        self.write("a.txt", "changed")
+        self.assertEqual(self.cache.read(owner, path), "hello")
+        self.cache.invalidate(owner)
+        self.assertEqual(self.cache.read(owner, path), "changed")
+
+    def testRenamed(self):
+        owner = Owner()
+        self.cache.read(owner, self.write("a.txt", "old"))
+        self.assertEqual(self.cache.read(owner, self.write("b.txt", "new")), "new")
+        self.assertEqual(self.cache.size, 3)
+
+    def testBudget(self):
+        owners = [Owner() for i in range(3)]
+        for i, owner in enumerate(owners):
+            self.cache.read(owner, self.write("%d.txt" % i, "12345"))
+        self.assertEqual(self.cache.size, 10)
+
+        # the least recently used body was evicted and is read again
+        self.write("0.txt", "54321")
+        self.assertEqual(self.cache.read(owners[0], os.path.join(self.dir.name, "0.txt")), "54321")
+
+    def testLarge(self):
+        small = Owner()
+        self.cache.read(small, self.write("small.txt", "12345"))
+
+        # read every time, without evicting the rest
+        owner = Owner()
+        text = "line\n" * 5
+        path = self.write("big.txt", text.replace("\n", "\r\n"))
+        self.assertEqual(self.cache.read(owner, path, 'UTF-8'), text)
+        self.write("big.txt", "changed, still large")
+        self.assertEqual(self.cache.read(owner, path, 'UTF-8'), "changed, still large")
+        self.assertEqual(self.cache.size, 5)
+        self.write("small.txt", "54321")
+        self.assertEqual(self.cache.read(small, os.path.join(self.dir.name, "small.txt")), "12345")
@@ -0,0 +1,137 @@
+import os, pickle, shutil, tempfile, unittest
+from unittest import mock
+
+from lib.autokey.configmanager import *
+from lib.autokey import folderloader
+
+def write(path, text):
+    with open(path, 'w') as outFile:
+        outFile.write(text)
+
+def describe(folder):
+    """
+    Everything Folder.load() fills in, in load order
+    """
+    items = [(type(item).__name__, item.description, item.abbreviations, item.modes,
+              getattr(item, "phrase", None) or getattr(item, "code", None), item.parent is folder)
+             for item in folder.items]
+    return (folder.title, folder.path, folder.abbreviations, folder.modes, items,
+            [(describe(subFolder), subFolder.parent is folder) for subFolder in folder.folders])
+
+class FolderLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.path = os.path.join(self.base, "Library")
+        library = Folder("Library", path=self.path)
+        library.add_abbreviation("lib")
+        library.set_modes([TriggerMode.ABBREVIATION])
+        library.persist()
+        for i in range(20):
+            phrase = Phrase("phrase %d" % i, "Text of phrase %d" % i)
+            phrase.add_abbreviation("p%d" % i)
+            phrase.set_modes([TriggerMode.ABBREVIATION])
+            library.add_item(phrase)
+            phrase.persist()
+        script = Script("script", "print('hello')")
+        library.add_item(script)
+        script.persist()
+
+        sub = Folder("Sub")
+        library.add_folder(sub)
+        sub.persist()
+        broken = Phrase("broken", "Its settings cannot be read")
+        sub.add_item(broken)
+        broken.persist()
+        bare = os.path.join(self.path, "Bare")
+        os.mkdir(bare)
+
+        # Broken settings, and files and folders that are not items
+        write(os.path.join(sub.path, ".folder.json"), "{not json")
+        write(broken.get_json_path(), '{"description": "broken"')
+        write(os.path.join(bare, "no settings.txt"), "A phrase without settings")
+        write(os.path.join(self.path, "notes.md"), "Not a phrase")
+        write(os.path.join(self.path, ".hidden.txt"), "Hidden")
+        os.mkdir(os.path.join(self.path, "folder.txt"))
+
+        self.cachePath = os.path.join(self.base, "startup.cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def loadWithModel(self):
+        folder = Folder("", path=self.path)
+        folder.load()
+        return folder
+
+    def loadWithCache(self):
+        cache = StartupCache(self.cachePath)
+        cache.load()
+        with mock.patch.object(folderloader, "_scan_folder", wraps=folderloader._scan_folder) as scan:
+            folders = FolderLoader(cache=cache).load([self.path])
+        return folders[0], scan.call_count
+
+    def testParity(self):
+        expected = describe(self.loadWithModel())
+        folder = FolderLoader(maxWorkers=4).load([self.path])[0]
+        self.assertEqual(describe(folder), expected)
+        self.assertEqual(len(folder.items), 21)
+        self.assertEqual(sorted(f.title for f in folder.folders), ["", "Bare", "folder.txt"])
+
+    def testStartupCache(self):
+        expected = describe(self.loadWithModel())
+        folder, scans = self.loadWithCache()
+        self.assertEqual(scans, 4)
+        self.assertEqual(describe(folder), expected)
+
+        # Folders with broken settings are read again, the others come from the cache
+        folder, scans = self.loadWithCache()
+        self.assertEqual(scans, 1)
+        self.assertEqual(describe(folder), expected)
+
+    def testStaleCache(self):
+        self.loadWithCache()
+        phrasePath = os.path.join(self.path, "phrase 3.txt")
+        write(phrasePath, "Changed")
+        stat = os.stat(phrasePath)
+        os.utime(phrasePath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        folder, scans = self.loadWithCache()
+        self.assertEqual(scans, 2)
+        self.assertEqual(describe(folder), describe(self.loadWithModel()))
+        self.assertEqual([item.phrase for item in folder.items if item.description == "phrase 3"], ["Changed"])
+
+    def testCorruptCache(self):
+        expected = describe(self.loadWithModel())
+        self.loadWithCache()
+        with open(self.cachePath, 'rb') as inFile:
+            data = inFile.read()
+
+        for corrupt in (data[:len(data) // 2], b"not a pickle", b""):
+            with open(self.cachePath, 'wb') as outFile:
+                outFile.write(corrupt)
+            cache = StartupCache(self.cachePath)
+            with self.assertLogs("model", "WARNING"):
+                cache.load()
+            self.assertEqual(cache.records, {})
+
+            folder, scans = self.loadWithCache()
+            self.assertEqual(scans, 4)
+            self.assertEqual(describe(folder), expected)
+
+    def testForeignCache(self):
+        self.loadWithCache()
+        cache = StartupCache(self.cachePath)
+        cache.load()
+
+        # Written by another format, and a pickle that would create other objects
+        with open(self.cachePath, 'wb') as outFile:
+            pickle.dump((1, cache.records), outFile)
+        cache.load()
+        self.assertEqual(cache.records, {})
+
+        with open(self.cachePath, 'wb') as outFile:
+            pickle.dump({"header": cache.header, "records": mock.sentinel}, outFile)
+        with self.assertLogs("model", "WARNING"):
+            cache.load()
+        self.assertEqual(cache.records, {})
@@ -0,0 +1,96 @@
+import os, shutil, tempfile, time, unittest
+
+from lib.autokey.fsevents import *
+
+class EventCoalescerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.coalescer = EventCoalescer(delay=0.2, maxDelay=1.0)
+
+    def testDebounce(self):
+        self.coalescer.add("/a.txt", False, now=0.0)
+        self.coalescer.add("/a.txt", False, now=0.1)
+        self.assertEqual(self.coalescer.take(now=0.25), [])
+        self.assertEqual(self.coalescer.take(now=0.31), [("/a.txt", False)])
+        self.assertIsNone(self.coalescer.timeout(now=0.31))
+
+    def testLastEventWins(self):
+        for path, removed in [("/dir", False), ("/dir/a.txt", True), ("/dir/a.txt", False), ("/b.txt", False), ("/b.txt", True)]:
+            self.coalescer.add(path, removed, now=0.0)
+        self.assertEqual(self.coalescer.take(now=1.0), [("/dir", False), ("/dir/a.txt", False), ("/b.txt", True)])
+
+    def testMaxDelay(self):
+        for i in range(12):
+            self.coalescer.add("/a.txt", False, now=i * 0.1)
+        self.assertEqual(self.coalescer.take(now=1.1), [("/a.txt", False)])
+
+class WriteTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "a.txt")
+        self.tracker = WriteTracker()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write(self, text):
+        with open(self.path, "w") as outFile:
+            outFile.write(text)
+
+    def testOwnWrite(self):
+        self.write("ours")
+        self.tracker.written(self.path)
+        self.assertTrue(self.tracker.is_own(self.path, False))
+
+        time.sleep(0.01)
+        self.write("someone else's")
+        self.assertFalse(self.tracker.is_own(self.path, False))
+
+    def testUnknown(self):
+        self.write("theirs")
+        self.assertFalse(self.tracker.is_own(self.path, False))
+        self.assertFalse(self.tracker.is_own(self.path, True))
+
+    def testRemoval(self):
+        self.tracker.removed(self.dir)
+        shutil.rmtree(self.dir)
+        self.assertTrue(self.tracker.is_own(self.path, True))
+        self.assertFalse(self.tracker.is_own(self.path, False))
+
+    def testExpiry(self):
+        self.tracker.expiry = -1
+        self.write("ours")
+        self.tracker.written(self.path)
+        self.assertFalse(self.tracker.is_own(self.path, False))
+
+class WatchRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = WatchRegistry()
+        for wd, path in enumerate(["/data", "/data/a", "/data/a/b", "/data/a/b/c", "/data/ab", "/data/x"]):
+            self.registry.add(path, wd)
+
+    def testLookup(self):
+        self.assertIn("/data/a/b", self.registry)
+        self.assertEqual(self.registry.get_wd("/data/a/b"), 2)
+        self.assertEqual(self.registry.get_path(2), "/data/a/b")
+        self.assertEqual(len(self.registry), 6)
+
+    def testRemoveSubtree(self):
+        self.assertEqual(sorted(self.registry.remove("/data/a")), [1, 2, 3])
+        self.assertEqual(sorted(self.registry), ["/data", "/data/ab", "/data/x"])
+        self.assertIsNone(self.registry.get_path(3))
+        self.assertEqual(self.registry.remove("/data/a"), [])
+
+    def testDiscard(self):
+        self.registry.discard(5)
+        self.registry.discard(42)
+        self.assertNotIn("/data/x", self.registry)
+        self.assertEqual(len(self.registry), 5)
+
+    def testReusedDescriptor(self):
+        # the kernel may hand out the descriptor of a removed watch again
+        self.registry.discard(5)
+        self.registry.add("/data/y", 5)
+        self.assertEqual(self.registry.get_path(5), "/data/y")
@@ -0,0 +1,77 @@
+import unittest
+
+from lib.autokey.keycodepool import *
+
+class KeycodePoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = KeycodePool([200, 201])
+
+    def testAssign(self):
+        self.assertEqual(self.pool.assign("жфж"), [200])
+        self.assertEqual(self.pool.lookup("ж"), (200, 0))
+        self.assertEqual(self.pool.lookup("ф"), (200, 1))
+        self.assertEqual(self.pool.row(200), ("ж", "ф"))
+        self.assertEqual(self.pool.row(201), (None, None))
+
+    def testReuse(self):
+        self.pool.assign("жф")
+        self.assertEqual(self.pool.assign("фж"), [])
+        self.assertEqual(self.pool.assign("ы"), [201])
+
+    def testLeastRecentlyUsed(self):
+        self.pool.assign("абвг")
+        self.pool.assign("а")
+        self.assertEqual(self.pool.assign("д"), [200])
+        self.assertEqual(self.pool.lookup("д"), (200, 1))
+        self.assertNotIn("б", self.pool)
+        self.assertIn("а", self.pool)
+
+    def testTooManyCharacters(self):
+        self.assertEqual(self.pool.assign("абвгд"), [200, 201])
+        self.assertEqual(len(self.pool), 4)
+        self.assertIsNone(self.pool.lookup("д"))
+
+    def testKeepsPrevious(self):
+        self.pool.assign("абв")
+        pool = KeycodePool([201, 202], self.pool)
+        self.assertIsNone(pool.lookup("а"))
+        self.assertEqual(pool.lookup("в"), (201, 0))
+        self.assertEqual(pool.assign("гд"), [201, 202])
+        self.assertEqual(pool.lookup("г"), (201, 1))
+
+    def testRuns(self):
+        self.assertEqual(KeycodePool.runs([200, 201, 202, 205, 207, 208]), [(200, 3), (205, 1), (207, 2)])
+        self.assertEqual(KeycodePool.runs([]), [])
+
+OFFSET_MODIFIERS = {0: (), 1: ("<shift>",), 4: ("<alt_gr>",), 5: ("<alt_gr>", "<shift>")}
+
+class KeyEventsTest(unittest.TestCase):
+
+    def testUnmodified(self):
+        self.assertEqual(key_events([(38, 0), (39, 0)], OFFSET_MODIFIERS),
+                         [(True, 38, ()), (False, 38, ()), (True, 39, ()), (False, 39, ())])
+
+    def testModifiersHeld(self):
+        # "aBCd": shift is pressed once around both shifted keys
+        events = key_events([(38, 0), (56, 1), (54, 1), (40, 0)], OFFSET_MODIFIERS)
+        shift = ("<shift>",)
+        self.assertEqual(events, [(True, 38, ()), (False, 38, ()),
+                                  (True, "<shift>", None),
+                                  (True, 56, shift), (False, 56, shift),
+                                  (True, 54, shift), (False, 54, shift),
+                                  (False, "<shift>", None),
+                                  (True, 40, ()), (False, 40, ())])
+
+    def testModifiersChanged(self):
+        events = key_events([(26, 5), (26, 1)], OFFSET_MODIFIERS)
+        self.assertEqual(events, [(True, "<alt_gr>", None), (True, "<shift>", None),
+                                  (True, 26, ("<alt_gr>", "<shift>")), (False, 26, ("<alt_gr>", "<shift>")),
+                                  (False, "<shift>", None), (False, "<alt_gr>", None),
+                                  (True, "<shift>", None),
+                                  (True, 26, ("<shift>",)), (False, 26, ("<shift>",)),
+                                  (False, "<shift>", None)])
+
+    def testReleasedAtEnd(self):
+        self.assertEqual(key_events([(38, 1)], OFFSET_MODIFIERS)[-1], (False, "<shift>", None))
+        self.assertEqual(key_events([], OFFSET_MODIFIERS), [])
@@ -0,0 +1,45 @@
+import unittest
+
+from lib.autokey.latency import *
+
+class HistogramTest(unittest.TestCase):
+
+    def testPercentiles(self):
+        histogram = Histogram()
+        for i in range(1, 101):
+            histogram.add(i / 1000.0)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.percentile(50), 0.050, delta=0.005)
+        self.assertAlmostEqual(histogram.percentile(95), 0.095, delta=0.0095)
+        self.assertEqual(histogram.percentile(100), 0.1)
+
+    def testEmpty(self):
+        self.assertEqual(Histogram().percentile(99), 0.0)
+        self.assertEqual(Histogram().get_serializable(), {"count": 0})
+
+    def testOutOfRange(self):
+        histogram = Histogram()
+        histogram.add(0)
+        histogram.add(1e9)
+        self.assertEqual(histogram.count, 2)
+        self.assertEqual(histogram.percentile(100), 1e9)
+
+class LatencyTrackerTest(unittest.TestCase):
+
+    def testDisabled(self):
+        tracker = LatencyTracker()
+        self.assertIsNone(tracker.stamp())
+        tracker.record(MATCH, tracker.stamp())
+        self.assertEqual(tracker.get_serializable()["stages"][MATCH]["count"], 0)
+
+    def testRecord(self):
+        tracker = LatencyTracker()
+        tracker.enabled = True
+        tracker.record(MATCH, 1.0, 1.002)
+        summary = tracker.get_serializable()["stages"][MATCH]
+        self.assertEqual(summary["count"], 1)
+        self.assertAlmostEqual(summary["p99"], 2.0, delta=0.2)
+
+        tracker.reset()
+        self.assertEqual(tracker.get_serializable()["stages"][MATCH]["count"], 0)
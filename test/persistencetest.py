@@ -0,0 +1,205 @@
+import os, shutil, tempfile, threading, unittest
+from unittest import mock
+
+from lib.autokey.persistence import *
+from lib.autokey.configmanager import ConfigManager, LAZY_CONTENT
+from lib.autokey import model
+
+class AtomicWriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "autokey.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, path):
+        with open(path) as inFile:
+            return inFile.read()
+
+    def testReplace(self):
+        atomic_write(self.path, "old")
+        atomic_write(self.path, "new")
+        self.assertEqual(self.read(self.path), "new")
+        self.assertEqual(os.listdir(self.dir), ["autokey.json"])
+
+    def testFollowsLink(self):
+        target = os.path.join(self.dir, "target.json")
+        atomic_write(target, "old")
+        os.symlink(target, self.path)
+        atomic_write(self.path, "new")
+        self.assertTrue(os.path.islink(self.path))
+        self.assertEqual(self.read(target), "new")
+
+    def testKeepsMode(self):
+        atomic_write(self.path, "old")
+        os.chmod(self.path, 0o600)
+        atomic_write(self.path, "new")
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+        other = os.path.join(self.dir, "other.json")
+        atomic_write(other, "new")
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(os.stat(other).st_mode & 0o777, 0o666 & ~umask)
+
+    def testFailureKeepsOldContents(self):
+        atomic_write(self.path, "old")
+        with self.assertRaises(UnicodeEncodeError):
+            atomic_write(self.path, "€", encoding="ascii")
+        self.assertEqual(self.read(self.path), "old")
+        self.assertEqual(os.listdir(self.dir), ["autokey.json"])
+
+    def testDeferredSync(self):
+        with deferred_sync() as batch:
+            with deferred_sync() as nested:
+                atomic_write(self.path, "nested")
+            self.assertIs(nested, batch)
+            atomic_write(self.path, "outer")
+            self.assertEqual(len(batch), 1)
+        self.assertEqual(self.read(self.path), "outer")
+        self.assertEqual(len(batch), 0)
+
+    def testDeferredSyncFiles(self):
+        other = os.path.join(self.dir, "other.txt")
+        with mock.patch("os.fsync", wraps=os.fsync) as fsync, mock.patch("os.sync") as sync:
+            with deferred_sync() as batch:
+                atomic_write(self.path, "deferred")
+                thread = threading.Thread(target=batch.run, args=(atomic_write, other, "worker"))
+                thread.start()
+                thread.join()
+                self.assertEqual(fsync.call_count, 0)
+
+            # Each file once, and their folder
+            self.assertEqual(fsync.call_count, 3)
+            self.assertEqual(sync.call_count, 0)
+        self.assertEqual(self.read(other), "worker")
+
+    def testDeferredSyncOtherThreads(self):
+        # Writes made by other threads while a block is running are not deferred
+        with mock.patch("os.fsync", wraps=os.fsync) as fsync:
+            with deferred_sync():
+                thread = threading.Thread(target=atomic_write, args=(self.path, "synced"))
+                thread.start()
+                thread.join()
+                self.assertEqual(fsync.call_count, 1)
+
+    def testBackup(self):
+        backupPath = self.path + "~"
+        backup_file(self.path, backupPath)
+        self.assertFalse(os.path.exists(backupPath))
+
+        atomic_write(self.path, "old")
+        backup_file(self.path, backupPath)
+        atomic_write(self.path, "new")
+        self.assertEqual(self.read(backupPath), "old")
+        self.assertEqual(self.read(self.path), "new")
+
+class Target:
+
+    def __init__(self):
+        self.writes = 0
+
+    def persist(self):
+        self.writes += 1
+
+class WriteBehindTest(unittest.TestCase):
+
+    def setUp(self):
+        # Long enough for the background thread never to get there first
+        self.writer = WriteBehind(delay=60)
+
+    def testBatching(self):
+        target = Target()
+        for i in range(5):
+            self.writer.schedule(target)
+        self.assertEqual(len(self.writer), 1)
+        self.assertEqual(target.writes, 0)
+
+        self.writer.flush()
+        self.assertEqual(target.writes, 1)
+        self.writer.flush()
+        self.assertEqual(target.writes, 1)
+
+    def testCancel(self):
+        target = Target()
+        self.writer.schedule(target)
+        self.writer.cancel(target)
+        self.writer.flush()
+        self.assertEqual(target.writes, 0)
+
+    def testFlushTarget(self):
+        target, other = Target(), Target()
+        self.writer.schedule(target)
+        self.writer.schedule(other)
+        self.writer.flush(target)
+        self.writer.flush(target)
+        self.assertEqual((target.writes, other.writes), (1, 0))
+        self.assertEqual(len(self.writer), 1)
+
+class ScheduledPersistTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.writer = WriteBehind(delay=60)
+        patcher = mock.patch.object(model, "WRITE_BEHIND", self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.folder = model.Folder("folder", path=os.path.join(self.dir, "folder"))
+        self.folder.persist()
+        self.phrase = model.Phrase("phrase", "old")
+        self.folder.add_item(self.phrase)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, path):
+        with open(path) as inFile:
+            return inFile.read()
+
+    def testScheduled(self):
+        # A new phrase is written at once, later changes by the write-behind thread
+        self.phrase.schedule_persist()
+        self.assertEqual(self.read(self.phrase.path), "old")
+        self.phrase.phrase = "new"
+        self.phrase.schedule_persist()
+        self.assertEqual(self.read(self.phrase.path), "old")
+
+        self.writer.flush()
+        self.assertEqual(self.read(self.phrase.path), "new")
+
+    def testRename(self):
+        self.phrase.schedule_persist()
+        self.phrase.phrase = "new"
+        self.phrase.schedule_persist()
+        self.phrase.description = "renamed"
+        self.phrase.rebuild_path()
+        self.assertEqual(os.path.basename(self.phrase.path), "renamed.txt")
+        self.assertEqual(self.read(self.phrase.path), "new")
+        self.assertEqual(len(self.writer), 0)
+
+    def testRemove(self):
+        self.phrase.schedule_persist()
+        self.phrase.phrase = "new"
+        self.phrase.schedule_persist()
+        self.phrase.remove_data()
+        self.writer.flush()
+        self.assertEqual(os.listdir(self.folder.path), [".folder.json"])
+
+    def testEditedWhileWriting(self):
+        self.phrase.persist()
+        self.phrase.phrase = "new"
+
+        def edit(path, content):
+            atomic_write(path, content)
+            self.phrase.phrase = "newer"
+
+        with mock.patch.dict(ConfigManager.SETTINGS, {LAZY_CONTENT: True}), \
+                mock.patch.object(model, "atomic_write", edit):
+            self.phrase.persist()
+            self.assertEqual(self.phrase.phrase, "newer")
+
+        self.phrase.persist()
+        self.assertEqual(self.read(self.phrase.path), "newer")
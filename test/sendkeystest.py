@@ -0,0 +1,49 @@
+import unittest
+from unittest import mock
+
+from lib.autokey import interface
+from lib.autokey.configmanager import ConfigManager, ENABLE_QT4_WORKAROUND
+from lib.autokey.keycodepool import KeycodePool
+
+SHIFT = 50
+
+class SendKeysTest(unittest.TestCase):
+
+    def setUp(self):
+        # An interface without a connection, sending to a mocked display
+        self.interface = interface.XInterfaceBase.__new__(interface.XInterfaceBase)
+        self.display = mock.MagicMock()
+        self.focus = self.display.get_input_focus.return_value.focus
+        self.interface.localDisplay = self.display
+        self.interface.rootWindow = mock.MagicMock()
+        self.interface.activeWindow = interface.ActiveWindowTracker()
+        self.interface.modMasks = {"<shift>": 1, "<alt_gr>": 128}
+        self.interface.remappedChars = KeycodePool([])
+        self.interface.lastChars = []
+        self.interface._XInterfaceBase__enableQT4Workaround = False
+        self.interface._XInterfaceBase__keyNameCodes = {"<shift>": SHIFT, "<alt_gr>": 92}
+        charCodes = dict((c, (38 + i, 0)) for i, c in enumerate("abcd"))
+        charCodes.update((c.upper(), (38 + i, 1)) for i, c in enumerate("abcd"))
+        self.interface._XInterfaceBase__charCodes = charCodes
+        # Skips the window title check, and no key repeats to make it pause
+        workaround = ConfigManager.SETTINGS.get(ENABLE_QT4_WORKAROUND, False)
+        ConfigManager.SETTINGS[ENABLE_QT4_WORKAROUND] = True
+        self.addCleanup(ConfigManager.SETTINGS.__setitem__, ENABLE_QT4_WORKAROUND, workaround)
+
+        eventClasses = {interface.X.KeyPress: lambda **kwargs: ("press", kwargs["detail"], kwargs["state"]),
+                        interface.X.KeyRelease: lambda **kwargs: ("release", kwargs["detail"], kwargs["state"])}
+        patcher = mock.patch.object(interface, "KEY_EVENT_CLASSES", eventClasses)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testSendString(self):
+        self.interface._XInterfaceBase__sendString("aBCd")
+        events = [c[0][0] for c in self.focus.send_event.call_args_list]
+        self.assertEqual(events, [("press", 38, 0), ("release", 38, 0),
+                                  ("press", SHIFT, 0),
+                                  ("press", 39, 1), ("release", 39, 1),
+                                  ("press", 40, 1), ("release", 40, 1),
+                                  ("release", SHIFT, 0),
+                                  ("press", 41, 0), ("release", 41, 0)])
+        self.assertEqual(self.display.flush.call_count, 1)
+        self.assertEqual(self.display.get_input_focus.call_count, 1)
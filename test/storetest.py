@@ -0,0 +1,135 @@
+import os, shutil, tempfile, threading, time, unittest
+
+from lib.autokey.storedb import *
+from lib.autokey.scripting_Store import Store
+
+class StoreDatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = StoreDatabase(os.path.join(self.dir, "store.db"))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.dir)
+
+    def testValues(self):
+        self.db.set("/a.py", "key", {"nested": [1, 2]})
+        self.db.set("/a.py", 1, "int key")
+        self.assertEqual(self.db.get("/a.py", "key"), {"nested": [1, 2]})
+        self.assertEqual(self.db.get("/a.py", 1), "int key")
+        self.assertIsNone(self.db.get("/a.py", "1"))
+        self.assertIsNone(self.db.get("/b.py", "key"))
+
+        self.assertTrue(self.db.remove("/a.py", "key"))
+        self.assertFalse(self.db.remove("/a.py", "key"))
+
+    def testExpiry(self):
+        self.db.set("/a.py", "old", 1, ttl=-1)
+        self.db.set("/a.py", "new", 2, ttl=60)
+        self.assertFalse(self.db.contains("/a.py", "old"))
+        self.assertEqual(self.db.get("/a.py", "new"), 2)
+
+    def testDurable(self):
+        self.db.set("/a.py", "key", "value")
+        reopened = StoreDatabase(self.db.path)
+        self.assertEqual(reopened.get("/a.py", "key"), "value")
+        reopened.close()
+
+    def testImportKeepsValues(self):
+        self.db.set("/a.py", "key", "new")
+        self.db.import_values("/a.py", {"key": "old", "other": "old"})
+        self.assertEqual(self.db.get("/a.py", "key"), "new")
+        self.assertEqual(self.db.get("/a.py", "other"), "old")
+
+    def testMove(self):
+        self.db.set("/top/sub/a.py", "key", "a")
+        self.db.set("/top/subway.py", "key", "b")
+        self.db.move("/top/sub", "/top/renamed")
+        self.assertEqual(self.db.get("/top/renamed/a.py", "key"), "a")
+        self.assertEqual(self.db.get("/top/subway.py", "key"), "b")
+
+    def testLocked(self):
+        self.db.set(GLOBAL_NAMESPACE, "count", 0)
+
+        def increment():
+            for i in range(50):
+                with self.db.locked():
+                    count = self.db.get(GLOBAL_NAMESPACE, "count")
+                    time.sleep(0)
+                    self.db.set(GLOBAL_NAMESPACE, "count", count + 1)
+
+        threads = [threading.Thread(target=increment) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.db.get(GLOBAL_NAMESPACE, "count"), 200)
+
+    def testRollback(self):
+        with self.assertRaises(ValueError):
+            with self.db.locked():
+                self.db.set("/a.py", "key", "value")
+                raise ValueError()
+        self.assertIsNone(self.db.get("/a.py", "key"))
+
+class StoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        Store.GLOBALS = {"shared": 1}
+        Store.BACKEND = StoreDatabase(os.path.join(self.dir, "store.db"))
+
+    def tearDown(self):
+        Store.BACKEND.close()
+        Store.BACKEND = None
+        shutil.rmtree(self.dir)
+
+    def testMigration(self):
+        store = Store({"key": "value"})
+        store.namespace = "/a.py"
+        self.assertEqual(store.get_value("key"), "value")
+        self.assertEqual(store.get_serializable(), {})
+        self.assertEqual(Store.BACKEND.get("/a.py", "key"), "value")
+
+        self.assertEqual(store.get_global_value("shared"), 1)
+        self.assertEqual(Store.GLOBALS, {})
+
+    def testMappingAfterMigration(self):
+        store = Store({"key": "value", "other": 2})
+        store.namespace = "/a.py"
+        store.set_value("expired", 3, ttl=-1)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(sorted(store), ["key", "other"])
+        self.assertIn("key", store)
+        self.assertNotIn("expired", store)
+        self.assertEqual(dict(store), {"key": "value", "other": 2})
+        self.assertEqual(sorted(store.values(), key=str), [2, "value"])
+        self.assertEqual(store, {"key": "value", "other": 2})
+        self.assertEqual(store.get_serializable(), {})
+
+        self.assertEqual(store.pop("other"), 2)
+        self.assertEqual(store.pop("other", None), None)
+        self.assertEqual(store.setdefault("key", "new"), "value")
+        store.update({"a": 1}, b=2)
+        self.assertEqual(sorted(store.items()), [("a", 1), ("b", 2), ("key", "value")])
+
+        store.clear()
+        self.assertEqual(len(store), 0)
+        self.assertFalse(store)
+        self.assertIsNone(Store.BACKEND.get("/a.py", "key"))
+
+    def testDictAccess(self):
+        store = Store()
+        store.namespace = "/a.py"
+        store["key"] = "value"
+        self.assertTrue(store.has_key("key"))
+        self.assertEqual(store["key"], "value")
+        store.remove_value("key")
+        with self.assertRaises(KeyError):
+            store["key"]
+
+    def testWithoutNamespace(self):
+        store = Store()
+        store.set_value("key", "value")
+        self.assertEqual(dict(store), {"key": "value"})
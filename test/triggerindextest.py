@@ -0,0 +1,364 @@
+import re, random, unittest, collections
+
+from lib.autokey.triggerindex import *
+
+WORD_CHARS = re.compile(r"[\w]", re.UNICODE)
+
+class Target:
+
+    def __init__(self, name, abbreviations, ignoreCase=False, immediate=False, triggerInside=False):
+        self.name = name
+        self.abbreviations = abbreviations
+        self.ignoreCase = ignoreCase
+        self.immediate = immediate
+        self.triggerInside = triggerInside
+        self.wordChars = WORD_CHARS
+
+    def __repr__(self):
+        return self.name
+
+class AbbreviationIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.brb = Target("brb", ["brb"])
+        self.btw = Target("btw", ["btw", "bytheway"])
+        self.xp = Target("xp", ["XP@"], ignoreCase=True)
+        self.xpLower = Target("xpLower", ["xp@"], ignoreCase=True)
+        self.index = AbbreviationIndex()
+        for target in (self.brb, self.btw, self.xp, self.xpLower):
+            self.index.add(target)
+
+    def testEndPositions(self):
+        self.assertEqual(self.index.candidates("brb"), [self.brb])
+        self.assertEqual(self.index.candidates("hello brb "), [self.brb])
+        self.assertEqual(self.index.candidates("brb  "), [])
+        self.assertEqual(self.index.candidates("by the way bytheway."), [self.btw])
+
+    def testIgnoreCase(self):
+        # ignoreCase abbreviations are matched against the lower-cased buffer
+        self.assertEqual(self.index.candidates("XP@ "), [self.xpLower])
+        self.assertEqual(self.index.candidates("xp@"), [self.xpLower])
+        self.assertEqual(self.index.candidates("BRB "), [])
+
+    def testOrder(self):
+        both = Target("both", ["rb"])
+        self.index.add(both)
+        self.assertEqual(self.index.candidates("brb"), [self.brb, both])
+
+    def testEmpty(self):
+        self.assertEqual(AbbreviationIndex().candidates("anything"), [])
+        self.assertEqual(self.index.candidates(""), [])
+
+    def testLookup(self):
+        both = Target("both", ["rb", "brb"])
+        self.index.add(both)
+        self.assertEqual(self.index.lookup("brb"), [self.brb, both])
+        self.assertEqual(self.index.lookup("rb"), [both])
+        self.assertEqual(self.index.lookup("xp@"), [self.xpLower])
+        self.assertEqual(self.index.lookup("br"), [])
+
+    def testItems(self):
+        copy = self.index.copy()
+        copy.remove(self.brb)
+        self.assertEqual(copy.items(), [(self.btw, ("btw", "bytheway")), (self.xp, ("XP@",)),
+                                        (self.xpLower, ("xp@",))])
+
+    def testCopy(self):
+        copy = self.index.copy()
+        copy.remove(self.brb)
+        self.btw.abbreviations = ["by"]
+        copy.update(self.btw)
+        copy.add(Target("new", ["brb"]))
+
+        # the original is left untouched
+        self.assertEqual(self.index.candidates("brb"), [self.brb])
+        self.assertEqual(self.index.candidates("btw "), [self.btw])
+        self.assertEqual(len(self.index), 4)
+        self.assertIn(self.brb, self.index)
+        self.assertEqual([target.name for target, abbreviations in self.index.items()],
+                         ["brb", "btw", "xp", "xpLower"])
+
+        self.assertEqual([t.name for t in copy.candidates("brb")], ["new"])
+        self.assertEqual(copy.candidates("btw "), [])
+        self.assertEqual(copy.candidates("by "), [self.btw])
+        self.assertEqual(len(copy), 4)
+
+    def testCopyOfCopy(self):
+        # The original can still be changed after being copied
+        copy = self.index.copy()
+        self.index.remove(self.brb)
+        self.assertNotIn(self.brb, self.index)
+        self.assertIn(self.brb, copy)
+        self.assertEqual(copy.candidates("brb"), [self.brb])
+
+    def testUpdateKeepsOrder(self):
+        both = Target("both", ["rb"])
+        self.index.add(both)
+        copy = self.index.copy()
+        self.brb.abbreviations = ["brb", "xrb"]
+        copy.update(self.brb)
+        self.assertEqual(copy.candidates("xrb"), [self.brb, both])
+
+class AbbreviationMatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.brb = Target("brb", ["brb"])
+        self.now = Target("now", ["@now"], immediate=True)
+        self.inside = Target("inside", ["ing"], triggerInside=True)
+        self.index = AbbreviationIndex()
+        for target in (self.brb, self.now, self.inside):
+            self.index.add(target)
+        self.buffer = collections.deque(maxlen=10)
+        self.matcher = AbbreviationMatcher(self.index, 10)
+
+    def type(self, text):
+        results = []
+        for char in text:
+            self.buffer.append(char)
+            results.append(self.matcher.push(self.buffer))
+        return results
+
+    def backspace(self):
+        self.buffer.pop()
+        self.matcher.pop()
+
+    def testTriggerCharacter(self):
+        self.assertEqual(self.type("brb "), [[], [], [], [self.brb]])
+        self.assertEqual(self.type("brbx"), [[], [], [], []])
+
+    def testImmediate(self):
+        self.assertEqual(self.type("@now"), [[], [], [], [self.now]])
+
+    def testWordBoundary(self):
+        self.assertEqual(self.type("xbrb ")[-1], [])
+        self.assertEqual(self.type("sing ")[-1], [self.inside])
+
+    def testBackspace(self):
+        self.type("brbb")
+        self.backspace()
+        self.assertEqual(self.type(" "), [[self.brb]])
+
+    def testRebuild(self):
+        self.type("xx brb")
+        matcher = AbbreviationMatcher(self.index, 10)
+        matcher.rebuild(self.buffer)
+        self.buffer.append(".")
+        self.assertEqual(matcher.push(self.buffer), [self.brb])
+
+    def testBufferOverflow(self):
+        # the oldest states are dropped along with the oldest buffered characters
+        self.type("012345678 " + "brb")
+        self.assertEqual(self.type(" "), [[self.brb]])
+
+class Colliding:
+
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 42
+
+    def __repr__(self):
+        return self.name
+
+class PersistentMapTest(unittest.TestCase):
+
+    def testAgainstDict(self):
+        rng = random.Random(1)
+        colliding = [Colliding(str(i)) for i in range(5)]
+        keys = list(range(300)) + ["key %d" % i for i in range(300)] + colliding
+        persistent, expected = PersistentMap(), {}
+        copies = []
+        for step in range(3000):
+            key = rng.choice(keys)
+            if rng.random() < 0.3:
+                self.assertEqual(persistent.pop(key, None), expected.pop(key, None))
+            else:
+                persistent[key] = expected[key] = step
+            if step % 500 == 0:
+                copies.append((persistent, dict(expected)))
+                persistent = persistent.copy()
+
+        copies.append((persistent, expected))
+        for persistent, expected in copies:
+            self.assertEqual(len(persistent), len(expected))
+            self.assertEqual(dict(persistent.items()), expected)
+            for key in keys:
+                self.assertEqual(persistent.get(key), expected.get(key))
+                self.assertEqual(key in persistent, key in expected)
+
+    def testCopy(self):
+        original = PersistentMap([("a", 1), ("b", 2)])
+        copy = original.copy()
+        copy["a"] = 3
+        del copy["b"]
+        original["c"] = 4
+        self.assertEqual(sorted(original.items()), [("a", 1), ("b", 2), ("c", 4)])
+        self.assertEqual(sorted(copy.items()), [("a", 3)])
+        self.assertEqual(copy.setdefault("a", 5), 3)
+        self.assertRaises(KeyError, copy.pop, "b")
+
+class Hotkey:
+
+    def __init__(self, modifiers, hotKey):
+        self.modifiers = modifiers
+        self.hotKey = hotKey
+
+class HotkeyTableTest(unittest.TestCase):
+
+    def testLookup(self):
+        first = Hotkey(["<ctrl>"], "k")
+        second = Hotkey(["<ctrl>"], "k")
+        other = Hotkey(["<ctrl>", "<shift>"], "k")
+        table = HotkeyTable()
+        for hotkey in (first, second, other, Hotkey([], None)):
+            table.add(hotkey)
+
+        self.assertEqual(len(table), 3)
+        self.assertEqual(list(table.lookup(["<ctrl>"], "k")), [first, second])
+        self.assertEqual(list(table.lookup(["<ctrl>", "<shift>"], "k")), [other])
+        self.assertEqual(list(table.lookup(["<ctrl>"], "j")), [])
+        self.assertEqual(list(table.lookup([], "k")), [])
+        chords = sorted(table.chords(), key=lambda chord: len(chord[0]))
+        self.assertEqual(chords, [(("<ctrl>",), "k", (first, second)), (("<ctrl>", "<shift>"), "k", (other,))])
+
+    def testCopy(self):
+        first = Hotkey(["<ctrl>"], "k")
+        second = Hotkey(["<ctrl>"], "k")
+        table = HotkeyTable()
+        table.add(first)
+        table.add(second)
+
+        copy = table.copy()
+        copy.remove(first)
+        second.hotKey = "j"
+        copy.remove(second)
+        copy.add(second)
+
+        self.assertEqual(list(table.lookup(["<ctrl>"], "k")), [first, second])
+        self.assertEqual(list(copy.lookup(["<ctrl>"], "k")), [])
+        self.assertEqual(list(copy.lookup(["<ctrl>"], "j")), [second])
+        self.assertEqual(len(table), 2)
+        self.assertEqual(len(copy), 1)
+        self.assertIn(first, table)
+        self.assertNotIn(first, copy)
+        self.assertEqual(table.chords(), [(("<ctrl>",), "k", (first, second))])
+
+class Filtered:
+
+    def __init__(self, regex):
+        self.regex = regex
+        self.lookups = 0
+
+    def get_applicable_regex(self):
+        self.lookups += 1
+        return self.regex
+
+class WindowFilterCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = WindowFilterCache(maxWindows=2)
+        self.evaluations = 0
+
+    def evaluate(self, regex, windowInfo):
+        self.evaluations += 1
+        return regex.match(windowInfo[0])
+
+    def testSharedFilter(self):
+        regex = re.compile(".*gedit")
+        items = [Filtered(regex) for i in range(5)]
+        for i in range(3):
+            results = [self.cache.matches(self.cache.applicable_regex(item), ("a - gedit", "gedit.Gedit"), self.evaluate)
+                       for item in items]
+            self.assertEqual(results, [True] * 5)
+
+        self.assertEqual(self.evaluations, 1)
+        self.assertEqual([item.lookups for item in items], [1] * 5)
+
+    def testEviction(self):
+        regex = re.compile("a")
+        for title in ("a", "b", "c", "a"):
+            self.cache.matches(regex, (title, ""), self.evaluate)
+        self.assertEqual(self.evaluations, 4)
+
+        self.cache.matches(regex, ("c", ""), self.evaluate)
+        self.assertEqual(self.evaluations, 4)
+
+    def testInvalidate(self):
+        regex = re.compile("a")
+        item = Filtered(regex)
+        self.cache.matches(self.cache.applicable_regex(item), ("a", ""), self.evaluate)
+        self.cache.invalidate()
+        self.cache.matches(self.cache.applicable_regex(item), ("a", ""), self.evaluate)
+        self.assertEqual(self.evaluations, 2)
+        self.assertEqual(item.lookups, 2)
+
+class Saved:
+
+    def __init__(self, path, name=None, parent=None):
+        self.path = path
+        self.title = self.description = name
+        self.parent = parent
+
+    def get_json_path(self):
+        directory, baseName = self.path.rsplit('/', 1)
+        return "%s/.%s.json" % (directory, baseName[:-4])
+
+class PathIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PathIndex()
+        self.folder = Saved("/data/folder")
+        self.item = Saved("/data/folder/brb.txt")
+        self.index.add_folder(self.folder)
+        self.index.add_item(self.item)
+        self.index.add_item(Saved(None))
+
+    def testLookup(self):
+        self.assertIs(self.index.folder("/data/folder"), self.folder)
+        self.assertIs(self.index.item("/data/folder/brb.txt"), self.item)
+        self.assertIs(self.index.json_owner("/data/folder/.brb.json"), self.item)
+        self.assertIsNone(self.index.item("/data/folder"))
+        self.assertIsNone(self.index.folder("/data/folder/brb.txt"))
+
+    def testRemove(self):
+        self.index.remove(self.item)
+        self.index.remove(self.folder)
+        self.assertIsNone(self.index.item("/data/folder/brb.txt"))
+        self.assertIsNone(self.index.json_owner("/data/folder/.brb.json"))
+        self.assertIsNone(self.index.folder("/data/folder"))
+
+    def testMoved(self):
+        self.item.path = "/data/folder/back.txt"
+        self.index.moved(self.item)
+        self.assertIsNone(self.index.item("/data/folder/brb.txt"))
+        self.assertIsNone(self.index.json_owner("/data/folder/.brb.json"))
+        self.assertIs(self.index.item("/data/folder/back.txt"), self.item)
+        self.assertIs(self.index.json_owner("/data/folder/.back.json"), self.item)
+
+    def testNames(self):
+        top = Saved(None, "Top")
+        sub = Saved(None, "Sub", top)
+        other = Saved(None, "Sub")
+        first = Saved("/data/Sub/brb.txt", "brb", other)
+        second = Saved("/data/Top/Sub/brb.txt", "brb", sub)
+        slashed = Saved("/data/Top/a-b.txt", "a/b", top)
+        for folder in (top, sub, other):
+            self.index.add_folder(folder)
+        for item in (first, second, slashed):
+            self.index.add_item(item)
+
+        self.assertIs(self.index.folder_named("Sub"), sub)
+        self.assertIs(self.index.folder_named("Top/Sub"), sub)
+        self.assertIsNone(self.index.folder_named("Other/Sub"))
+        self.assertIs(self.index.item_named("brb"), first)
+        self.assertIs(self.index.item_named("Top/Sub/brb"), second)
+        self.assertIs(self.index.item_named("Sub/brb"), first)
+        self.assertIs(self.index.item_named("a/b"), slashed)
+        self.assertIs(self.index.item_named("Top/a/b"), slashed)
+        self.assertIsNone(self.index.item_named("brb", PathIndexTest))
+
+        first.description = "back"
+        self.index.moved(first)
+        self.assertIs(self.index.item_named("brb"), second)
+        self.assertIs(self.index.item_named("back"), first)
@@ -0,0 +1,144 @@
+import os, threading, timeit, unittest
+from unittest import mock
+
+from lib.autokey.configmanager import *
+from lib.autokey.conflicts import DUPLICATE, SHADOWED
+
+def make_folder(title, count):
+    folder = Folder(title, path="/data/" + title)
+    for i in range(count):
+        phrase = Phrase("phrase %d" % i, "Text of phrase %d" % i, path="%s/%d.txt" % (folder.path, i))
+        phrase.add_abbreviation("p%d" % i)
+        phrase.set_hotkey(["<ctrl>"], "k%d" % i)
+        phrase.set_modes([TriggerMode.ABBREVIATION, TriggerMode.HOTKEY])
+        folder.add_item(phrase)
+    return folder
+
+class TriggerSnapshotTest(unittest.TestCase):
+
+    def changeCost(self, count):
+        folder = make_folder("folder", count)
+        triggers = TriggerSnapshot([folder])
+        phrase = folder.items[count // 2]
+
+        def change():
+            phrase.abbreviations = ["changed"]
+            changes = ChangeSet(triggers.paths.copy())
+            changes.changed(phrase)
+            triggers.updated(changed=changes.changedTargets, paths=changes.paths)
+
+        return min(timeit.repeat(change, number=20, repeat=5))
+
+    def testChangeCost(self):
+        # Copying the indexes would make the larger configuration about 40 times slower
+        small = self.changeCost(250)
+        large = self.changeCost(10000)
+        self.assertLess(large, small * 4)
+
+    def testReaderIsolation(self):
+        folder = make_folder("folder", 10)
+        triggers = TriggerSnapshot([folder])
+        phrase = folder.items[0]
+
+        # Changes to the folder tree that were not published yet
+        added = Phrase("added", "Not published yet", path=folder.path + "/added.txt")
+        added.add_abbreviation("added")
+        added.set_modes([TriggerMode.ABBREVIATION])
+        folder.add_item(added)
+        phrase.set_modes([])
+        folder.add_folder(Folder("sub", path=folder.path + "/sub"))
+
+        self.assertEqual(len(triggers.allItems), 10)
+        self.assertEqual(triggers.allFolders, (folder,))
+        self.assertNotIn(added, triggers.abbreviations)
+        self.assertIn(phrase, triggers.abbreviations)
+        self.assertIn(phrase, triggers.hotKeys)
+
+        # Nor do snapshots made from this one see them
+        unchanged = triggers.updated()
+        self.assertEqual(set(unchanged.allItems), set(triggers.allItems))
+        self.assertIn(phrase, unchanged.hotKeys)
+
+class PublicationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = make_folder("folder", 10)
+        self.configManager = ConfigManager.__new__(ConfigManager)
+        self.configManager.lock = threading.Lock()
+        self.configManager.app = mock.MagicMock()
+        self.configManager.folders = [self.folder]
+        self.configManager.triggers = TriggerSnapshot([self.folder])
+
+    def testItemAdded(self):
+        before = self.configManager.triggers
+        phrase = Phrase("added", "Added phrase", path=self.folder.path + "/added.txt")
+        phrase.add_abbreviation("added")
+        phrase.set_modes([TriggerMode.ABBREVIATION])
+        self.folder.add_item(phrase)
+        self.configManager.item_added(phrase)
+
+        after = self.configManager.triggers
+        self.assertIsNot(after, before)
+        self.assertIn(phrase, self.configManager.allItems)
+        self.assertIn(phrase, self.configManager.abbreviations)
+        self.assertEqual(after.abbreviationIndex.lookup("added"), [phrase])
+
+        # Readers still holding the old snapshot keep seeing it unchanged
+        self.assertNotIn(phrase, before.allItems)
+        self.assertEqual(before.abbreviationIndex.lookup("added"), [])
+        self.assertEqual(len(before.allItems), 10)
+
+    def testItemChanged(self):
+        before = self.configManager.triggers
+        phrase = self.folder.items[3]
+        phrase.set_modes([TriggerMode.ABBREVIATION])
+        self.configManager.item_changed(phrase)
+
+        self.assertNotIn(phrase, self.configManager.hotKeys)
+        self.assertEqual(len(self.configManager.hotKeys), 9)
+        self.assertIn(phrase, before.hotKeys)
+        self.assertEqual(before.hotkeyTable.lookup(["<ctrl>"], "k3"), (phrase,))
+        self.assertEqual(self.configManager.triggers.hotkeyTable.lookup(["<ctrl>"], "k3"), ())
+
+    def testItemRemoved(self):
+        before = self.configManager.triggers
+        phrase = self.folder.items[5]
+        self.folder.remove_item(phrase)
+        self.configManager.item_removed(phrase)
+
+        self.assertNotIn(phrase, self.configManager.allItems)
+        self.assertIn(phrase, before.allItems)
+        self.assertIs(self.configManager.find_item("phrase 5"), None)
+
+class PathsChangedTest(unittest.TestCase):
+
+    def testIgnoredPaths(self):
+        configManager = ConfigManager.__new__(ConfigManager)
+        configManager.lock = mock.MagicMock()
+        events = [(os.path.join(CONFIG_DIR, name), False) for name in ("store.db", "store.db-wal", "autokey.log")]
+        self.assertFalse(configManager.paths_changed(events))
+        self.assertFalse(configManager.lock.acquire.called)
+
+class CheckConflictsTest(unittest.TestCase):
+
+    def testUnsavedSettings(self):
+        folder = make_folder("folder", 5)
+        configManager = ConfigManager.__new__(ConfigManager)
+        configManager.triggers = TriggerSnapshot([folder])
+        phrase = folder.items[0]
+
+        def save(item):
+            item.modes.append(TriggerMode.ABBREVIATION)
+            item.abbreviations = ["p1", "p"]
+            item.immediate = True
+
+        conflicts = configManager.check_conflicts(phrase, save)
+        self.assertEqual(sorted((c.kind, c.target.description, c.trigger, c.other.description) for c in conflicts),
+                         [(DUPLICATE, "phrase 0", "p1", "phrase 1")] +
+                         [(SHADOWED, "phrase %d" % i, "p%d" % i, "phrase 0") for i in range(1, 5)])
+        self.assertTrue(all(c.target is not phrase and c.other is not phrase for c in conflicts))
+
+        # The item itself is left alone
+        self.assertEqual(phrase.abbreviations, ["p0"])
+        self.assertFalse(phrase.immediate)
+        self.assertEqual(configManager.check_conflicts(phrase), [])
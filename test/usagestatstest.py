@@ -0,0 +1,74 @@
+import os, shutil, tempfile, unittest
+
+from lib.autokey.usagestats import *
+
+class UsageStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "usage.log")
+        self.stats = UsageStats()
+        self.stats.open(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def reopen(self, stats=None):
+        (stats or self.stats).persist()
+        reopened = UsageStats()
+        reopened.open(self.path)
+        return reopened
+
+    def testCounts(self):
+        self.stats.record("/data/top/sub/brb.txt", 10, timestamp=100)
+        self.stats.record("/data/top/sub/brb.txt", 10, timestamp=200)
+        self.stats.record("/data/top/script.py", timestamp=150)
+
+        for stats in (self.stats, self.reopen()):
+            self.assertEqual(stats.uses("/data/top/sub/brb.txt"), 2)
+            self.assertEqual(stats.saved("/data/top/sub/brb.txt"), 20)
+            self.assertEqual(stats.last_used("/data/top/sub/brb.txt"), 200)
+            self.assertEqual(stats.folder_uses("/data/top/sub"), 2)
+            self.assertEqual(stats.folder_uses("/data/top"), 3)
+            self.assertEqual(stats.total_saved(), 20)
+            self.assertEqual(stats.uses("/data/top/other.txt"), 0)
+
+    def testMoved(self):
+        self.stats.record("/data/top/sub/brb.txt", timestamp=100)
+        self.stats.moved("/data/top/sub", "/data/top/renamed")
+
+        for stats in (self.stats, self.reopen()):
+            self.assertEqual(stats.uses("/data/top/sub/brb.txt"), 0)
+            self.assertEqual(stats.uses("/data/top/renamed/brb.txt"), 1)
+            self.assertEqual(stats.folder_uses("/data/top/sub"), 0)
+            self.assertEqual(stats.folder_uses("/data/top/renamed"), 1)
+
+    def testCompact(self):
+        self.stats.compactAfter = 10
+        for i in range(20):
+            self.stats.record("/data/top/brb.txt", 1, timestamp=i)
+        self.stats.persist()
+
+        with open(self.path) as inFile:
+            self.assertEqual(len(inFile.readlines()), 1)
+        stats = self.reopen()
+        self.assertEqual(stats.uses("/data/top/brb.txt"), 20)
+        self.assertEqual(stats.last_used("/data/top/brb.txt"), 19)
+
+    def testDamagedLine(self):
+        self.stats.record("/data/top/brb.txt", timestamp=100)
+        self.stats.persist()
+        with open(self.path, 'a') as outFile:
+            outFile.write('["use", 200, 0, "/data/to')
+
+        stats = UsageStats()
+        stats.open(self.path)
+        stats.record("/data/top/brb.txt", timestamp=300)
+        self.assertEqual(self.reopen(stats).uses("/data/top/brb.txt"), 2)
+
+    def testNotOpened(self):
+        stats = UsageStats()
+        stats.record("/data/top/brb.txt")
+        stats.persist()
+        self.assertEqual(stats.uses("/data/top/brb.txt"), 1)
+        self.assertFalse(os.path.exists(self.path))
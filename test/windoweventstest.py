@@ -0,0 +1,72 @@
+import unittest, types
+from unittest import mock
+
+from lib.autokey import interface
+
+NAME_ATOM = 1
+ACTIVE_WINDOW_ATOM = 2
+
+class ConnectionClosedError(Exception):
+    pass
+
+class WindowEventsTest(unittest.TestCase):
+
+    def setUp(self):
+        # An interface without a connection, reading events from a mocked display
+        self.interface = interface.XInterfaceBase.__new__(interface.XInterfaceBase)
+        self.display = mock.MagicMock()
+        self.interface.localDisplay = self.display
+        self.interface.windowInfo = mock.MagicMock()
+        self.interface.activeWindow = mock.MagicMock()
+        self.interface.shutdown = True
+        self.interface._XInterfaceBase__windowInfoAtoms = (NAME_ATOM,)
+        self.interface._XInterfaceBase__ActiveWindowAtom = ACTIVE_WINDOW_ATOM
+        self.enqueued = []
+        self.interface._XInterfaceBase__enqueue = lambda method, *args: self.enqueued.append(method)
+
+        patcher = mock.patch.object(interface.select, "select")
+        self.select = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(interface, "error", types.SimpleNamespace(ConnectionClosedError=ConnectionClosedError))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def propertyNotify(self, windowId, atom):
+        return types.SimpleNamespace(type=interface.X.PropertyNotify, window=types.SimpleNamespace(id=windowId), atom=atom)
+
+    def testQueuedEvents(self):
+        # Events already read by Xlib are handled without waiting for the socket
+        self.display.pending_events.return_value = 1
+        self.display.next_event.return_value = self.propertyNotify(42, NAME_ATOM)
+        self.interface._XInterfaceBase__flushEvents()
+
+        self.assertEqual(self.select.call_count, 0)
+        self.interface.windowInfo.invalidate.assert_called_once_with(42)
+        self.interface.activeWindow.info_changed.assert_called_once_with()
+
+    def testWaitForEvents(self):
+        self.display.pending_events.side_effect = [0, 2]
+        self.display.next_event.side_effect = [self.propertyNotify(42, NAME_ATOM),
+                                               self.propertyNotify(1, ACTIVE_WINDOW_ATOM)]
+        self.interface._XInterfaceBase__flushEvents()
+
+        self.assertEqual(self.select.call_count, 1)
+        self.assertEqual(self.display.next_event.call_count, 2)
+        self.interface.activeWindow.reset.assert_called_once_with()
+        self.assertEqual(len(self.enqueued), 1)
+
+    def testErrorsLogged(self):
+        self.display.pending_events.side_effect = [ValueError("bad event"), 0, 0]
+        with self.assertLogs("interface", "ERROR") as logs:
+            self.interface._XInterfaceBase__flushEvents()
+
+        self.assertIn("ValueError: bad event", logs.output[0])
+        self.assertEqual(self.display.pending_events.call_count, 3)
+
+    def testConnectionClosed(self):
+        self.interface.shutdown = False
+        self.display.pending_events.side_effect = ConnectionClosedError()
+        with self.assertLogs("interface", "ERROR"):
+            self.interface._XInterfaceBase__flushEvents()
+
+        self.assertEqual(self.display.pending_events.call_count, 1)
@@ -0,0 +1,96 @@
+import threading, unittest
+
+from lib.autokey.windowinfo import *
+
+class WindowInfoCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = WindowInfoCache(maxWindows=3)
+
+    def testGetPut(self):
+        self.assertIsNone(self.cache.get(1))
+        self.assertTrue(self.cache.put(1, ("Title", "app.App"), [1, 2], self.cache.begin()))
+        self.assertEqual(self.cache.get(1), ("Title", "app.App"))
+        self.assertEqual(len(self.cache), 1)
+
+    def testInvalidateSource(self):
+        # Title read from the frame window 2 of client window 1
+        self.cache.put(1, ("Title", "app.App"), [2], self.cache.begin())
+        self.cache.put(3, ("Other", "other.Other"), [3], self.cache.begin())
+        self.cache.invalidate(2)
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(self.cache.get(3), ("Other", "other.Other"))
+
+        self.cache.invalidate(3)
+        self.assertEqual(len(self.cache), 0)
+
+    def testStaleToken(self):
+        token = self.cache.begin()
+        self.cache.invalidate(1)
+        self.assertFalse(self.cache.put(1, ("Old title", "app.App"), [1], token))
+        self.assertIsNone(self.cache.get(1))
+
+    def testEviction(self):
+        for windowId in range(1, 4):
+            self.cache.put(windowId, (str(windowId), ""), [], self.cache.begin())
+        self.cache.get(1)
+        self.cache.put(4, ("4", ""), [], self.cache.begin())
+        self.assertIsNone(self.cache.get(2))
+        self.assertEqual(self.cache.get(1), ("1", ""))
+        self.assertEqual(len(self.cache), 3)
+
+    def testClear(self):
+        token = self.cache.begin()
+        self.cache.put(1, ("Title", "app.App"), [1], token)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get(1))
+        self.assertFalse(self.cache.put(1, ("Title", "app.App"), [1], token))
+
+class ActiveWindowTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = ActiveWindowTracker()
+        self.notified = []
+        self.tracker.subscribe(self.listener)
+
+    def listener(self):
+        self.notified.append(self.tracker.window)
+
+    def testSetWindow(self):
+        self.assertIsNone(self.tracker.window)
+        self.assertTrue(self.tracker.set_window("editor", 1, self.tracker.begin()))
+        self.assertEqual(self.tracker.window, "editor")
+        self.assertEqual(self.notified, ["editor"])
+
+        # Same window after a reset is no focus change
+        self.tracker.reset()
+        self.assertIsNone(self.tracker.window)
+        self.tracker.set_window("editor", 1, self.tracker.begin())
+        self.assertEqual(self.notified, ["editor"])
+
+        self.tracker.set_window("terminal", 2, self.tracker.begin())
+        self.assertEqual(self.notified, ["editor", "terminal"])
+
+    def testStaleToken(self):
+        token = self.tracker.begin()
+        self.tracker.reset()
+        self.assertFalse(self.tracker.set_window("editor", 1, token))
+        self.assertIsNone(self.tracker.window)
+        self.assertEqual(self.notified, [])
+
+    def testUnsubscribe(self):
+        self.tracker.unsubscribe(self.listener)
+        self.tracker.set_window("editor", 1, self.tracker.begin())
+        self.assertEqual(self.notified, [])
+
+    def testWait(self):
+        changes = self.tracker.changes
+        self.assertEqual(self.tracker.wait(changes, 0.01), changes)
+
+        timer = threading.Timer(0.01, self.tracker.set_window, ("editor", 1, self.tracker.begin()))
+        timer.start()
+        self.assertEqual(self.tracker.wait(changes, 5), changes + 1)
+        timer.join()
+
+        self.tracker.info_changed()
+        self.assertEqual(self.tracker.wait(changes + 1, 0), changes + 2)